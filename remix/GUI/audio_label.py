@@ -6,6 +6,19 @@ from PyQt5.uic import loadUi
 from remix.audio import *
 from channel_widget import modify_text
 
+_pixmaps = dict()  # {thumbnail path: QPixmap}, so every thumbnail is read from disk once
+
+
+def get_pixmap(path):
+    """
+    A function to get the pixmap of a thumbnail from the in-memory cache
+    :param path: the path to the thumbnail
+    :return: a QPixmap object
+    """
+    if path not in _pixmaps:
+        _pixmaps[path] = QPixmap(path)
+    return _pixmaps[path]
+
 
 class AudioLabel(QWidget):
     """
@@ -44,7 +57,7 @@ class AudioLabel(QWidget):
         self.thumbLabel.setFont(font)
         self.thumbLabel.setAlignment(Qt.AlignmentFlag.AlignCenter)
         if self.af.get_thumb_path():
-            self.thumbLabel.setPixmap(QPixmap(self.af.get_thumb_path()))
+            self.thumbLabel.setPixmap(get_pixmap(self.af.get_thumb_path()))
         else:
             txt = modify_text(self.af.get_title())
             self.thumbLabel.setText("\n" + txt)
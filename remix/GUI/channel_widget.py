@@ -155,7 +155,8 @@ class ChannelWidget(QWidget):
                     self.set = 0
                     break
                 elif self.set == 1:
-                    self.player.play()
+                    if self.get_elapsed_ms() >= self.af.get_offset() * 1000:  # the audio starts at its offset
+                        self.player.play()
                     # if int(tim1.microsecond / 1000) - int(tim.microsecond / 1000) >= 1 or \
                     #         int(tim.microsecond / 1000) - int(tim1.microsecond / 1000) >= 1:
                     #     tim = datetime.datetime.now()
@@ -176,6 +177,13 @@ class ChannelWidget(QWidget):
                         self.posLabel.setText(str(self.count_hour).zfill(1) + ":" + str(self.count_min).zfill(2) + ":" +
                                               str(self.count_sec).zfill(2) + ":" + str(self.count_ms).zfill(3))
 
+    def get_elapsed_ms(self):
+        """
+        A method to get the time elapsed on the playback stopwatch
+        :return: the time in milliseconds
+        """
+        return ((self.count_hour * 60 + self.count_min) * 60 + self.count_sec) * 1000 + self.count_ms
+
     def stop_player(self):
         """
         A method to stop the playback and reset all time values
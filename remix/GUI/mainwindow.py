@@ -3,6 +3,9 @@ from pathlib import Path
 
 from remix.manager import Manager
 from remix.tools import Tools
+from remix.envelope import CURVES
+from remix.scheduler import Scheduler
+from concurrent.futures import CancelledError
 from channel_widget import *
 from audio_label import *
 from line_edit_widgets import *
@@ -11,7 +14,7 @@ from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QLa
     QListWidget, QListWidgetItem, QScrollBar, QInputDialog, QGridLayout, QFileDialog, QMessageBox, QAction, \
     QListView, QRadioButton, QButtonGroup, QDialog, QGroupBox
 from PyQt5.QtGui import QIcon, QPixmap, QFont
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QTimer
 
 
 class MainWindow:
@@ -26,6 +29,7 @@ class MainWindow:
         self.QListWidgetRight = None  # QListWidget
         self.selected_audiofiles = []  # list of audiofiles to apply editing to
         self.central_widget = None
+        self.futures = []  # futures of the operations running in the background
         self.manager = Manager.get_instance()
         self.window = QMainWindow()
         self.set_window()
@@ -212,6 +216,21 @@ class MainWindow:
         self.diag.setLayout(vbox)
         self.diag.exec()
 
+    def load_project_dialog(self):
+        """
+        A method to open a project saved on disk
+        :return: None
+        """
+        try:
+            path = QFileDialog.getExistingDirectory(self.window, 'Select project directory', str(Path.home()))
+            if path:
+                pr = self.manager.load_project(path)
+                self.window.setWindowTitle("Music Remixes and Mashups - " + pr.get_name())
+                self.sb.showMessage("Working on project " + pr.get_name())
+                self.create_central_widget()
+        except Exception as e:
+            self.create_messagebox(e, "Failed Opening remix")
+
     def select_project(self, btn):
         """
         A method to select a project from a list
@@ -299,9 +318,25 @@ class MainWindow:
                 orig = pr.add_original(str(path))
                 self.add_audiofile_to_side_menu(orig)
                 self.add_channel_modifier_to_mixing_menu(orig)
+                future = pr.get_thumbnail_future(orig)
+                if future is not None:
+                    self.watch_future(future, lambda thumb: self.refresh_label(orig), "Thumbnail download failed")
         except Exception as e:
             self.create_messagebox(e, "Download failed")
 
+    def refresh_label(self, af: AudioFile):
+        """
+        A method to redraw the AudioLabel of an audio file in the side menu, e.g. once its thumbnail is ready
+        :param af: the audio file
+        :return: None
+        """
+        for i in range(self.QListWidgetLeft.count()):
+            item = self.QListWidgetLeft.item(i)
+            widget = self.QListWidgetLeft.itemWidget(item)
+            if widget.af == af:
+                widget.set_label()
+                break
+
     def import_audio_local_dialog(self):
         """
         A method to import an audio file from local
@@ -375,8 +410,8 @@ class MainWindow:
 
     def remove_audio(self):
         """
-        A method to remove an audio from the current project (the audio will be only visually removed,
-        but it is still saved in the working directory)
+        A method to remove an audio from the current project (its file is deleted from the working directory
+        unless another audio file uses it)
         :return: None
         """
         try:
@@ -419,41 +454,116 @@ class MainWindow:
             pr = self.manager.get_current_project()
             if pr is None:
                 raise Exception("You must create a project first")
-            if len(self.selected_audiofiles) != 1:
-                raise Exception("Export a single file at a time.\nPlease select one file")
+            if not self.selected_audiofiles:
+                raise Exception("Please select the files to export")
 
             formats = ['*.mp3', '*.mp4', '*.wav', '*.m4a']
             wid = LineEditComboBoxWidget("Export audio", "Please insert a path to a valid folder and\nchoose a format",
                                          "Path:", "Format:", formats)
             if not wid.cancel:
-                Tools.export(self.selected_audiofiles[0], wid.line1, wid.line2)
+                if len(self.selected_audiofiles) == 1:
+                    Tools.export(self.selected_audiofiles[0], wid.line1, wid.line2)
+                else:
+                    future = Scheduler.get_instance().submit(Tools.export_batch, list(self.selected_audiofiles),
+                                                             wid.line1, [wid.line2], name="Exporting")
+                    self.watch_future(future, lambda paths: None, "Failed Exporting Audio")
+                self.uncheck_audio()
+        except Exception as e:
+            self.create_messagebox(e, "Failed Exporting Audio")
+
+    def choose_stems_dialog(self, triggered_function):
+        """
+        A method to open a dialog to choose into how many stems an audio file is separated
+        :param triggered_function: the function triggered by selecting the number of stems
+        :return: None
+        """
+        self.diag = QDialog()
+        self.diag.setWindowTitle("Choose stems to separate audio")
+        vbox = QVBoxLayout()
+        pr_group = QButtonGroup()  # alternatively, use QGroupBox
+        split_options = {2: "Vocals, accompaniment", 4: "Vocals, drums, bass, others",
+                         5: "Vocals, drums, bass, piano, others"}
+        for num in split_options:
+            btn = QRadioButton(str(num) + ': ' + split_options[num])  # QRadioButton(btn_text)
+            btn.setStyleSheet("QRadioButton{font: 12pt Helvetica MS;}, QRadioButton::indicator { width: 15px; "
+                              "height: 15px;};")
+            pr_group.addButton(btn)  # name is the btn id in the group
+            vbox.addWidget(btn)
+        pr_group.buttonClicked.connect(triggered_function)
+        self.diag.setLayout(vbox)
+        self.diag.exec()
+
+    def batch_export_dialog(self):
+        """
+        A method to export the selected audio files to several formats at once
+        :return: None
+        """
+        try:
+            pr = self.manager.get_current_project()
+            if pr is None:
+                raise Exception("You must create a project first")
+            if not self.selected_audiofiles:
+                raise Exception("Please select the files to export")
+            path = QFileDialog.getExistingDirectory(self.window, 'Select directory', str(Path.home()))
+            if not path:
+                return
+            diag = QInputDialog()
+            formats, ok = diag.getText(self.window, 'Export formats', 'Formats, separated by commas '
+                                                                      '(mp3, mp4, wav, m4a):', text="wav, mp3")
+            if ok:
+                formats = [format.strip().lstrip("*.") for format in formats.split(",") if format.strip()]
+                paths = Tools.export_batch(list(self.selected_audiofiles), path, formats)
                 self.uncheck_audio()
+                self.create_messagebox(str(len(paths)) + " files were exported to " + path, "Export Done")
         except Exception as e:
             self.create_messagebox(e, "Failed Exporting Audio")
 
+    def add_to_arrangement_dialog(self):
+        """
+        A method to place the selected audio files on the bar/beat grid of the arrangement
+        :return: None
+        """
+        try:
+            pr = self.manager.get_current_project()
+            if pr is None:
+                raise Exception("You must create a project first")
+            if not self.selected_audiofiles:
+                raise Exception("Please select the files to place on the arrangement")
+            diag = QInputDialog()
+            bar, ok = diag.getInt(self.window, 'Add to arrangement', 'Starting bar:', 1, 1)
+            if ok:
+                loops, ok = diag.getInt(self.window, 'Add to arrangement', 'Number of repetitions:', 1, 1)
+            if ok:
+                for af in self.selected_audiofiles:
+                    pr.add_clip(af, bar - 1, loops=loops)
+                self.sb.showMessage("The arrangement spans " + str(pr.get_num_of_bars()) + " bars")
+                self.uncheck_audio()
+        except Exception as e:
+            self.create_messagebox(e, "Failed Arranging Audio")
+
+    def render_final_mix(self):
+        """
+        A method to render the arrangement into the final mix in the background
+        :return: None
+        """
+        try:
+            pr = self.manager.get_current_project()
+            if pr is None:
+                raise Exception("You must create a project first")
+            future = pr.submit("render_final_mix")
+            self.watch_future(future, self.add_channel_modifier_to_mixing_menu, "Failed Rendering the Mix")
+        except Exception as e:
+            self.create_messagebox(e, "Failed Rendering the Mix")
+
     def split_audio_dialog(self):
         """
         A method to separate an audio file into 2, 4, or 5 stems
         :return: None
         """
         try:
-            if len(self.selected_audiofiles) != 1:
-                raise Exception("One file must be selected to be separated at a time.\nPlease select one file")
-            self.diag = QDialog()
-            self.diag.setWindowTitle("Choose stems to separate audio")
-            vbox = QVBoxLayout()
-            pr_group = QButtonGroup()  # alternatively, use QGroupBox
-            split_options = {2: "Vocals, accompaniment", 4: "Vocals, drums, bass, others",
-                             5: "Vocals, drums, bass, piano, others"}
-            for num in split_options:
-                btn = QRadioButton(str(num) + ': ' + split_options[num])  # QRadioButton(btn_text)
-                btn.setStyleSheet("QRadioButton{font: 12pt Helvetica MS;}, QRadioButton::indicator { width: 15px; "
-                                  "height: 15px;};")
-                pr_group.addButton(btn)  # name is the btn id in the group
-                vbox.addWidget(btn)
-            pr_group.buttonClicked.connect(self.split_audio)
-            self.diag.setLayout(vbox)
-            self.diag.exec()
+            if not self.selected_audiofiles:
+                raise Exception("Please select the files to separate")
+            self.choose_stems_dialog(self.split_audio)
         except Exception as e:
             self.create_messagebox(e, "Failed Separating Audio into Stems")
 
@@ -466,12 +576,158 @@ class MainWindow:
         self.diag.close()
         num = btn.text()
         pr = self.manager.get_current_project()
-        audios = pr.split(self.selected_audiofiles[0], int(num[0]))
+        if len(self.selected_audiofiles) == 1:
+            audios = pr.split(self.selected_audiofiles[0], int(num[0]))
+            self.add_stems(audios)
+        else:
+            lst = list(self.selected_audiofiles)
+            for af, future in zip(lst, pr.submit_batch("separate", lst, int(num[0]))):
+                # the stems are added to the project here, on the GUI thread, once separated
+                self.watch_future(future, lambda audios, af=af: self.add_stems(audios, pr, af),
+                                  "Failed Separating Audio into Stems")
+            self.uncheck_audio()
+
+    def add_stems(self, audios, pr=None, af=None):
+        """
+        A method to add the stems of a separation to the mixing menu
+        :param audios: the list of stems
+        :param pr: the project to add the stems to, if they were separated in the background
+        :param af: the separated audio file
+        :return: None
+        """
+        if pr is not None:
+            pr.add_stems(af, audios)
         for audio in audios:
             self.add_channel_modifier_to_mixing_menu(audio)
             self.rename_item(audio, audio.get_title())
         self.uncheck_audio()
 
+    def preview_split_dialog(self):
+        """
+        A method to separate 30 seconds of an audio file around a given time, to hear how it separates
+        :return: None
+        """
+        try:
+            pr = self.manager.get_current_project()
+            if pr is None:
+                raise Exception("You must create a project first")
+            if len(self.selected_audiofiles) != 1:
+                raise Exception("One file must be selected to be separated at a time.\nPlease select one file")
+            wid = ThreeLineEditWidget("Preview stems", "30 seconds of the audio will be\nseparated around the "
+                                                       "selected time:")
+            if not wid.cancel:
+                self.preview_secs = wid.line1 * 60 + wid.line2 + (wid.line3 / 1000)
+                self.choose_stems_dialog(self.preview_split)
+        except Exception as e:
+            self.create_messagebox(e, "Failed Previewing Stems")
+
+    def preview_split(self, btn):
+        """
+        A method to show the preview stems of an audio file and offer to separate the whole audio
+        :param btn: the button selected that represents the number of stems
+        :return: None
+        """
+        try:
+            self.diag.close()
+            stems = int(btn.text()[0])
+            af = self.selected_audiofiles[0]
+            pr = self.manager.get_current_project()
+            previews = pr.split_preview(af, stems, self.preview_secs)
+            for preview in previews:
+                self.add_channel_modifier_to_mixing_menu(preview)
+                self.rename_item(preview, preview.get_title())
+            self.uncheck_audio()
+
+            confirm_msg = QMessageBox()
+            confirm_msg.setIcon(QMessageBox.Question)
+            confirm_msg.setWindowTitle("Separate to stems")
+            confirm_msg.setText("Should the whole audio be separated?")
+            confirm_msg.setInformativeText("The separation runs in the background")
+            confirm_msg.setStandardButtons(QMessageBox.Yes | QMessageBox.No)
+            if confirm_msg.exec() == QMessageBox.Yes:
+                future = pr.commit_split(af, stems)
+                self.watch_future(future, lambda audios: self.replace_previews(pr, af, previews, audios),
+                                  "Failed Separating Audio into Stems")
+            else:
+                for preview in previews:
+                    self.remove_item(preview)
+                pr.discard_previews(previews)
+        except Exception as e:
+            self.create_messagebox(e, "Failed Previewing Stems")
+
+    def replace_previews(self, pr, af, previews, audios):
+        """
+        A method to add the full stems of an audio file to its project, on the GUI thread, and replace its preview
+        stems with them in the mixing menu
+        :param pr: the project of the audio file
+        :param af: the separated audio file
+        :param previews: the list of preview stems
+        :param audios: the list of stems
+        :return: None
+        """
+        for preview in previews:
+            self.remove_item(preview)
+        pr.discard_previews(previews)
+        self.add_stems(audios, pr, af)
+
+    def watch_future(self, future, callback, error_msg):
+        """
+        A method to call a function on the GUI thread once an operation running in the background is done
+        :param future: the future of the operation
+        :param callback: the function to call with the result of the operation
+        :param error_msg: the title of the message box shown if the operation failed
+        :return: None
+        """
+        timer = QTimer(self.window)
+        self.futures.append(future)
+
+        def check():
+            if future.done():
+                timer.stop()
+                self.futures.remove(future)
+                self.sb.showMessage("ready to remix")
+                if future.cancelled():
+                    return
+                try:
+                    callback(future.result())
+                except CancelledError:
+                    pass
+                except Exception as e:
+                    self.create_messagebox(e, error_msg)
+            else:
+                job = Scheduler.get_instance().get_job(future)
+                if job is not None:
+                    fraction, message = job.get_progress()
+                    self.sb.showMessage((message or job.get_name()) + " " + str(int(fraction * 100)) + "%")
+
+        timer.timeout.connect(check)
+        timer.start(500)
+
+    def run_batch(self, operation, *args, error_msg):
+        """
+        A method to apply a project operation to the selected audio files, in parallel when several are selected,
+        and add its results to the mixing menu
+        :param operation: the name of the project operation, e.g. "fade"
+        :param args: the parameters of the operation, after the audio file
+        :param error_msg: the title of the message box shown if the operation failed
+        :return: None
+        """
+        pr = self.manager.get_current_project()
+        if len(self.selected_audiofiles) == 1:
+            self.add_channel_modifier_to_mixing_menu(getattr(pr, operation)(self.selected_audiofiles[0], *args))
+        else:
+            for future in pr.submit_batch(operation, list(self.selected_audiofiles), *args):
+                self.watch_future(future, self.add_channel_modifier_to_mixing_menu, error_msg)
+        self.uncheck_audio()
+
+    def cancel_jobs(self):
+        """
+        A method to cancel the operations running in the background
+        :return: None
+        """
+        for future in self.futures:
+            Scheduler.get_instance().cancel(future)
+
     def merge_audio_dialog(self):
         """
         A method to overlay audio files and ask if BPM must be averaged
@@ -521,8 +777,8 @@ class MainWindow:
             pr = self.manager.get_current_project()
             if pr is None:
                 raise Exception("You must create a project first")
-            if len(self.selected_audiofiles) != 1:
-                raise Exception("A single file can be trimmed at a time.\nPlease select one file")
+            if not self.selected_audiofiles:
+                raise Exception("Please select the files to trim")
 
             wid = SixLineEditWidget("Trim audio", "Please select valid times to trim the audio\n(milliseconds are opt"
                                                   "ional).\nIf end times correspond to end of audio,\nleave it blank")
@@ -531,10 +787,8 @@ class MainWindow:
                     end_sec = None
                 else:
                     end_sec = wid.end_sec + (wid.end_ms / 1000)
-                trimmed = pr.trim(self.selected_audiofiles[0], wid.start_min, wid.start_sec + (wid.start_ms / 1000),
-                                  wid.end_min, end_sec)
-                self.add_channel_modifier_to_mixing_menu(trimmed)
-                self.uncheck_audio()
+                self.run_batch("trim", wid.start_min, wid.start_sec + (wid.start_ms / 1000), wid.end_min, end_sec,
+                               error_msg="Failed Trimming Audio")
         except Exception as e:
             self.create_messagebox(e, "Failed Trimming Audio")
 
@@ -617,14 +871,15 @@ class MainWindow:
             pr = self.manager.get_current_project()
             if pr is None:
                 raise Exception("You must create a project first")
-            if len(self.selected_audiofiles) != 1:
-                raise Exception("Fade a single file at a time.\nPlease select one file")
+            if not self.selected_audiofiles:
+                raise Exception("Please select the files to fade")
 
             wid = TwoLineEditWidget("Fade", "For how long fading should last?")
             if not wid.cancel:
-                faded = pr.fade(self.selected_audiofiles[0], wid.line1, wid.line2)
-                self.add_channel_modifier_to_mixing_menu(faded)
-                self.uncheck_audio()
+                shape, ok = QInputDialog().getItem(self.window, 'Fade', 'Fading curve:', CURVES, 0, False)
+                if not ok:
+                    return
+                self.run_batch("fade", wid.line1, wid.line2, shape, error_msg="Failed Fading Audio")
         except Exception as e:
             self.create_messagebox(e, "Failed Splitting Audio")
 
@@ -642,7 +897,9 @@ class MainWindow:
             diag = QInputDialog()
             secs, ok = diag.getText(self.window, 'Fade In', 'How many seconds fading should last?')
             if ok:
-                faded = pr.fadein(self.selected_audiofiles[0], int(secs))
+                shape, ok = diag.getItem(self.window, 'Fade In', 'Fading curve:', CURVES, 0, False)
+            if ok:
+                faded = pr.fadein(self.selected_audiofiles[0], int(secs), shape)
                 self.add_channel_modifier_to_mixing_menu(faded)
                 self.uncheck_audio()
         except Exception as e:
@@ -662,7 +919,9 @@ class MainWindow:
             diag = QInputDialog()
             secs, ok = diag.getText(self.window, 'Fade Out', 'How many seconds fading should last?')
             if ok:
-                faded = pr.fadeout(self.selected_audiofiles[0], int(secs))
+                shape, ok = diag.getItem(self.window, 'Fade Out', 'Fading curve:', CURVES, 0, False)
+            if ok:
+                faded = pr.fadeout(self.selected_audiofiles[0], int(secs), shape)
                 self.add_channel_modifier_to_mixing_menu(faded)
                 self.uncheck_audio()
         except Exception as e:
@@ -699,10 +958,17 @@ class MainWindow:
             pr = self.manager.get_current_project()
             if pr is None:
                 raise Exception("You must create a project first")
-            if len(self.selected_audiofiles) != 1:
-                raise Exception("Bpm can be detected to a single file at a time.\nPlease select one file")
-            bpm = Tools.bpm_detector(self.selected_audiofiles[0].get_track())
-            self.create_messagebox("The audio bpm is " + str(bpm), "Audio BPM")
+            if not self.selected_audiofiles:
+                raise Exception("Please select the files to detect the bpm of")
+            if len(self.selected_audiofiles) == 1:
+                bpm = pr.detect_bpm(self.selected_audiofiles[0])
+                self.create_messagebox("The audio bpm is " + str(bpm), "Audio BPM")
+            else:
+                audios = list(self.selected_audiofiles)
+                future = pr.submit("detect_bpm_batch", audios)
+                self.watch_future(future, lambda bpms: self.create_messagebox(
+                    "\n".join(af.get_title() + ": " + str(bpm) for af, bpm in zip(audios, bpms)), "Audio BPM"),
+                                  "BPM Detection Failed")
             self.uncheck_audio()
         except Exception as e:
             self.create_messagebox(e, "BPM Detection Failed")
@@ -716,14 +982,12 @@ class MainWindow:
             pr = self.manager.get_current_project()
             if pr is None:
                 raise Exception("You must create a project first")
-            if len(self.selected_audiofiles) != 1:
-                raise Exception("Speed can be changed to a single file at a time.\nPlease select one file")
+            if not self.selected_audiofiles:
+                raise Exception("Please select the files to change the speed of")
             diag = QInputDialog()
             ratio, ok = diag.getText(self.window, 'Speed ratio', 'Increase / decrease speed by:')
             if ok:
-                speed = pr.change_speed(self.selected_audiofiles[0], float(ratio))
-                self.add_channel_modifier_to_mixing_menu(speed)
-                self.uncheck_audio()
+                self.run_batch("change_speed", float(ratio), error_msg="Speed Change Failed")
         except Exception as e:
             self.create_messagebox(e, "Speed Change Failed")
 
@@ -767,6 +1031,8 @@ class MainWindow:
         self.set_submenu_item("New Project", file_menu, "Ctrl + n", "Create a new project", self.new_project_dialog)
         self.set_submenu_item("Open Project", file_menu, "Ctrl + o", "Open an existing project",
                               self.open_project_dialog)
+        self.set_submenu_item("Open Project From Disk", file_menu, "Ctrl + Shift + o", "Open a saved project",
+                              self.load_project_dialog)
         self.set_submenu_item("Save", file_menu, "Ctrl + s", "Save the current project",
                               self.save_project_dialog)
         self.set_submenu_item("Save As", file_menu, "Ctrl + Shift + s", "Save the current project as",
@@ -790,6 +1056,12 @@ class MainWindow:
         self.set_submenu_item("Remove audio", project_menu, "", "Remove audiofile", self.remove_audio)
         self.set_submenu_item("Export to file", project_menu, "Ctrl + e", "Export audio to file",
                               self.export_audio_dialog)
+        self.set_submenu_item("Batch export", project_menu, "", "Export the selected audio files to several formats",
+                              self.batch_export_dialog)
+        self.set_submenu_item("Add to arrangement", project_menu, "", "Place the selected audio files on the bars grid",
+                              self.add_to_arrangement_dialog)
+        self.set_submenu_item("Render final mix", project_menu, "", "Render the arrangement into the final mix",
+                              self.render_final_mix)
 
     def set_audio_edit_menu(self):
         """
@@ -799,6 +1071,8 @@ class MainWindow:
         transform_menu = self.window.menuBar().addMenu("&Edit")
         self.set_submenu_item("Separate to stems", transform_menu, "Ctrl + s", "Separate to audio stems",
                               self.split_audio_dialog)
+        self.set_submenu_item("Preview stems", transform_menu, "", "Separate an excerpt of the audio to stems",
+                              self.preview_split_dialog)
         self.set_submenu_item("Merge", transform_menu, "Ctrl + m", "Merge audio", self.merge_audio_dialog)
         self.set_submenu_item("Trim", transform_menu, "Ctrl + t", "Trim audio", self.trim_audio_dialog)
         self.set_submenu_item("Concatenate", transform_menu, "Ctrl + c", "Concatenate audio", self.concat_audios)
@@ -818,6 +1092,8 @@ class MainWindow:
         process_menu = self.window.menuBar().addMenu("&Process")
         self.set_submenu_item("Detect BPM", process_menu, "", "Detect audiofile bpm", self.detect_bpm)
         self.set_submenu_item("Change Speed", process_menu, "", "Change audiofile speed", self.change_speed)
+        self.set_submenu_item("Cancel background jobs", process_menu, "", "Cancel the operations running in the "
+                                                                         "background", self.cancel_jobs)
 
     def set_help_menu(self):
         """
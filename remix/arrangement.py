@@ -0,0 +1,290 @@
+import math
+
+import numpy as np
+
+from remix.audio import AudioFile
+from remix.envelope import db_to_gain
+from remix.scheduler import report
+from remix.stream import BlockReader, StreamEncoder, iter_file_blocks, iter_segment_blocks
+
+
+class Clip:
+    """
+    An audio file placed on the bar/beat grid of an arrangement
+    """
+    def __init__(self, audiofile: AudioFile, bar, beat=0, gain_db=0, loops=1, loop_beats=None):
+        """
+        The init method of the class
+        :param audiofile: the audio file played by the clip
+        :param bar: the bar the clip starts at, counted from 0
+        :param beat: the beat of the bar the clip starts at, counted from 0 (may be fractional)
+        :param gain_db: the gain of the clip in dB
+        :param loops: the number of times the clip is played
+        :param loop_beats: the number of beats between two repetitions, the length of the audio if None
+        """
+        if bar < 0 or beat < 0:
+            raise ValueError("A clip cannot start before the first bar")
+        if loops < 1:
+            raise ValueError("A clip must be played at least once")
+        self._audiofile = audiofile
+        self._bar = bar
+        self._beat = beat
+        self._gain_db = gain_db
+        self._loops = loops
+        self._loop_beats = loop_beats
+
+    def get_audiofile(self):
+        """
+        A getter for the audio file of the clip
+        :return: the audio file
+        """
+        return self._audiofile
+
+    def get_position(self):
+        """
+        A getter for the position of the clip on the grid
+        :return: a (bar, beat) tuple
+        """
+        return self._bar, self._beat
+
+    def set_position(self, bar, beat=0):
+        """
+        A setter for the position of the clip on the grid
+        :param bar: the bar the clip starts at
+        :param beat: the beat of the bar the clip starts at
+        :return: None
+        """
+        if bar < 0 or beat < 0:
+            raise ValueError("A clip cannot start before the first bar")
+        self._bar = bar
+        self._beat = beat
+
+    def get_gain_db(self):
+        """
+        A getter for the gain of the clip
+        :return: the gain in dB
+        """
+        return self._gain_db
+
+    def set_gain_db(self, gain_db):
+        """
+        A setter for the gain of the clip
+        :param gain_db: the gain in dB
+        :return: None
+        """
+        self._gain_db = gain_db
+
+    def get_loops(self):
+        """
+        A getter for the repetitions of the clip
+        :return: a (number of repetitions, beats between two repetitions) tuple
+        """
+        return self._loops, self._loop_beats
+
+    def set_loops(self, loops, loop_beats=None):
+        """
+        A setter for the repetitions of the clip
+        :param loops: the number of times the clip is played
+        :param loop_beats: the number of beats between two repetitions, the length of the audio if None
+        :return: None
+        """
+        if loops < 1:
+            raise ValueError("A clip must be played at least once")
+        self._loops = loops
+        self._loop_beats = loop_beats
+
+
+class Arrangement:
+    """
+    Clips placed on a bar/beat grid, rendered block by block.
+    A clip starts at its grid position plus the timeline offset of its audio file. The mix is produced one block
+    (a bar by default) at a time into a streaming encoder, and the audio files are decoded one block at a time as
+    they play, so rendering holds a few blocks whatever the length of the mix and its sources.
+    """
+    def __init__(self, bpm=110, bar=4, beat_unit=4, frame_rate=44100, channels=2):
+        """
+        The init method of the class
+        :param bpm: the tempo in beats per minute
+        :param bar: the number of beats per bar
+        :param beat_unit: the note value of a beat
+        :param frame_rate: the sampling frequency of the mix
+        :param channels: the number of channels of the mix
+        """
+        self._bpm = bpm
+        self._bar = bar
+        self._beat_unit = beat_unit
+        self._frame_rate = frame_rate
+        self._channels = channels
+        self._clips = []
+
+    def set_tempo(self, bpm, bar=None, beat_unit=None):
+        """
+        A setter for the tempo and the time signature, the clips keeping their grid positions
+        :param bpm: the tempo in beats per minute
+        :param bar: the number of beats per bar, unchanged if None
+        :param beat_unit: the note value of a beat, unchanged if None
+        :return: None
+        """
+        self._bpm = bpm
+        self._bar = bar or self._bar
+        self._beat_unit = beat_unit or self._beat_unit
+
+    def get_clips(self):
+        """
+        A getter for the clips of the arrangement
+        :return: the list of clips
+        """
+        return self._clips
+
+    def add_clip(self, audiofile: AudioFile, bar, beat=0, gain_db=0, loops=1, loop_beats=None) -> Clip:
+        """
+        A method to place an audio file on the grid
+        :return: the new Clip object (see Clip for the parameters)
+        """
+        clip = Clip(audiofile, bar, beat, gain_db, loops, loop_beats)
+        self._clips.append(clip)
+        return clip
+
+    def remove_clip(self, clip: Clip):
+        """
+        A method to remove a clip from the arrangement
+        :param clip: the clip to remove
+        :return: None
+        """
+        if clip in self._clips:
+            self._clips.remove(clip)
+
+    def get_frame_rate(self):
+        """
+        A getter for the sampling frequency of the mix
+        :return: the sampling frequency
+        """
+        return self._frame_rate
+
+    def get_channels(self):
+        """
+        A getter for the number of channels of the mix
+        :return: the number of channels
+        """
+        return self._channels
+
+    def beat_frames(self):
+        """
+        A method to get the length of a beat
+        :return: the length in frames (may be fractional)
+        """
+        return 60 * self._frame_rate / self._bpm
+
+    def bar_frames(self):
+        """
+        A method to get the length of a bar
+        :return: the length in frames, rounded
+        """
+        return int(round(self.beat_frames() * self._bar))
+
+    def get_span(self, clip: Clip):
+        """
+        A method to get where a clip plays
+        :param clip: a clip of the arrangement
+        :return: a (start frame, audio length in frames, frames between repetitions, repetitions) tuple
+        """
+        bar, beat = clip.get_position()
+        start = int(round((bar * self._bar + beat) * self.beat_frames()
+                          + clip.get_audiofile().get_offset() * self._frame_rate))
+        mins, secs = clip.get_audiofile().get_duration()  # known without decoding the audio
+        length = int(round((mins * 60 + secs) * self._frame_rate))
+        loops, loop_beats = clip.get_loops()
+        period = int(round(loop_beats * self.beat_frames())) if loop_beats else length
+        return start, length, max(period, 1), loops
+
+    def get_length(self):
+        """
+        A method to get the length of the mix
+        :return: the length in frames
+        """
+        ends = [start + period * (loops - 1) + length
+                for start, length, period, loops in map(self.get_span, self._clips)]
+        return max(ends, default=0)
+
+    def get_num_of_bars(self):
+        """
+        A method to get the number of bars the clips span
+        :return: the number of bars
+        """
+        return int(math.ceil(self.get_length() / self.bar_frames()))
+
+    def iter_blocks(self, block_frames=None):
+        """
+        A generator of the mix, one block at a time
+        :param block_frames: the number of frames in each block, a bar if None
+        :return: a generator of float32 arrays of shape (frames, channels)
+        """
+        block_frames = block_frames or self.bar_frames()
+        tracks = dict()  # {id of an audio file, its track in the format of the mix} of the tracks edited in memory
+        sources = [(clip.get_audiofile(), self.get_span(clip), db_to_gain(clip.get_gain_db())) for clip in self._clips]
+        readers = dict()  # {(index of a clip, repetition), the BlockReader of a repetition playing}
+        total = self.get_length()
+        try:
+            for b0 in range(0, total, block_frames):
+                b1 = min(b0 + block_frames, total)
+                block = np.zeros((b1 - b0, self._channels), dtype=np.float32)
+                for i, (audiofile, (start, length, period, loops), gain) in enumerate(sources):
+                    first = max(0, (b0 - start - length) // period + 1)
+                    last = min(loops - 1, (b1 - 1 - start) // period)
+                    for k in range(first, last + 1):  # the repetitions sounding in this block
+                        r = start + k * period
+                        a, e = max(b0, r), min(b1, r + length)
+                        if a >= e:
+                            continue
+                        if (i, k) not in readers:  # the repetition starts: its audio is read from the start
+                            readers[(i, k)] = BlockReader(self._blocks(audiofile, tracks, block_frames),
+                                                          self._channels)
+                        samples = readers[(i, k)].read(e - a)
+                        block[a - b0:a - b0 + len(samples)] += gain * samples
+                        if e == r + length:
+                            readers.pop((i, k)).close()
+                report(b1 / total, "Rendering the mix")
+                yield block
+        finally:
+            for reader in readers.values():
+                reader.close()
+
+    def render(self, output_path, format=None, block_frames=None):
+        """
+        A method to write the mix to a file
+        :param output_path: the output path
+        :param format: the format of the output, taken from the output_path extension if None
+        :param block_frames: the number of frames rendered at a time, a bar if None
+        :return: output_path
+        """
+        with StreamEncoder(output_path, self._frame_rate, self._channels, format=format) as encoder:
+            for block in self.iter_blocks(block_frames):
+                encoder.write(block)
+        return output_path
+
+    def _blocks(self, audiofile: AudioFile, tracks, block_frames):
+        """
+        A method to read an audio file in the format of the mix
+        :param audiofile: an audio file
+        :param tracks: the {id of an audio file, its track in the format of the mix} of the tracks edited in memory
+        :param block_frames: the number of frames in each block
+        :return: a generator of float32 arrays of shape (frames, channels)
+        """
+        if audiofile.is_modified():  # the edited track is only in memory
+            if id(audiofile) not in tracks:
+                tracks[id(audiofile)] = self._source(audiofile)
+            return iter_segment_blocks(tracks[id(audiofile)], block_frames)
+        return iter_file_blocks(audiofile.get_path(), block_frames, self._frame_rate, self._channels)
+
+    def _source(self, audiofile: AudioFile):
+        """
+        A method to get the track of an audio file in the format of the mix
+        :param audiofile: an audio file
+        :return: an AudioSegment object
+        """
+        track = audiofile.get_track()
+        if track.frame_rate != self._frame_rate:
+            track = track.set_frame_rate(self._frame_rate)
+        if track.channels != self._channels:
+            track = track.set_channels(self._channels)
+        return track
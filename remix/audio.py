@@ -1,5 +1,6 @@
 import enum
 import os
+import tempfile
 from pydub import AudioSegment
 
 
@@ -17,21 +18,32 @@ class AudioFile:
     """
     A class that describes audio files
     """
-    def __init__(self, path, title=None, thumb_path=None):
+    def __init__(self, path, title=None, thumb_path=None, pcm_cache=None, track=None, duration=None):
         """
         A constructor that receives a local path and creates an Audiofile object
         :param path: a local path
         :param title: the title of the video
         :param thumb_path: the path to thumbnail
+        :param pcm_cache: a PcmCache to decode the file through, so its content is decoded only once
+        :param track: the already decoded AudioSegment of the file, to share it instead of decoding the file
+        :param duration: the known (minutes, seconds) duration of the file, to defer decoding it to the first
+        get_track call
         """
         self._path = path  # includes title and extension of the audiofile
         if not os.path.exists(path):  # the path is not valid
             raise ValueError("Invalid path")
-        self._track = AudioSegment.from_file(path)
-        track_mins = (len(self._track) / 1000.0) // 60
-        track_secs = (len(self._track) / 1000.0) - track_mins * 60
-        self._duration = (track_mins, track_secs)
+        self._pcm_cache = pcm_cache
+        self._track = track
+        self._track_from_file = True  # whether the track can be decoded again from the file after an unload
+        self._copy_dir = None  # where save writes a copy, for a file that must not be written over
+        if duration is not None:
+            self._duration = tuple(duration)
+        else:
+            track_mins = (len(self.get_track()) / 1000.0) // 60
+            track_secs = (len(self.get_track()) / 1000.0) - track_mins * 60
+            self._duration = (track_mins, track_secs)
         self._bpm = None
+        self._offset = 0  # the start of the audio on the project timeline, in seconds
 
         self._title, self._ext = os.path.splitext(os.path.basename(path))
         if title is not None:
@@ -83,6 +95,13 @@ class AudioFile:
         """
         return self._thumb_path
 
+    def set_thumb_path(self, thumb_path):
+        """
+        A setter for the audio file thumbnail path
+        :return: None
+        """
+        self._thumb_path = thumb_path
+
     def get_extension(self):
         """
         A getter for the audio file extension
@@ -92,17 +111,57 @@ class AudioFile:
 
     def get_track(self):
         """
-        A getter for the audio file track
+        A getter for the audio file track, decoding the file on the first call
         :return: the audio file track
         """
+        if self._track is None:
+            if self._pcm_cache is not None:
+                self._track = self._pcm_cache.load(self._path)
+            else:
+                self._track = AudioSegment.from_file(self._path)
+            self._track_from_file = True
         return self._track
 
+    def is_loaded(self):
+        """
+        A method to check whether the audio file has been decoded
+        :return: True if the track is in memory
+        """
+        return self._track is not None
+
+    def unload(self):
+        """
+        A method to drop the decoded track, which the next get_track call decodes again from the file (through the
+        PCM cache). A track given with set_track may differ from the file, so it is kept
+        :return: the number of bytes freed
+        """
+        if self._track is None or not self._track_from_file:
+            return 0
+        size = len(self._track.raw_data)
+        self._track = None
+        return size
+
+    def is_modified(self):
+        """
+        A method to check whether the track was changed in memory, so it differs from the file
+        :return: True if the track was given with set_track or edited
+        """
+        return self._track is not None and not self._track_from_file
+
+    def get_memory_usage(self):
+        """
+        A method to get the memory the decoded track takes
+        :return: the size of the decoded track in bytes, 0 if it is not decoded
+        """
+        return len(self._track.raw_data) if self._track is not None else 0
+
     def set_track(self, track):
         """
         A setter for the audio file track
         :return: None
         """
         self._track = track
+        self._track_from_file = False
 
     def get_stack(self):
         """
@@ -132,6 +191,23 @@ class AudioFile:
         """
         self._duration = duration
 
+    def get_offset(self):
+        """
+        A getter for the audio file start on the project timeline
+        :return: the offset in seconds
+        """
+        return self._offset
+
+    def set_offset(self, offset):
+        """
+        A setter for the audio file start on the project timeline
+        :param offset: the offset in seconds
+        :return: None
+        """
+        if offset < 0:
+            raise ValueError("The offset must not be negative")
+        self._offset = offset
+
     def get_bpm(self):
         """
         A getter for the audio file bpm
@@ -146,54 +222,68 @@ class AudioFile:
         """
         self._bpm = bpm
 
+    def set_copy_dir(self, copy_dir):
+        """
+        A method to protect the file from being written over, e.g. a file in the pool of a saved project: saving
+        the audio file then writes a copy in copy_dir, which the audio file uses from then on
+        :param copy_dir: the directory to write the copy in
+        :return: None
+        """
+        self._copy_dir = copy_dir
+
     def save(self, save_path=None):
         """
         A method to save the audio file
         :param save_path: the path for the audio file
         :return: None
         """
+        if not save_path and self._copy_dir is not None:
+            fd, self._path = tempfile.mkstemp(dir=self._copy_dir, prefix=self._title + "_", suffix=self._ext)
+            os.close(fd)
+            self._copy_dir = None
         if not save_path:
             save_path = self._path
-        self._track.export(save_path, bitrate="320k", format="mp3")
+        self.get_track().export(save_path, bitrate="320k", format="mp3")
 
     def reverse(self):
         """
         A method to reverse the audio file
         :return: None
         """
-        self.stack.append(self._track)
-        self._track = self._track.reverse()
+        self.stack.append(self.get_track())
+        self.set_track(self._track.reverse())
 
     def undo(self):
         """
         A method to undo the last action on the audio file
         :return: None
         """
-        self.queue.insert(0, self._track)
-        self._track = self.stack.pop()
+        self.queue.insert(0, self.get_track())
+        self.set_track(self.stack.pop())
 
     def redo(self):
         """
         A method to redo the last undone action on the audio file
         :return: None
         """
-        self.stack.append(self._track)
-        self._track = self.queue[0]
-        self.queue.pop(0)
+        self.stack.append(self.get_track())
+        self.set_track(self.queue.pop(0))
 
 
 class Original(AudioFile):
     """
     A class that describes an original track (inheriting from AudioFile)
     """
-    def __init__(self, path, title=None, thumb_path=None):
+    def __init__(self, path, title=None, thumb_path=None, pcm_cache=None, duration=None):
         """
         The init method of the class
         :param path: a local path
         :param title: the title of the track
         :param thumb_path: the path to the track thumbnail
+        :param pcm_cache: a PcmCache to decode the file through, so its content is decoded only once
+        :param duration: the known (minutes, seconds) duration of the track, to decode it lazily
         """
-        super().__init__(path, title, thumb_path)
+        super().__init__(path, title, thumb_path, pcm_cache, duration=duration)
         self._stems = dict()
 
     def add_stem(self, stem):
@@ -246,8 +336,8 @@ class Stem(AudioFile):
     """
     A class that describes a stem (inheriting from AudioFile)
     """
-    def __init__(self,  path,  title, original, thumb_path=None, description=None):
-        super().__init__(path, title, thumb_path)
+    def __init__(self,  path,  title, original, thumb_path=None, description=None, pcm_cache=None, duration=None):
+        super().__init__(path, title, thumb_path, pcm_cache, duration=duration)
         self._original = original
         self._description = description  # instrument
 
@@ -293,8 +383,8 @@ class Remix(AudioFile):
     """
     A class that describes a remix (inheriting from AudioFile)
     """
-    def __init__(self, path, original, title=None, thumb_path=None):
-        super().__init__(path, title, thumb_path)
+    def __init__(self, path, original, title=None, thumb_path=None, track=None, pcm_cache=None, duration=None):
+        super().__init__(path, title, thumb_path, pcm_cache, track, duration)
         self._original = original
         self._stems = dict()
 
@@ -0,0 +1,160 @@
+"""
+A headless renderer for saved projects, which does not need a display nor PyQt5:
+
+    python -m remix.cli PROJECT_DIR -o OUTPUT_DIR [--format wav] [--stems] [--jobs N] [--profile]
+
+It opens the project, runs the operations queued in it, renders the arrangement into the final mix, exports the
+final mix and the stems, and saves the project back.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+from remix.audio import AudioFileType
+from remix.project import Project
+from remix.scheduler import Scheduler
+from remix.tools import Tools, EXPORT_FORMATS
+
+
+class Profiler:
+    """
+    A collector of the wall-clock time of the steps of a run
+    """
+    def __init__(self, enabled=False):
+        """
+        The init method of the class
+        :param enabled: whether the timings are printed
+        """
+        self._enabled = enabled
+        self._steps = []  # [(step name, seconds)]
+
+    @contextmanager
+    def step(self, name):
+        """
+        A context manager timing a step
+        :param name: the name of the step
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        """
+        A method to record the time of a step
+        :param name: the name of the step
+        :param seconds: the time of the step
+        :return: None
+        """
+        self._steps.append((name, seconds))
+
+    def report(self, out=sys.stderr):
+        """
+        A method to print the timings
+        :param out: the stream to print to
+        :return: None
+        """
+        if not self._enabled:
+            return
+        width = max([len(name) for name, _ in self._steps], default=0)
+        for name, seconds in self._steps:
+            print(name.ljust(width) + "  " + "%8.3f s" % seconds, file=out)
+
+
+def parse_args(argv=None):
+    """
+    A function to parse the command line
+    :param argv: the arguments, sys.argv[1:] if None
+    :return: the parsed arguments
+    """
+    parser = argparse.ArgumentParser(prog="remix", description="Render a saved remix project without the GUI")
+    parser.add_argument("project", help="the folder of a saved project")
+    parser.add_argument("-o", "--output", help="the folder to export to, <project>/render if not given")
+    parser.add_argument("-f", "--format", default="wav", choices=EXPORT_FORMATS, help="the format of the exports")
+    parser.add_argument("--stems", action="store_true", help="export the stems of the project too")
+    parser.add_argument("--no-mix", action="store_true", help="do not render the final mix")
+    parser.add_argument("--no-save", action="store_true", help="do not save the results back into the project")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="the number of parallel jobs (default: CPUs)")
+    parser.add_argument("--profile", action="store_true", help="print the time of every step")
+    return parser.parse_args(argv)
+
+
+def render(args, profiler):
+    """
+    A function to run the steps of a render
+    :param args: the parsed arguments
+    :param profiler: the Profiler timing the steps
+    :return: the list of exported paths
+    """
+    scheduler = Scheduler.configure(cpu_workers=args.jobs)
+    try:
+        output = args.output or os.path.join(args.project, "render")
+        os.makedirs(output, exist_ok=True)
+        exported = []
+
+        with profiler.step("open"):
+            pr = Project.load(args.project)
+
+        pending = pr.get_pending_operations()
+        if pending:
+            names = [operation + " " + af.get_title() for operation, af, _ in pending]
+            with profiler.step("pending operations (" + str(len(pending)) + ")"):
+                gate = Future()  # holds the jobs back until they are all known, as the scheduler forgets done jobs
+                futures = pr.run_pending_operations(depends=[gate])
+                jobs = [scheduler.get_job(future) for future in futures]
+                gate.set_result(None)
+                for future in futures:
+                    future.result()  # raises the error of a failed operation
+            for name, job in zip(names, jobs):  # the time each job ran, timed inside the job
+                profiler.add("  " + name, job.get_run_time())
+
+        if not args.no_mix and pr.get_arrangement().get_clips():
+            with profiler.step("final mix"):
+                path = os.path.join(output, pr.get_name() + "_final_mix." + args.format)
+                exported.append(pr.render_final_mix(path, args.format).get_path())
+        elif not args.no_mix:
+            print("The project has no arrangement, no final mix was rendered", file=sys.stderr)
+
+        if args.stems:
+            stems = [af for af in pr.get_audio_files() + pr.get_current_mix() if af.get_type() == AudioFileType.Stem]
+            stems = list({id(af): af for af in stems}.values())
+            if stems:
+                with profiler.step("stems (" + str(len(stems)) + ")"):
+                    stem_dir = os.path.join(output, "stems")
+                    os.makedirs(stem_dir, exist_ok=True)
+                    exported += Tools.export_batch(stems, stem_dir, [args.format], jobs=args.jobs)
+
+        if not args.no_save:
+            with profiler.step("save"):
+                pr.save_as(pr.get_path())
+        return exported
+    finally:  # a failed step must not leave the pools running
+        scheduler.shutdown()
+
+
+def main(argv=None):
+    """
+    The entry point of the command line renderer
+    :param argv: the arguments, sys.argv[1:] if None
+    :return: the exit status
+    """
+    args = parse_args(argv)
+    profiler = Profiler(args.profile)
+    try:
+        with profiler.step("total"):
+            for path in render(args, profiler):
+                print(path)
+    except Exception as e:
+        print("remix: " + str(e), file=sys.stderr)
+        return 1
+    finally:
+        profiler.report()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,37 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time as timer
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource
+except ImportError:  # not on Windows, no memory measurements
+    resource = None
+
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.image as mpimg
 import wave
 
 from remix.audio import *
-from remix.tools import Tools
+
+SAMPLE_TYPES = {1: np.uint8, 2: np.int16, 4: np.int32}  # {sample width in bytes, NumPy type}, 3 bytes has none
+
+
+def get_pyplot():
+    """
+    A function to import matplotlib when a plot is drawn, so the evaluation itself runs without it
+    :return: the matplotlib.pyplot module
+    """
+    import matplotlib
+    if "matplotlib.pyplot" not in sys.modules and sys.platform.startswith("linux") and not os.environ.get("DISPLAY") \
+            and not os.environ.get("MPLBACKEND"):
+        matplotlib.use("Agg")  # no display, e.g. batch report generation: the plots are only saved
+    import matplotlib.pyplot as plt
+    return plt
 
 
 def plot_image(path):
@@ -13,6 +40,8 @@ def plot_image(path):
     :param path: the path of the image
     :return: None
     """
+    plt = get_pyplot()
+    import matplotlib.image as mpimg
     img = mpimg.imread(path)
     plt.imshow(img)
     plt.show()
@@ -29,94 +58,486 @@ def get_np_array(sound: AudioSegment):
     return arr
 
 
+def get_samples(data, sample_width):
+    """
+    A function to decode the raw frames of a wav file into signed samples
+    :param data: the bytes of the frames
+    :param sample_width: the sample width in bytes
+    :return: the array of the samples, interleaved
+    """
+    if sample_width == 3:  # 24-bit: each sample is placed in the top 3 bytes of an int32, then shifted back
+        raw = np.frombuffer(data, dtype=np.uint8)
+        raw = raw[:len(raw) - len(raw) % 3].reshape(-1, 3)
+        padded = np.zeros((len(raw), 4), dtype=np.uint8)
+        padded[:, 1:] = raw
+        return padded.view("<i4").ravel() >> 8
+    if sample_width not in SAMPLE_TYPES:
+        raise Exception("Unsupported sample width: " + str(sample_width) + " bytes")
+    samples = np.frombuffer(data, dtype=SAMPLE_TYPES[sample_width])
+    if sample_width == 1:  # 8-bit wav samples are unsigned, silence being 128
+        return samples.astype(np.int16) - 128
+    return samples
+
+
 def get_wave_data(wav_file):
     """
     A function to obtain sampling frequency, time space and channels of an audio file
     :param wav_file: a wav file
-    :return: sampling frequency, time space, channels
+    :return: sampling frequency, time space, channels (an array of shape (channels, frames))
     """
     # Extract Raw Audio from Wav File
-    signal = wav_file.readframes(-1)  # len=11866112
-    signal = np.frombuffer(signal, dtype='int16')
+    signal = wav_file.readframes(-1)
+    signal = get_samples(signal, wav_file.getsampwidth())
 
-    # Split the data into channels
-    channels = [[] for channel in range(wav_file.getnchannels())]
-    # len(channels) = 2, type(channels)=<class 'list'>, len(channels[0])=5933056, type(channels[0])=<class 'list'>
-    for index, datum in enumerate(signal):
-        channels[index % len(channels)].append(datum)
+    # Split the data into channels: the samples are interleaved, one frame after the other
+    n = wav_file.getnchannels()
+    channels = signal[:len(signal) - len(signal) % n].reshape(-1, n).T
 
     # Get time from indices
     fs = wav_file.getframerate()
-    # type(time)=<class 'numpy.ndarray'>, time.size=5933056, time.dtype=float64
-    time = np.linspace(0, len(signal) / len(channels) / fs, num=int(len(signal) / len(channels)))
+    time = np.arange(channels.shape[1]) / fs
     return fs, time, channels
 
 
-def plot_array(wav):
+def decimate(time, samples, width):
+    """
+    A function to reduce a signal to its envelope, the minimum and maximum of each of width buckets, which draws
+    the same as the whole signal at that width
+    :param time: the times of the samples
+    :param samples: the samples
+    :param width: the number of buckets, e.g. the width of the plot in pixels
+    :return: the times, the minimums and the maximums of the buckets
+    """
+    width = max(1, min(int(width), len(samples)))
+    starts = np.linspace(0, len(samples), width, endpoint=False).astype(int)
+    return time[starts], np.minimum.reduceat(samples, starts), np.maximum.reduceat(samples, starts)
+
+
+def plot_waveform(ax, time, channels):
+    """
+    A function to draw the waveform of the channels, decimated to the width of the axes
+    :param ax: the matplotlib axes to draw on
+    :param time: the times of the frames
+    :param channels: the samples of each channel
+    :return: None
+    """
+    width = ax.get_window_extent().width or ax.figure.get_size_inches()[0] * ax.figure.dpi
+    for channel in channels:
+        if len(channel):
+            t, low, high = decimate(time, channel, width)
+            ax.fill_between(t, low, high, color='navy', linewidth=0.5, step='post')
+    ax.set_xlabel("Time (secs)")
+
+
+def save_plot(fig, output_path=None, show=True):
+    """
+    A function to save and show a figure, then free it
+    :param fig: the matplotlib figure
+    :param output_path: the path to save the figure to, not saved if None
+    :param show: whether to show the figure, when a display is available
+    :return: None
+    """
+    if output_path:
+        fig.savefig(output_path)
+    plt = get_pyplot()
+    if show and plt.get_backend().lower() != "agg":
+        plt.show()
+    plt.close(fig)
+
+
+def plot_array(wav, output_path=None, show=True):
     """
     A function to plot the waveform of an audio file
     :param wav: a wav audio file
+    :param output_path: the path to save the plot to, not saved if None
+    :param show: whether to show the plot, when a display is available
     :return: None
     """
     with wave.open(wav, 'r') as wav_file:
         fs, time, channels = get_wave_data(wav_file)
 
-        # Plot
-        plt.figure(1)
-        plt.xlabel("Time (secs)")
-        plt.title('Signal Waveform with BPM and Onsets')
-        for channel in channels:
-            plt.plot(time, channel, color='navy')
-        plt.savefig("/home/miriams/PycharmProjects/remixProject/tests/tests_try/wav graph")
-        plt.show()
+    fig, ax = get_pyplot().subplots()
+    ax.set_title('Signal Waveform with BPM and Onsets')
+    plot_waveform(ax, time, channels)
+    save_plot(fig, output_path, show)
 
 
-def plot_array_bpm(wav, bpm):
+def plot_array_bpm(wav, bpm, output_path=None, show=True):
     """
     A function to plot the beats of an audio on its waveform
     :param wav: the wav file to plot
     :param bpm: the bpm of the wav file (bpm = 1/ beats per minute)
+    :param output_path: the path to save the plot to, not saved if None
+    :param show: whether to show the plot, when a display is available
     :return: None
     """
     with wave.open(wav, 'r') as wav_file:
         fs, time, channels = get_wave_data(wav_file)
 
-        # Plot
-        plt.figure()
-        plt.title('Signal Waveform with BPM')
-        plt.xlabel("Time (secs)")
-        x_len = 0
-        for channel in channels:
-            if x_len < len(channel):
-                x_len = len(channel)
-            plt.plot(time, channel, color='navy')
-        bps = (1 / (bpm / 60)) # 1.35
-        x = 0.04
-        audio_secs = x_len / fs
-        while x < audio_secs:
-            plt.axvline(x=x, color='red', label='axvline - full height')
-            x += bps
-
-        plt.savefig("/home/miriams/PycharmProjects/remixProject/tests/tests_try/bpm graph")
-        plt.show()
+    fig, ax = get_pyplot().subplots()
+    ax.set_title('Signal Waveform with BPM')
+    plot_waveform(ax, time, channels)
+    bps = (1 / (bpm / 60))  # 1.35
+    audio_secs = channels.shape[1] / fs
+    ax.vlines(np.arange(0.04, audio_secs, bps), 0, 1, transform=ax.get_xaxis_transform(), color='red')
+    save_plot(fig, output_path, show)
 
 
-def plot_array_onset(wav, onset):
+def plot_array_onset(wav, onset, output_path=None, show=True):
     """
     A function to plot the onset times on the waveform of an audio
     :param wav: the wav file to plot
     :param onset: the onset times of wav
+    :param output_path: the path to save the plot to, not saved if None
+    :param show: whether to show the plot, when a display is available
     :return: None
     """
     with wave.open(wav, 'r') as wav_file:
         fs, time, channels = get_wave_data(wav_file)
 
-        # Plot
-        plt.figure()
-        plt.title('Signal Waveform with Onsets')
-        plt.xlabel("Time (secs)")
-        for channel in channels:
-            plt.plot(time, channel, color='navy')
-        plt.plot(onset, '.', color='yellow')
-        plt.savefig("/home/miriams/PycharmProjects/remixProject/tests/tests_try/onset graph")
-        plt.show()
+    fig, ax = get_pyplot().subplots()
+    ax.set_title('Signal Waveform with Onsets')
+    plot_waveform(ax, time, channels)
+    ax.plot(onset, np.zeros(len(onset)), '.', color='yellow')
+    save_plot(fig, output_path, show)
+
+
+TEMPO_TOLERANCE = 0.04  # the relative error of a correct tempo estimate
+ONSET_TOLERANCE = 0.05  # the distance in seconds of a correct onset from its annotation
+OCTAVE_FACTORS = (1 / 3, 1 / 2, 1, 2, 3)  # the tempo multiples counted as correct up to an octave error
+ANNOTATIONS_FILE = "annotations.json"  # {file name: {"bpm": tempo, "onsets": [seconds]}} of a corpus
+
+
+def remix_bpm(path):
+    """
+    The tempo backend of remix.bpm (needs pywt)
+    :param path: a wav file
+    :return: the tempo in bpm
+    """
+    import remix.bpm
+    return float(remix.bpm.bpm_detector(path)[0])
+
+
+def remix_onset(path):
+    """
+    The onset backend of remix.onset (needs aubio)
+    :param path: a wav file
+    :return: the onset times in seconds
+    """
+    import remix.onset
+    return [float(t) for t in remix.onset.get_onset_times(path)]
+
+
+def librosa_tempo(path):
+    """
+    The tempo backend of librosa, when installed
+    :param path: a wav file
+    :return: the tempo in bpm
+    """
+    import librosa
+    y, sr = librosa.load(path, sr=None, mono=True)
+    tempo, _ = librosa.beat.beat_track(y=y, sr=sr)
+    return float(np.atleast_1d(tempo)[0])
+
+
+def librosa_onset(path):
+    """
+    The onset backend of librosa, when installed
+    :param path: a wav file
+    :return: the onset times in seconds
+    """
+    import librosa
+    y, sr = librosa.load(path, sr=None, mono=True)
+    return [float(t) for t in librosa.onset.onset_detect(y=y, sr=sr, units="time")]
+
+
+BACKENDS = {"tempo": {"remix.bpm": remix_bpm, "librosa": librosa_tempo},
+            "onset": {"remix.onset": remix_onset, "librosa": librosa_onset}}  # {task, {name, function(wav path)}}
+
+
+def register_backend(task, name, func):
+    """
+    A function to add a backend to the evaluation
+    :param task: "tempo" (func returns a bpm) or "onset" (func returns onset times in seconds)
+    :param name: the name of the backend in the reports
+    :param func: a function of a wav path
+    :return: None
+    """
+    if task not in BACKENDS:
+        raise ValueError("The task must be one of " + ", ".join(BACKENDS))
+    BACKENDS[task][name] = func
+
+
+def tempo_accuracy(estimate, reference, tolerance=TEMPO_TOLERANCE):
+    """
+    A function to score a tempo estimate
+    :param estimate: the estimated tempo
+    :param reference: the annotated tempo
+    :param tolerance: the relative error of a correct estimate
+    :return: a dict of the relative error, whether the estimate is correct (accuracy1) and whether it is correct up
+    to an octave error, i.e. a multiple of 1/3, 1/2, 2 or 3 of the tempo (accuracy2)
+    """
+    error = float(abs(estimate - reference) / reference)
+    return {"relative_error": error, "accuracy1": error <= tolerance,
+            "accuracy2": bool(any(abs(estimate - reference * k) <= tolerance * reference * k
+                                  for k in OCTAVE_FACTORS))}
+
+
+def onset_accuracy(estimates, references, tolerance=ONSET_TOLERANCE):
+    """
+    A function to score onset estimates, each annotation matching at most one estimate within the tolerance
+    :param estimates: the estimated onset times in seconds
+    :param references: the annotated onset times in seconds
+    :param tolerance: the distance of a correct onset from its annotation
+    :return: a dict of the precision, recall and F-measure
+    """
+    estimates, references = np.sort(estimates), np.sort(references)
+    matched = i = j = 0
+    while i < len(estimates) and j < len(references):
+        if abs(estimates[i] - references[j]) <= tolerance:
+            matched += 1
+            i += 1
+            j += 1
+        elif estimates[i] < references[j]:
+            i += 1
+        else:
+            j += 1
+    precision = matched / len(estimates) if len(estimates) else float(not len(references))
+    recall = matched / len(references) if len(references) else float(not len(estimates))
+    f_measure = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {"precision": precision, "recall": recall, "f_measure": f_measure}
+
+
+def make_click_track(path, bpm, secs=30, frame_rate=44100, start=0.5):
+    """
+    A function to write a synthetic fixture: decaying tone bursts on every beat, accented on the first of a bar
+    :param path: the wav path to write (16 bit stereo, as remix.bpm reads)
+    :param bpm: the tempo of the clicks
+    :param secs: the length of the fixture
+    :param frame_rate: the sampling frequency
+    :param start: the time of the first click
+    :return: the annotation of the fixture, a {"bpm", "onsets"} dict
+    """
+    onsets = np.arange(start, secs - 0.1, 60 / bpm)
+    click = np.arange(int(0.03 * frame_rate)) / frame_rate
+    click = np.sin(2 * np.pi * 1000 * click) * np.exp(-click / 0.006)
+    signal = np.random.RandomState(int(bpm * 100)).randn(int(secs * frame_rate)) * 0.002  # a quiet noise floor
+    for beat, onset in enumerate(onsets):
+        i = int(round(onset * frame_rate))
+        n = min(len(click), len(signal) - i)
+        signal[i:i + n] += click[:n] * (0.9 if beat % 4 == 0 else 0.6)
+    samples = (np.clip(signal, -1, 1) * 32767).astype("<i2")
+    with wave.open(path, "wb") as wav_file:
+        wav_file.setnchannels(2)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(frame_rate)
+        wav_file.writeframes(np.repeat(samples[:, None], 2, axis=1).tobytes())
+    return {"bpm": bpm, "onsets": [round(float(t), 6) for t in onsets]}
+
+
+def make_fixtures(directory, tempos=(70, 90, 110, 128, 150, 174), secs=30):
+    """
+    A function to write a synthetic corpus of click tracks with its annotations
+    :param directory: the directory of the corpus, created if missing
+    :param tempos: the tempo of each fixture
+    :param secs: the length of each fixture
+    :return: the {file name: annotation} of the corpus
+    """
+    os.makedirs(directory, exist_ok=True)
+    annotations = {"click_" + str(bpm) + ".wav": make_click_track(os.path.join(directory, "click_" + str(bpm) +
+                                                                               ".wav"), bpm, secs)
+                   for bpm in tempos}
+    with open(os.path.join(directory, ANNOTATIONS_FILE), "w") as f:
+        json.dump(annotations, f, indent=1)
+    return annotations
+
+
+def load_corpus(directory):
+    """
+    A function to read a corpus: the audio files of a directory and their annotations.
+    Files that are not wav are converted once, as the backends read wav files
+    :param directory: the directory of the corpus, holding an annotations.json file
+    :return: a list of {"file", "wav", "secs", "bpm", "onsets"} dicts, and the temporary directory of the conversions
+    """
+    try:
+        with open(os.path.join(directory, ANNOTATIONS_FILE)) as f:
+            annotations = json.load(f)
+    except (OSError, ValueError):
+        raise Exception("The corpus " + directory + " has no readable " + ANNOTATIONS_FILE)
+    converted = tempfile.TemporaryDirectory()
+    corpus = []
+    for name in sorted(annotations):
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            raise Exception("The annotated file " + path + " does not exist")
+        wav = path
+        if os.path.splitext(name)[1].lower() != ".wav":
+            wav = os.path.join(converted.name, str(len(corpus)) + ".wav")
+            AudioSegment.from_file(path).export(wav, format="wav")
+        with wave.open(wav, "rb") as wav_file:
+            secs = wav_file.getnframes() / wav_file.getframerate()
+        corpus.append({"file": name, "wav": wav, "secs": secs, "bpm": annotations[name].get("bpm"),
+                       "onsets": annotations[name].get("onsets")})
+    return corpus, converted
+
+
+def _rss():
+    """
+    A function to get the resident memory of the process
+    :return: the resident memory in bytes, None if unknown
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _peak_rss():
+    """
+    A function to get the peak resident memory of the process
+    :return: the peak resident memory in bytes, None if unknown
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # bytes on macOS, kilobytes elsewhere
+
+
+def _run_backend(task, name, wavs):
+    """
+    A function to run a backend over the corpus, in its own process so its peak memory is its own
+    :return: a (list of (estimate, seconds, error), baseline resident memory, peak resident memory) tuple
+    """
+    func = BACKENDS[task][name]
+    baseline = _rss()
+    results = []
+    for wav in wavs:
+        start = timer.perf_counter()
+        try:
+            results.append((func(wav), timer.perf_counter() - start, None))
+        except ImportError as e:  # the backend is not installed, no need to try the other files
+            return [(None, 0.0, "unavailable: " + str(e))] * len(wavs), baseline, _peak_rss()
+        except Exception as e:
+            results.append((None, timer.perf_counter() - start, type(e).__name__ + ": " + str(e)))
+    return results, baseline, _peak_rss()
+
+
+def evaluate_backend(task, name, corpus):
+    """
+    A function to evaluate a backend over a corpus
+    :param task: "tempo" or "onset"
+    :param name: the name of the backend
+    :param corpus: the corpus, see load_corpus
+    :return: a dict of the backend scores, runtime, throughput, peak memory and per file results
+    """
+    wavs = [item["wav"] for item in corpus]
+    if "fork" in multiprocessing.get_all_start_methods():
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("fork")) as pool:
+            results, baseline, peak = pool.submit(_run_backend, task, name, wavs).result()
+    else:  # the peak memory is the one of the whole evaluation
+        results, baseline, peak = _run_backend(task, name, wavs)
+    files = []
+    for item, (estimate, secs, error) in zip(corpus, results):
+        if estimate is not None:  # JSON values, whatever the backend returns
+            estimate = float(estimate) if task == "tempo" else [float(t) for t in estimate]
+        reference = item["bpm"] if task == "tempo" else item["onsets"]
+        row = {"file": item["file"], "audio_secs": item["secs"], "runtime_secs": secs, "error": error,
+               "estimate": estimate, "reference": reference}
+        if estimate is not None and reference is not None:
+            row.update(tempo_accuracy(estimate, reference) if task == "tempo" else onset_accuracy(estimate, reference))
+        files.append(row)
+    scored = [row for row in files if row["error"] is None and row["reference"] is not None]
+    runtime = sum(row["runtime_secs"] for row in files)
+    audio_secs = sum(row["audio_secs"] for row in files if row["error"] is None)
+    report = {"task": task, "backend": name, "available": not any(str(row["error"]).startswith("unavailable")
+                                                                   for row in files),
+              "files": len(files), "failed": sum(row["error"] is not None for row in files),
+              "runtime_secs": runtime, "throughput_x_realtime": audio_secs / runtime if runtime and audio_secs else None,
+              "peak_rss_mb": peak / 2 ** 20 if peak else None,
+              "peak_rss_growth_mb": (peak - baseline) / 2 ** 20 if peak and baseline else None}
+    metrics = ("accuracy1", "accuracy2", "relative_error") if task == "tempo" else ("precision", "recall",
+                                                                                   "f_measure")
+    for metric in metrics:
+        report[metric] = float(np.mean([row[metric] for row in scored])) if scored else None
+    report["results"] = files
+    return report
+
+
+def evaluate(corpus_dir, tasks=("tempo", "onset"), backends=None):
+    """
+    A function to evaluate every backend of the tasks over a corpus
+    :param corpus_dir: the directory of the corpus, see load_corpus
+    :param tasks: the tasks to evaluate
+    :param backends: the names of the backends to evaluate, all of them if None
+    :return: the report, a dict with the list of the backend reports
+    """
+    corpus, converted = load_corpus(corpus_dir)
+    try:
+        reports = [evaluate_backend(task, name, corpus) for task in tasks for name in BACKENDS[task]
+                   if backends is None or name in backends]
+    finally:
+        converted.cleanup()
+    return {"corpus": os.path.abspath(corpus_dir), "files": len(corpus),
+            "audio_secs": sum(item["secs"] for item in corpus), "backends": reports}
+
+
+def write_report(report, output_dir, plots=False):
+    """
+    A function to write an evaluation report: report.json with every result, report.csv with a row per backend,
+    and optionally a chart of the scores and of the throughput of the backends
+    :param report: the report of evaluate
+    :param output_dir: the output directory, created if missing
+    :param plots: whether to draw the charts
+    :return: the list of written paths
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = [os.path.join(output_dir, "report.json"), os.path.join(output_dir, "report.csv")]
+    with open(paths[0], "w") as f:
+        json.dump(report, f, indent=1)
+    columns = ["task", "backend", "available", "files", "failed", "accuracy1", "accuracy2", "relative_error",
+               "precision", "recall", "f_measure", "runtime_secs", "throughput_x_realtime", "peak_rss_mb",
+               "peak_rss_growth_mb"]
+    with open(paths[1], "w", newline="") as f:
+        writer = csv.DictWriter(f, columns, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(report["backends"])
+    if plots:
+        rows = [row for row in report["backends"] if row["available"]]
+        plt = get_pyplot()
+        for key, title in (("score", "Accuracy"), ("throughput_x_realtime", "Throughput (x realtime)")):
+            fig, ax = plt.subplots()
+            labels = [row["task"] + "\n" + row["backend"] for row in rows]
+            values = [(row["accuracy2"] if row["task"] == "tempo" else row["f_measure"]) if key == "score"
+                      else row[key] for row in rows]
+            ax.bar(labels, [v or 0 for v in values], color='navy')
+            ax.set_title(title)
+            paths.append(os.path.join(output_dir, key + ".png"))
+            save_plot(fig, paths[-1], show=False)
+    return paths
+
+
+def main(argv=None):
+    """
+    The entry point of the evaluation
+    :param argv: the arguments, sys.argv[1:] if None
+    :return: the exit status
+    """
+    parser = argparse.ArgumentParser(prog="dsp_evaluation", description="Compare the tempo and onset backends")
+    parser.add_argument("corpus", help="a directory of audio files with an annotations.json file")
+    parser.add_argument("-o", "--output", default="dsp_report", help="the directory of the report")
+    parser.add_argument("--synthetic", action="store_true", help="write click track fixtures into the corpus first")
+    parser.add_argument("--tasks", nargs="+", default=["tempo", "onset"], choices=list(BACKENDS))
+    parser.add_argument("--backends", nargs="+", help="the backends to evaluate, all of them by default")
+    parser.add_argument("--plots", action="store_true", help="draw charts of the scores and the throughput")
+    args = parser.parse_args(argv)
+    if args.synthetic:
+        make_fixtures(args.corpus)
+    report = evaluate(args.corpus, args.tasks, args.backends)
+    for path in write_report(report, args.output, args.plots):
+        print(path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
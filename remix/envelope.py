@@ -0,0 +1,186 @@
+import numpy as np
+
+CURVES = ("linear", "exponential", "s-curve", "equal-power")
+EXPONENTIAL_RANGE_DB = 60  # the dynamic range of the exponential curve
+
+
+def curve(shape, t):
+    """
+    A function to evaluate a rising curve from 0 to 1
+    :param shape: the shape of the curve, one of CURVES
+    :param t: a float32 array of positions along the curve, between 0 and 1
+    :return: a float32 array of the values of the curve at t
+    """
+    if shape == "linear":
+        return t
+    if shape == "exponential":  # linear in dB over EXPONENTIAL_RANGE_DB, shifted to start at silence
+        top = np.float32(10 ** (EXPONENTIAL_RANGE_DB / 20))
+        return (np.power(top, t) - 1) / (top - 1)
+    if shape == "s-curve":
+        return 0.5 - 0.5 * np.cos(np.pi * t)
+    if shape == "equal-power":
+        return np.sin(0.5 * np.pi * t)
+    raise ValueError("The curve must be one of " + ", ".join(CURVES))
+
+
+def db_to_gain(db):
+    """
+    A function to convert decibels to a gain factor
+    :param db: a gain in decibels
+    :return: the gain factor
+    """
+    return 10 ** (db / 20)
+
+
+class Envelope:
+    """
+    A piecewise gain curve over time.
+    The envelope is a list of (seconds, gain) points joined by curves, holding the first gain before the first point
+    and the last gain after the last one. It is rendered once per buffer and applied with a single multiplication,
+    skipping the spans where the gain is 1.
+    """
+    def __init__(self, points=None, shape="linear"):
+        """
+        The init method of the class
+        :param points: a list of (seconds, gain) tuples
+        :param shape: the default shape of the curves between the points
+        """
+        if shape not in CURVES:
+            raise ValueError("The curve must be one of " + ", ".join(CURVES))
+        self._shape = shape
+        self._points = []  # sorted (seconds, gain, shape of the curve ending at the point) tuples
+        for secs, gain in points or []:
+            self.add_point(secs, gain)
+
+    @staticmethod
+    def fade(duration_secs, fade_in_secs=0, fade_out_secs=0, shape="linear"):
+        """
+        A method to build the envelope of a fade in and a fade out
+        :param duration_secs: the duration of the audio in seconds
+        :param fade_in_secs: the length of the fade in
+        :param fade_out_secs: the length of the fade out
+        :param shape: the shape of the fades
+        :return: an Envelope object
+        """
+        envelope = Envelope(shape=shape)
+        fade_in_secs = min(max(fade_in_secs, 0), duration_secs)
+        fade_out_secs = min(max(fade_out_secs, 0), duration_secs)
+        if fade_in_secs > 0:
+            envelope.add_point(0, 0)
+            envelope.add_point(fade_in_secs, 1)
+        if fade_out_secs > 0:
+            envelope.add_point(duration_secs - fade_out_secs, 1)
+            envelope.add_point(duration_secs, 0)
+        return envelope
+
+    def get_points(self):
+        """
+        A getter for the points of the envelope
+        :return: a list of (seconds, gain) tuples
+        """
+        return [(secs, gain) for secs, gain, _ in self._points]
+
+    def add_point(self, secs, gain, shape=None):
+        """
+        A method to add a point to the envelope
+        :param secs: the time of the point in seconds
+        :param gain: the gain factor at the point
+        :param shape: the shape of the curve from the previous point, the default shape if None
+        :return: None
+        """
+        shape = shape or self._shape
+        if shape not in CURVES:
+            raise ValueError("The curve must be one of " + ", ".join(CURVES))
+        if gain < 0:
+            raise ValueError("The gain must not be negative")
+        index = len(self._points)
+        while index > 0 and self._points[index - 1][0] > secs:
+            index -= 1
+        self._points.insert(index, (float(secs), float(gain), shape))
+
+    def segments(self, frame_rate):
+        """
+        A method to split the timeline into spans of constant or changing gain
+        :param frame_rate: the sampling frequency
+        :return: a list of (start frame, end frame, start gain, end gain, shape) tuples, the last one ending at None
+        """
+        if not self._points:
+            return [(0, None, 1.0, 1.0, self._shape)]
+        segments = []
+        start, gain = 0, self._points[0][1]
+        for secs, next_gain, shape in self._points:
+            end = max(int(round(secs * frame_rate)), start)
+            if end > start:
+                segments.append((start, end, gain, next_gain, shape))
+            start, gain = end, next_gain
+        segments.append((start, None, gain, gain, self._shape))
+        return segments
+
+    def gains(self, start, end, frame_rate):
+        """
+        A method to render the envelope as one gain per frame
+        :param start: the first frame
+        :param end: the frame after the last one
+        :param frame_rate: the sampling frequency
+        :return: a float32 array of length end - start
+        """
+        gains = np.ones(end - start, dtype=np.float32)
+        for a, b, segment in self._spans(start, end, frame_rate):
+            gains[a - start:b - start] = self._ramp(a, b, *segment)
+        return gains
+
+    def apply(self, samples, frame_rate, offset_frames=0):
+        """
+        A method to apply the envelope to PCM, in place when the array is a writable float array.
+        Only the spans whose gain is not 1 are touched
+        :param samples: an array of shape (frames, channels)
+        :param frame_rate: the sampling frequency of the samples
+        :param offset_frames: the position of the first frame of samples on the envelope's timeline,
+        to apply the envelope block by block
+        :return: the array with the gains applied
+        """
+        if not (samples.flags.writeable and np.issubdtype(samples.dtype, np.floating)):
+            samples = samples.astype(np.float32)
+        for a, b, segment in self._spans(offset_frames, offset_frames + len(samples), frame_rate):
+            _, _, g0, g1, _ = segment
+            if g0 == g1 == 1:
+                continue
+            span = samples[a - offset_frames:b - offset_frames]
+            if g0 == g1:
+                span *= g0
+            else:
+                span *= self._ramp(a, b, *segment)[:, np.newaxis]
+        return samples
+
+    def _spans(self, start, end, frame_rate):
+        """
+        A method to clip the segments of the envelope to a range of frames
+        :param start: the first frame
+        :param end: the frame after the last one
+        :param frame_rate: the sampling frequency
+        :return: a generator of (first frame, end frame, segment) tuples
+        """
+        for segment in self.segments(frame_rate):
+            a, b = max(segment[0], start), end if segment[1] is None else min(segment[1], end)
+            if a < b:
+                yield a, b, segment
+
+    @staticmethod
+    def _ramp(a, b, s, e, g0, g1, shape):
+        """
+        A method to compute the gains of a part of a segment
+        :param a: the first frame of the part
+        :param b: the frame after the last one
+        :param s: the first frame of the segment
+        :param e: the end frame of the segment
+        :param g0: the gain at the segment start
+        :param g1: the gain at the segment end
+        :param shape: the shape of the segment
+        :return: a float32 array of length b - a
+        """
+        if g0 == g1:
+            return np.full(b - a, g0, dtype=np.float32)
+        t = np.arange(a - s, b - s, dtype=np.float32) / np.float32(max(e - s - 1, 1))
+        if g1 < g0:  # a falling segment is the rising curve played backwards, e.g. equal-power fade-outs
+            return np.float32(g1) + np.float32(g0 - g1) * curve(shape, 1 - t)
+        return np.float32(g0) + np.float32(g1 - g0) * curve(shape, t)
@@ -0,0 +1,46 @@
+import hashlib
+import os
+import shutil
+
+try:
+    import fcntl
+except ImportError:  # not on Windows
+    fcntl = None
+
+FICLONE = 0x40049409  # the Linux ioctl that clones the extents of a file (a reflink)
+
+
+def clone_file(src, dst):
+    """
+    A function to place an independent copy of a file at a new path, as a copy-on-write reflink when the
+    filesystem allows, otherwise as a real copy. Unlike a hardlink, the copy keeps its content when the source is
+    rewritten in place (pydub exports reopen an existing output file)
+    :param src: the path of the existing file
+    :param dst: the path to create
+    :return: dst
+    """
+    if os.path.exists(dst):
+        os.remove(dst)
+    if fcntl is not None:
+        try:
+            with open(src, "rb") as s, open(dst, "wb") as d:
+                fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+            shutil.copystat(src, dst)
+            return dst
+        except OSError:  # reflinks are not supported by the filesystem
+            os.remove(dst)
+    shutil.copy2(src, dst)
+    return dst
+
+
+def file_hash(path):
+    """
+    A function to hash the content of a file
+    :param path: the path of the file
+    :return: a hex digest of the file content
+    """
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for data in iter(lambda: f.read(1 << 20), b""):
+            digest.update(data)
+    return digest.hexdigest()
@@ -1,7 +1,21 @@
+import json
+import os
+import tempfile
+from pathlib import Path
+
 from remix.project import Project
 
+REGISTRY_PATH = os.path.join(str(Path.home()), ".remix", "projects.json")  # the projects saved on disk
+RESIDENT_PROJECTS = 3  # the number of projects whose decoded audio stays in memory
+MEMORY_BUDGET_BYTES = 1024 ** 3  # the decoded audio kept in memory across the projects
+
 
 class Manager:
+    """
+    The projects of the application. The projects saved on disk are listed in a registry, so they are available
+    in every session and loaded only when opened. The decoded audio of the least recently used projects is dropped,
+    to be decoded again from their files and PCM caches, so switching between projects does not grow the memory
+    """
     _instance = None
 
     @staticmethod
@@ -11,14 +25,21 @@ class Manager:
             Manager()
         return Manager._instance
 
-    def __init__(self):
+    def __init__(self, registry_path=REGISTRY_PATH, max_resident=RESIDENT_PROJECTS,
+                 memory_budget=MEMORY_BUDGET_BYTES):
         """ Virtually private constructor. """
         if Manager._instance is not None:
             raise Exception("This class is a singleton!")
         else:
             Manager._instance = self
-        self._projects = dict()  # {name: project}
+        self._projects = dict()  # {name: project, or None for a project saved on disk and not loaded yet}
         self._curr_project = None  # project
+        self._registry_path = registry_path
+        self._saved_paths = dict()  # {name: path} of the projects saved on disk
+        self._recent = []  # the names of the loaded projects, the most recently used last
+        self._max_resident = max_resident
+        self._memory_budget = memory_budget
+        self._read_registry()
 
     def create_project(self, name):
         if name in self.get_project_names():
@@ -26,9 +47,15 @@ class Manager:
         pr = Project(name)
         self._projects[name] = pr
         self._curr_project = pr
+        self.touch(name)
         return pr
 
     def get_project(self, name):
+        """returns a project, loading it from disk on first use"""
+        if name not in self._projects:
+            raise Exception("The selected project does not exist")
+        if self._projects[name] is None:
+            self._projects[name] = Project.load(self._saved_paths[name])
         return self._projects[name]
 
     def get_project_names(self):
@@ -40,6 +67,7 @@ class Manager:
                 return name
 
     def get_projects(self):
+        """returns the {name: project} of the projects, None standing for the saved projects not loaded yet"""
         return self._projects
 
     def get_current_project(self) -> Project:
@@ -49,11 +77,26 @@ class Manager:
         self._curr_project = pr
 
     def open_project(self, proj_name):
-        """opens the project"""
-        if proj_name not in self._projects:
-            raise Exception("The selected project does not exist")
-        if self._projects[proj_name] is not None:
-            self._curr_project = self._projects[proj_name]
+        """opens the project, loading it from disk if needed"""
+        self._curr_project = self.get_project(proj_name)
+        self.touch(proj_name)
+
+    def load_project(self, path):
+        """opens a project saved on disk and makes it the current project"""
+        pr = Project.load(path)
+        name = pr.get_name()
+        if name in self.get_project_names():
+            opened = self._saved_paths.get(name) or self._projects[name].get_path()
+            if os.path.abspath(opened) != os.path.abspath(pr.get_path()):
+                raise Exception("A remix with this name has already been opened")
+            if self._projects[name] is None:
+                self._projects[name] = pr
+        else:
+            self._projects[name] = pr
+            self.register(name, path)
+        self._curr_project = self._projects[name]
+        self.touch(name)
+        return self._curr_project
 
     def save(self):
         """saves the project to disk"""
@@ -64,12 +107,14 @@ class Manager:
         if self._curr_project is None:
             raise Exception("No project has been selected")
         self._curr_project.save()
+        self.register(self.get_project_name(self._curr_project), self._curr_project.get_path())
 
     def save_project_as(self, save_path):
         """saves the project to disk"""
         if self._curr_project is None:
             raise Exception("No project has been selected")
         self._curr_project.save_as(save_path)
+        self.register(self.get_project_name(self._curr_project), self._curr_project.get_path())
 
     def remove_project(self):
         """removes the current project from the manager's projects list"""
@@ -77,6 +122,7 @@ class Manager:
             raise Exception("The current project does not exist")
         name = self.get_project_name(self._curr_project)
         self._curr_project = None
+        self._unregister(name)
         return self._projects.pop(name, "This project does not exist")
 
     def clear(self, proj_name, confirm=True):
@@ -90,6 +136,83 @@ class Manager:
                     return
                 else:
                     clear = input("Are you sure you want to clear the project? Please enter y or n")
+            self._unregister(proj_name)
             self._projects.pop(proj_name)
 
+    def set_memory_budget(self, memory_budget, max_resident=None):
+        """sets the bytes of decoded audio kept in memory across the projects, and the number of projects whose
+        decoded audio is kept"""
+        self._memory_budget = memory_budget
+        self._max_resident = max_resident or self._max_resident
+        self._evict()
+
+    def get_memory_budget(self):
+        return self._memory_budget
+
+    def get_memory_usage(self):
+        """returns the bytes of decoded audio the loaded projects hold"""
+        return sum(pr.get_memory_usage() for pr in self._projects.values() if pr is not None)
+
+    def touch(self, name):
+        """marks a project as the most recently used, without making it the current project, then drops the decoded
+        audio of the least recently used"""
+        if name in self._recent:
+            self._recent.remove(name)
+        self._recent.append(name)
+        self._evict()
+
+    def _evict(self):
+        """drops the decoded audio of the least recently used projects, keeping the current and the most recently used
+        project, until at most max_resident projects hold decoded audio and the memory usage fits the budget. The most
+        recently used project counts as resident even before it decodes anything, since it is about to"""
+        loaded = [name for name in self._recent if self._projects.get(name) is not None]
+        usage = {name: self._projects[name].get_memory_usage() for name in loaded}
+        resident = [name for name in loaded if usage[name] > 0 or name == loaded[-1]]
+        for name in loaded:  # the least recently used first
+            if len(resident) <= self._max_resident and sum(usage.values()) <= self._memory_budget:
+                break
+            if self._projects[name] is self._curr_project or name == loaded[-1]:
+                continue
+            self._projects[name].unload_audio()
+            usage[name] = self._projects[name].get_memory_usage()
+            if usage[name] == 0 and name in resident:
+                resident.remove(name)
+
+    def _read_registry(self):
+        """lists the projects of the registry that are still on disk, without loading them"""
+        try:
+            with open(self._registry_path) as f:
+                registry = json.load(f)
+        except (OSError, ValueError):  # no project saved yet
+            return
+        for name, path in registry.get("projects", {}).items():
+            if name not in self._projects and os.path.isdir(path):
+                self._projects[name] = None
+                self._saved_paths[name] = path
+
+    def _write_registry(self):
+        directory = os.path.dirname(self._registry_path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".json")
+        with os.fdopen(fd, "w") as f:
+            json.dump({"projects": self._saved_paths}, f, indent=1)
+        os.replace(tmp, self._registry_path)  # atomic, so a crash never leaves a half written registry
+
+    def register(self, name, path):
+        """records where a project is saved, so it is listed in the following sessions"""
+        pr = self._projects.get(name)
+        if pr is not None and not pr.is_saved():
+            return
+        path = os.path.abspath(path)
+        if self._saved_paths.get(name) != path:
+            self._saved_paths[name] = path
+            self._write_registry()
+
+    def _unregister(self, name):
+        """forgets a project, leaving its folder on disk"""
+        if self._saved_paths.pop(name, None) is not None:
+            self._write_registry()
+        if name in self._recent:
+            self._recent.remove(name)
+
 
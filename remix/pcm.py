@@ -0,0 +1,38 @@
+import numpy as np
+from pydub import AudioSegment
+
+_DTYPES = {1: np.int8, 2: np.int16, 4: np.int32}
+
+
+def segment_to_array(sound: AudioSegment):
+    """
+    A function to get the float PCM of an audio segment at its native sample rate
+    :param sound: an AudioSegment object
+    :return: a float32 array of shape (frames, channels) with values in [-1, 1]
+    """
+    dtype = _DTYPES.get(sound.sample_width)
+    if dtype is None:
+        sound = sound.set_sample_width(4)
+        dtype = np.int32
+    samples = np.frombuffer(sound.raw_data, dtype=dtype).reshape(-1, sound.channels)
+    scale = float(1 << (8 * sound.sample_width - 1))
+    return samples.astype(np.float32) / scale
+
+
+def array_to_segment(samples, frame_rate, sample_width=2) -> AudioSegment:
+    """
+    A function to build an audio segment from float PCM
+    :param samples: an array of shape (frames, channels) or (frames,) with values in [-1, 1]
+    :param frame_rate: the sampling frequency of the samples
+    :param sample_width: the number of bytes per sample of the output
+    :return: an AudioSegment object
+    """
+    samples = np.asarray(samples)
+    if samples.ndim == 1:
+        samples = samples[:, np.newaxis]
+    if sample_width not in _DTYPES:
+        sample_width = 4
+    scale = float(1 << (8 * sample_width - 1))
+    ints = np.clip(np.rint(samples * scale), -scale, scale - 1).astype(_DTYPES[sample_width])
+    return AudioSegment(data=ints.tobytes(), sample_width=sample_width, frame_rate=int(frame_rate),
+                        channels=samples.shape[1])
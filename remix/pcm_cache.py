@@ -0,0 +1,64 @@
+import os
+import tempfile
+
+from pydub import AudioSegment
+
+from remix.files import file_hash
+
+
+class PcmCache:
+    """
+    A directory of decoded audio.
+    Compressed files (mp3, opus, m4a, ...) are decoded once into a wav file named by the hash of their content,
+    and every later load of the same content reads that wav without running a decoder.
+    """
+    def __init__(self, cache_dir):
+        """
+        The init method of the class
+        :param cache_dir: the directory holding the decoded audio
+        """
+        self._cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def get_dir(self):
+        """
+        A getter for the cache directory
+        :return: the cache directory
+        """
+        return self._cache_dir
+
+    @staticmethod
+    def key(path):
+        """
+        A method to compute the cache key of an audio file
+        :param path: the path of the audio file
+        :return: a hex digest of the file content
+        """
+        return file_hash(path)
+
+    def get_path(self, path):
+        """
+        A method to get the path of the decoded audio of a file
+        :param path: the path of the audio file
+        :return: the path of the wav file in the cache (which may not exist yet)
+        """
+        return os.path.join(self._cache_dir, self.key(path) + ".wav")
+
+    def load(self, path) -> AudioSegment:
+        """
+        A method to load an audio file, decoding it only if its content was never decoded before
+        :param path: the path of the audio file
+        :return: an AudioSegment object
+        """
+        if os.path.splitext(path)[1].lower() == ".wav":
+            return AudioSegment.from_wav(path)
+        cached = self.get_path(path)
+        if os.path.exists(cached):
+            os.utime(cached)  # marks it as recently used, for the eviction of the working directory
+            return AudioSegment.from_wav(cached)
+        track = AudioSegment.from_file(path)
+        fd, tmp = tempfile.mkstemp(dir=self._cache_dir, suffix=".wav")
+        os.close(fd)
+        track.export(tmp, format="wav")
+        os.replace(tmp, cached)  # atomic, so a concurrent load never reads a partial file
+        return track
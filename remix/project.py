@@ -1,10 +1,23 @@
+import json
 import os
 from pathlib import Path
 import tempfile
-from shutil import copytree, rmtree, copy2
+from shutil import rmtree, copy2
+from remix.arrangement import Arrangement
+from remix.pcm_cache import PcmCache
+from remix.working_dir import WorkingDir
+from remix.scheduler import Scheduler, CPU, IO
+from remix.thumbnails import ThumbnailCache
 from remix.tools import Tools
+from remix.files import clone_file, file_hash
+from remix.workers import parallel_map
 from remix.audio import *
 
+MANIFEST_FILE = "project.json"
+MANIFEST_VERSION = 1
+POOL_DIR = "audio"  # the audio files of a saved project, named by their content
+IO_OPERATIONS = ("add_original", "add_originals", "save", "save_as")  # the operations bound by network or disk
+
 
 class Project:
     """a class representing a project"""
@@ -13,9 +26,16 @@ class Project:
         self._name = name
         self._originals = dict()  # {path, Original obj}
         self._current_mix = list()  # list of stems and remix audiofiles
-        self._final_mix = None  # an AudioSegment object
+        self._final_mix = None  # an AudioFile object rendered from the arrangement
+        self._arrangement = Arrangement()
+        self._pending = []  # [(operation, audio file, args)] queued to run later, e.g. by the command line renderer
+        self._previews = []  # the preview stems listened to, until their split is committed or discarded
         self._working_dir = tempfile.TemporaryDirectory()
         self._project_path = self._working_dir.name
+        self._pcm_cache = PcmCache(self._working_dir.name + "/pcm_cache")  # imports decoded once
+        self._workspace = WorkingDir(self._working_dir.name)
+        self._thumbnails = dict()  # {path, future of the thumbnail path}
+        self._hashes = dict()  # {path, (size, mtime, content hash)} of the files saved so far
         self._bpm = 110
         self._time_signature = {'bar': 4, 'beat_unit': 4}  # bar / beat unit. eg 3/4, bar=3 beat_unit=4
         self._num_of_bars = 0
@@ -61,6 +81,13 @@ class Project:
     def get_working_dir(self):
         return self._working_dir
 
+    def is_saved(self):
+        """returns whether the project has a folder on disk it can be opened from"""
+        return self._project_path != self._working_dir.name
+
+    def get_pcm_cache(self):
+        return self._pcm_cache
+
     def set_bpm(self, bpm):
         self._bpm = bpm
 
@@ -74,6 +101,36 @@ class Project:
     def get_time_signature(self):
         return self._time_signature.get('bar'), self._time_signature.get('beat_unit')
 
+    def get_arrangement(self):
+        """returns the arrangement of the project clips, on the grid of the project tempo and time signature"""
+        self._arrangement.set_tempo(self._bpm, self._time_signature['bar'], self._time_signature['beat_unit'])
+        return self._arrangement
+
+    def add_clip(self, af: AudioFile, bar, beat=0, gain_db=0, loops=1, loop_beats=None):
+        """places an audio file on the bar/beat grid of the arrangement"""
+        if not af:
+            raise Exception("The selected file does not exist")
+        clip = self.get_arrangement().add_clip(af, bar, beat, gain_db, loops, loop_beats)
+        self._num_of_bars = max(self._num_of_bars, self._arrangement.get_num_of_bars())
+        return clip
+
+    def remove_clip(self, clip):
+        """removes a clip from the arrangement"""
+        self._arrangement.remove_clip(clip)
+
+    def render_final_mix(self, output_path=None, format="wav"):
+        """renders the arrangement into the final mix one bar at a time, so memory does not grow with its length"""
+        arrangement = self.get_arrangement()
+        if not arrangement.get_clips():
+            raise Exception("Place clips on the arrangement first")
+        if not output_path:
+            output_path = self._output_path(self._name + "_final_mix", "." + format)
+        arrangement.render(output_path, format)
+        secs = arrangement.get_length() / arrangement.get_frame_rate()
+        self._final_mix = AudioFile(output_path, self._name + "_final_mix", pcm_cache=self._pcm_cache,
+                                    duration=(secs // 60, secs - (secs // 60) * 60))
+        return self._final_mix
+
     def set_num_of_bars(self, num):
         self._num_of_bars = num
 
@@ -92,18 +149,43 @@ class Project:
         # get audio
         if os.path.exists(path):
             title, ext = os.path.splitext(os.path.basename(path))
-            self._originals[path] = Original(path, title=title)
+            self._originals[path] = Original(path, title=title, pcm_cache=self._pcm_cache)
+            self._workspace.enforce_quota(self.get_referenced_paths())
             return self._originals[path]
         else:
-            path, title, thumbnail = Tools.download_from_youtube(path, self._working_dir.name)
-            # download image from url
-            if path is not None:
-                thumbnail = Tools.download_image(thumbnail, self._working_dir.name)
-                Tools.resize_image(thumbnail, thumbnail, width=180, height=180)
-                self._originals[path] = Original(path, title, thumbnail)
-                return self._originals[path]
-            else:
-                raise Exception("Could not download audio")  # the exception will be caught in the main window
+            return self._add_download(Tools.download_from_youtube(path, self._working_dir.name))
+
+    def add_originals(self, paths, jobs=4):
+        """adds several originals to the project, downloading the urls among them concurrently"""
+        urls = [path for path in paths if not os.path.exists(path)]
+        downloads = dict(zip(urls, Tools.download_many(urls, self._working_dir.name, jobs)))
+        return [self._add_download(downloads[path]) if path in downloads else self.add_original(path)
+                for path in paths]
+
+    def _add_download(self, download):
+        """adds a downloaded original to the project"""
+        if download is None or download == -1:
+            raise Exception("Could not download audio")  # the exception will be caught in the main window
+        path, title, thumbnail = download
+        orig = Original(path, title, pcm_cache=self._pcm_cache)
+        self._originals[path] = orig
+        self._workspace.enforce_quota(self.get_referenced_paths())
+        if thumbnail:
+            # the image is fetched and resized in the background, the thumbnail is set once it is ready
+            self._thumbnails[path] = ThumbnailCache.get_instance().submit(
+                thumbnail, lambda thumb: self._set_thumbnail(orig, thumb))
+        return orig
+
+    def _set_thumbnail(self, af: AudioFile, thumb):
+        """sets the thumbnail of an audio file once it has been fetched, keeping a copy in the working directory"""
+        thumb_dir = self._working_dir.name + "/thumbnails"
+        os.makedirs(thumb_dir, exist_ok=True)
+        af.set_thumb_path(clone_file(thumb, thumb_dir + "/" + os.path.basename(thumb)))
+        return af.get_thumb_path()
+
+    def get_thumbnail_future(self, af: AudioFile):
+        """returns the future of the thumbnail of an audio file, or None if it has no thumbnail to fetch"""
+        return self._thumbnails.get(af.get_path(), None)
 
     def save(self):
         """saves the project to disk"""
@@ -112,29 +194,172 @@ class Project:
             if os.path.exists(self._project_path):
                 raise Exception("The default path " + self._project_path + " already exists, please provide a new path "
                                                                            "with Save As option")
-            os.mkdir(self._project_path)
         self.save_as(self._project_path)
 
     def save_as(self, path):
-        """saves the project to disk"""
+        """saves the project to disk, writing only the audio files that are not saved there yet"""
         if not path:
             raise Exception("Invalid Path")
         if self._project_path == self._working_dir.name:
             self._project_path = path
-        if path == self._project_path:
-            if not os.path.exists(path):
-                os.mkdir(path)
-            rmtree(path)
-            copytree(self._working_dir.name, path)
-            for orig in self._originals:
-                copy2(orig, path)
-            for audio in self._current_mix:
-                copy2(audio.get_path(), path)
+        if path == self._project_path and os.path.exists(path):
+            self._update_saved(path)
         elif os.path.exists(path):
             raise Exception("The given path " + path + " already exists, please provide a new path")
         else:
-            # self._project_path = path
-            copytree(self._working_dir.name, path)
+            # a new project folder is filled aside and renamed into place, so it never exists half written
+            path = os.path.abspath(path)
+            staging = tempfile.mkdtemp(dir=os.path.dirname(path), prefix="." + os.path.basename(path) + ".")
+            try:
+                os.chmod(staging, 0o755)
+                self._update_saved(staging)
+                os.rename(staging, path)
+            except BaseException:
+                rmtree(staging, ignore_errors=True)
+                raise
+        self.collect_garbage()
+
+    def _update_saved(self, path):
+        """brings a project folder up to date: adds the new audio files to its pool, then replaces the manifest,
+        then removes the pool files the manifest no longer references"""
+        pool_dir = os.path.join(path, POOL_DIR)
+        os.makedirs(pool_dir, exist_ok=True)
+        pool = self._get_pool()
+        for src, name in pool.items():
+            dst = os.path.join(pool_dir, name)
+            if not os.path.exists(dst):  # named by content, so an existing file is already up to date
+                clone_file(src, dst + ".tmp")
+                os.replace(dst + ".tmp", dst)
+        manifest = self._get_manifest(pool)
+        fd, tmp = tempfile.mkstemp(dir=path, suffix=".json")
+        with os.fdopen(fd, "w") as f:
+            json.dump(manifest, f, separators=(",", ":"))
+        os.replace(tmp, os.path.join(path, MANIFEST_FILE))  # the commit point of the save
+        referenced = self.get_referenced_paths()
+        for name in os.listdir(pool_dir):
+            file = os.path.abspath(os.path.join(pool_dir, name))
+            if name not in manifest["files"] and file not in referenced:
+                os.remove(file)
+
+    def _get_manifest(self, pool):
+        """returns the manifest of the project: its settings and its audio files with their lineage,
+        each audio file referring to its pool file and to the audio files it was made from by index"""
+        entries = []
+        ids = dict()  # {id of an audio file, its index in entries}
+
+        def add(af):
+            if id(af) in ids:
+                return ids[id(af)]
+            if af.get_path() not in pool:
+                return None
+            original = af.get_original() if af.get_type() in (AudioFileType.Stem, AudioFileType.Remix) else None
+            original = add(original) if isinstance(original, AudioFile) else None  # the lineage is written first
+            entry = {"type": af.get_type().name, "file": pool[af.get_path()], "title": af.get_title(),
+                     "duration": list(af.get_duration()), "bpm": af.get_bpm(), "offset": af.get_offset(),
+                     "original": original}
+            if af.get_thumb_path() in pool:
+                entry["thumb"] = pool[af.get_thumb_path()]
+            if af.get_type() == AudioFileType.Stem:
+                entry["description"] = af.get_description()
+            ids[id(af)] = len(entries)
+            entries.append(entry)
+            return ids[id(af)]
+
+        originals = [add(af) for af in self.get_originals()]
+        mix = [add(af) for af in self._current_mix]
+        pending = [{"operation": operation, "audio": add(af), "args": args} for operation, af, args in self._pending]
+        final_mix = add(self._final_mix) if self._final_mix is not None else None
+        clips = []
+        for clip in self._arrangement.get_clips():
+            loops, loop_beats = clip.get_loops()
+            clips.append({"audio": add(clip.get_audiofile()), "position": list(clip.get_position()),
+                          "gain_db": clip.get_gain_db(), "loops": loops, "loop_beats": loop_beats})
+        for af in self.get_audio_files() + self._current_mix:
+            if id(af) in ids and af.get_type() in (AudioFileType.Original, AudioFileType.Remix):
+                entries[ids[id(af)]]["stems"] = [add(stem) for stem in af.get_stems() if add(stem) is not None]
+        return {"version": MANIFEST_VERSION, "name": self._name, "bpm": self._bpm,
+                "time_signature": self._time_signature, "num_of_bars": self._num_of_bars,
+                "originals": [i for i in originals if i is not None], "mix": [i for i in mix if i is not None],
+                "arrangement": [clip for clip in clips if clip["audio"] is not None],
+                "pending": [op for op in pending if op["audio"] is not None], "final_mix": final_mix, "audio": entries,
+                "files": sorted(set(pool.values()))}
+
+    @staticmethod
+    def load(path):
+        """opens a saved project from its manifest: the audio files read the pool files in place and are decoded
+        when first used. A pool file is never written over, saving an audio file writes a copy in the working
+        directory"""
+        try:
+            with open(os.path.join(path, MANIFEST_FILE)) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            raise Exception("The folder " + path + " does not hold a saved project")
+        if manifest.get("version") != MANIFEST_VERSION:
+            raise Exception("The project " + path + " was saved in an unsupported format")
+        pr = Project(manifest["name"])
+        pr._project_path = path
+        pr._bpm = manifest["bpm"]
+        pr._time_signature = manifest["time_signature"]
+        pr._num_of_bars = manifest["num_of_bars"]
+        pool_dir = os.path.abspath(os.path.join(path, POOL_DIR))
+
+        def pooled(name):
+            file = os.path.join(pool_dir, name)
+            if file not in pr._hashes:
+                stat = os.stat(file)  # named by their hash, no need to hash them again
+                pr._hashes[file] = (stat.st_size, stat.st_mtime_ns, os.path.splitext(name)[0])
+            return file
+
+        audios = []
+        for entry in manifest["audio"]:
+            file = pooled(entry["file"])
+            thumb = pooled(entry["thumb"]) if "thumb" in entry else None
+            original = audios[entry["original"]] if entry["original"] is not None else None
+            if entry["type"] == AudioFileType.Original.name:
+                af = Original(file, entry["title"], thumb, pr._pcm_cache, entry["duration"])
+            elif entry["type"] == AudioFileType.Stem.name:
+                af = Stem(file, entry["title"], original, thumb, entry.get("description"), pr._pcm_cache,
+                          entry["duration"])
+            elif entry["type"] == AudioFileType.Remix.name:
+                af = Remix(file, original, entry["title"], thumb, pcm_cache=pr._pcm_cache, duration=entry["duration"])
+            else:
+                af = AudioFile(file, entry["title"], thumb, pr._pcm_cache, duration=entry["duration"])
+            af.set_bpm(entry["bpm"])
+            af.set_offset(entry["offset"])
+            af.set_copy_dir(pr._working_dir.name)
+            audios.append(af)
+        for entry, af in zip(manifest["audio"], audios):
+            for i in entry.get("stems", []):
+                af.add_stem(audios[i])
+        pr._originals = {audios[i].get_path(): audios[i] for i in manifest["originals"]}
+        pr._current_mix = [audios[i] for i in manifest["mix"]]
+        for op in manifest.get("pending", []):
+            pr._pending.append((op["operation"], audios[op["audio"]], op["args"]))
+        for clip in manifest.get("arrangement", []):
+            pr._arrangement.add_clip(audios[clip["audio"]], *clip["position"], clip["gain_db"], clip["loops"],
+                                     clip["loop_beats"])
+        if manifest.get("final_mix") is not None:
+            pr._final_mix = audios[manifest["final_mix"]]
+        return pr
+
+    def _get_pool(self):
+        """returns the {source path: pool file name} of the files the project references, named by their content"""
+        audios = self.get_audio_files() + self._current_mix
+        audios += [clip.get_audiofile() for clip in self._arrangement.get_clips()]
+        audios += [af for _, af, _ in self._pending]
+        audios += [self._final_mix] if self._final_mix is not None else []
+        paths = [af.get_path() for af in audios] + [af.get_thumb_path() for af in audios if af.get_thumb_path()]
+        pool = dict()
+        for path in paths:
+            if path in pool or not os.path.exists(path):
+                continue
+            stat = os.stat(path)
+            known = self._hashes.get(path)
+            if known is None or known[:2] != (stat.st_size, stat.st_mtime_ns):  # hash only new or changed files
+                known = (stat.st_size, stat.st_mtime_ns, file_hash(path))
+                self._hashes[path] = known
+            pool[path] = known[2] + os.path.splitext(path)[1].lower()
+        return pool
 
     def copy_pretrained_models(self):
         pretrain_dir = self._working_dir.name + "/pretrained_models"
@@ -153,35 +378,133 @@ class Project:
     def split(self, audiofile: Original, stems):
         """splits the audiofile"""
         # self.copy_pretrained_models()
-        audios = Tools.split_audio(audiofile, self._working_dir.name, output_stem_num=stems)  # a list of stem audiofiles
+        audios = self.separate(audiofile, stems)
+        self.add_stems(audiofile, audios)
+        return audios
+
+    def separate(self, audiofile: Original, stems):
+        """separates the audiofile into stems without adding them to the project, so it can run in the background
+        while the project is used"""
+        output_dir = tempfile.mkdtemp(dir=self._working_dir.name,
+                                      prefix=audiofile.get_title() + "_" + str(stems) + "stems_")
+        audios = Tools.split_audio(audiofile, output_dir, output_stem_num=stems)  # a list of stem audiofiles
         if audios is None:
             raise Exception("Split Failed (retval is None)")
+        return audios
+
+    def add_stems(self, audiofile: Original, audios):
+        """adds the stems separated from the audiofile to the project"""
         self._current_mix += audios
         for stem in audios:
             audiofile.add_stem(stem)
-        return audios
 
-    def calculate_bpm(self, lst, name):
-        bpm_sum = 0
-        af_lst = []
+    def split_preview(self, audiofile: Original, stems, center_secs, length_secs=30):
+        """separates only an excerpt of the audiofile around center_secs and returns preview stems to listen to"""
+        mins, secs = audiofile.get_duration()
+        duration = mins * 60 + secs
+        start = min(max(0, center_secs - length_secs / 2), max(0, duration - length_secs))
+        previews = Tools.split_audio_excerpt(audiofile, self._working_dir.name + "/previews", stems, start,
+                                             length_secs)
+        if previews is None:
+            raise Exception("Preview Split Failed (retval is None)")
+        self._previews += previews
+        return previews
+
+    def discard_previews(self, previews):
+        """forgets preview stems once they are not listened to anymore, deleting their files"""
+        self._previews = [preview for preview in self._previews if preview not in previews]
+        referenced = self.get_referenced_paths()
+        for preview in previews:
+            self._workspace.release(preview.get_path(), referenced)
+
+    def commit_split(self, audiofile: Original, stems):
+        """starts the full separation of the audiofile in the background and returns a future of its stems. The
+        stems are not part of the project until add_stems is called with them, from the thread using the project"""
+        return self.submit("separate", audiofile, stems)
+
+    def submit(self, operation, *args, depends=(), on_progress=None, **kwargs):
+        """queues a project operation (e.g. "split", "trim", "change_speed") as a job of the scheduler and returns
+        a future of its result. The job starts once the futures in depends are done, and can be cancelled with
+        Scheduler.cancel"""
+        method = getattr(self, operation, None)
+        if method is None or operation.startswith("_"):
+            raise Exception("The project has no operation " + operation)
+        kind = IO if operation in IO_OPERATIONS else CPU
+        return Scheduler.get_instance().submit(method, *args, kind=kind, depends=depends,
+                                               name=self._name + ": " + operation, on_progress=on_progress, **kwargs)
+
+    def calculate_bpm(self, lst, name, jobs=None):
+        """detects the tempo of the audio files in parallel and stretches them all to their average tempo"""
+        detected = []
+        inherited = []
         for af in lst:
             if af.get_type() == AudioFileType.Original or af.get_type() == AudioFileType.Audiofile:
-                af_lst.append(af)
-                bpm = Tools.bpm_detector(af.get_track())
-                bpm_sum += bpm
-                af.set_bpm(bpm)
+                detected.append(af)
             elif af.get_type() == AudioFileType.Stem or af.get_type() == AudioFileType.Remix:
-                if af.get_original() not in af_lst:
-                    af_lst.append(af)
-                    bpm = Tools.bpm_detector(af.get_track())
-                    bpm_sum += bpm
-                    af.set_bpm(bpm)
+                if af.get_original() not in detected:
+                    detected.append(af)
                 else:
-                    af.set_bpm(af.get_original().get_bpm())
-        self._bpm = bpm_sum / len(af_lst)
-        for af in lst:
-            af.set_track(Tools.speed_change(af.get_track(), self._working_dir.name + "/" + name, speed=self._bpm / af.get_bpm()))
-            af.set_bpm(Tools.bpm_detector(af.get_track()))
+                    inherited.append(af)
+        # the detector is pure Python, so it runs in worker processes
+        bpms = parallel_map(Tools.bpm_detector, [af.get_track() for af in detected], jobs, processes=True)
+        for af, bpm in zip(detected, bpms):
+            af.set_bpm(bpm)
+        for af in inherited:
+            af.set_bpm(af.get_original().get_bpm())
+        self._bpm = sum(bpms) / len(detected)
+
+        def match_tempo(item):
+            i, af = item
+            outpath = self._output_path(name + str(i) + "_tempo", ".mp3")
+            return Tools.speed_change(af.get_track(), outpath, speed=self._bpm / af.get_bpm())
+
+        tracks = parallel_map(match_tempo, enumerate(lst), jobs)
+        for af, track in zip(lst, tracks):
+            af.set_track(track)
+            af.set_bpm(self._bpm)  # known from the stretch ratio, no need to detect it again
+
+    def detect_bpm(self, af: AudioFile):
+        """detects the tempo of the audiofile and keeps it as its bpm"""
+        af.set_bpm(Tools.bpm_detector(af.get_track()))
+        return af.get_bpm()
+
+    def detect_bpm_batch(self, lst, jobs=None):
+        """detects the tempo of the audio files in parallel and returns their bpms"""
+        # the detector is pure Python, so it runs in worker processes
+        bpms = parallel_map(Tools.bpm_detector, [af.get_track() for af in lst], jobs, processes=True)
+        for af, bpm in zip(lst, bpms):
+            af.set_bpm(bpm)
+        return bpms
+
+    def queue_operation(self, operation, af: AudioFile, *args):
+        """records an operation on an audio file to run later with run_pending_operations; the operation is saved
+        with the project, so a headless renderer can run it (its arguments must be JSON values)"""
+        if getattr(self, operation, None) is None or operation.startswith("_"):
+            raise Exception("The project has no operation " + operation)
+        self._pending.append((operation, af, list(args)))
+
+    def get_pending_operations(self):
+        """returns the list of the (operation, audio file, args) queued to run later"""
+        return self._pending
+
+    def run_pending_operations(self, depends=()):
+        """submits the queued operations to the scheduler, in parallel, and returns their futures. The jobs start
+        once the futures in depends are done"""
+        pending, self._pending = self._pending, []
+        return [self.submit(operation, af, *args, depends=depends) for operation, af, args in pending]
+
+    def submit_batch(self, operation, lst, *args, depends=(), on_progress=None, **kwargs):
+        """queues an operation with the same parameters for every audio file of the list (e.g. fading all the stems
+        of a song), the audio file being the first argument of each call. The jobs run in parallel; the list of
+        their futures is returned in the order of lst"""
+        if not lst:
+            raise Exception("Select the audio files to process")
+        return [self.submit(operation, af, *args, depends=depends, on_progress=on_progress, **kwargs) for af in lst]
+
+    def batch(self, operation, lst, *args, **kwargs):
+        """applies an operation with the same parameters to every audio file of the list in parallel and returns
+        the results in the order of lst"""
+        return [future.result() for future in self.submit_batch(operation, lst, *args, **kwargs)]
 
     def merge(self, lst, change_bpm=False):
         """export the mix into an audio file"""
@@ -194,126 +517,210 @@ class Project:
             name += " "
         if change_bpm:
             self.calculate_bpm(lst, name)
-        merged = Tools.overlay_audio(lst, self._working_dir.name + "/" + name + "merged.mp3")
+        merged = Tools.overlay_audio(lst, self._output_path(name + "merged", ".mp3"))
         if merged is None:
             raise Exception("Audio Merging Failed (retval is None)")
-        self._current_mix.append(merged)
+        self._add_edit(merged)
         return merged
 
     def trim(self, af: AudioFile, start_min, start_sec, end_min=None, end_sec=None):
         if not af:
             raise Exception("The selected file does not exist")
-        outpath = self._working_dir.name + "/" + af.get_title() + "_trim.mp3"
+        outpath = self._output_path(af.get_title() + "_trim", ".mp3")
         trimmed = Tools.audio_trim(af, outpath, start_min, start_sec, end_min, end_sec)[0]
         if trimmed is None:
             raise Exception("Audio Trim Failed (retval is None)")
-        self._current_mix.append(trimmed)
+        self._add_edit(trimmed)
         return trimmed
 
     def concat(self, lst):
         if not lst:
             raise Exception("Select audios to concatenate")
-        outpath = self._working_dir.name + "/" + lst[0].get_title() + "_concat.mp3"
+        outpath = self._output_path(lst[0].get_title() + "_concat", ".mp3")
         concat = Tools.concatenate_audio(lst, outpath)
         if concat is None:
             raise Exception("Audio Concationation Failed (retval is None)")
-        self._current_mix.append(concat)
+        self._add_edit(concat)
         return concat
 
     def cut(self, af: AudioFile, cut_min, cut_sec):
         if not af:
             raise Exception("The selected file does not exist")
-        outpath = self._working_dir.name + "/" + af.get_title()
+        outpath = self._output_path(af.get_title())  # the prefix of the two parts
         cut1, cut2 = Tools.audio_cut(af, cut_min, cut_sec, outpath)
         if cut1 is None and cut2 is None:
             raise Exception("Cut Audio Failed (retval is None)")
         elif cut1 is None:
-            self._current_mix.append(cut2)
+            self._add_edit(cut2)
             return cut2
         elif cut2 is None:
-            self._current_mix.append(cut1)
+            self._add_edit(cut1)
             return cut1
         else:
-            self._current_mix.append(cut1)
-            self._current_mix.append(cut2)
+            self._add_edit(cut1, cut2)
             return cut1, cut2
 
     def delete(self, af: AudioFile, start_min, start_sec, end_min=None, end_sec=None):
         if not af:
             raise Exception("The selected file does not exist")
-        outpath = self._working_dir.name + "/" + af.get_title() + "_delete.mp3"
+        outpath = self._output_path(af.get_title() + "_delete", ".mp3")
         deleted = Tools.audio_delete(af, start_min, start_sec, end_min, end_sec, outpath)
         if deleted is None:
             raise Exception("Delete Audio Section Failed (retval is None)")
-        self._current_mix.append(deleted)
+        self._add_edit(deleted)
         return deleted
 
-    def fade(self, af: AudioFile, start=3, end=3):
+    def fade(self, af: AudioFile, start=3, end=3, shape="linear"):
         if not af:
             raise Exception("The selected file does not exist")
-        outpath = self._working_dir.name + "/" + af.get_title() + "_fade.mp3"
-        faded = Tools.fade(af, start, end, outpath)
+        outpath = self._output_path(af.get_title() + "_fade", os.path.splitext(af.get_path())[1])
+        faded = Tools.fade(af, start, end, outpath, shape)
         if faded is None:
             raise Exception("Fade Failed (retval is None)")
-        self._current_mix.append(faded)
+        self._add_edit(faded)
         return faded
 
-    def fadein(self, af: AudioFile, start=3):
+    def fadein(self, af: AudioFile, start=3, shape="linear"):
         if not af:
             raise Exception("The selected file does not exist")
-        outpath = self._working_dir.name + "/" + af.get_title() + "_fadein.mp3"
-        faded = Tools.fadein(af, start, outpath)
+        outpath = self._output_path(af.get_title() + "_fadein", os.path.splitext(af.get_path())[1])
+        faded = Tools.fadein(af, start, outpath, shape)
         if faded is None:
             raise Exception("Fade In Failed (retval is None)")
-        self._current_mix.append(faded)
+        self._add_edit(faded)
         return faded
 
-    def fadeout(self, af: AudioFile, end=3):
+    def fadeout(self, af: AudioFile, end=3, shape="linear"):
         if not af:
             raise Exception("The selected file does not exist")
-        outpath = self._working_dir.name + "/" + af.get_title() + "_fadeout.mp3"
-        faded = Tools.fadeout(af, end, outpath)
+        outpath = self._output_path(af.get_title() + "_fadeout", os.path.splitext(af.get_path())[1])
+        faded = Tools.fadeout(af, end, outpath, shape)
         if faded is None:
             raise Exception("Fade Out Failed (retval is None)")
-        self._current_mix.append(faded)
+        self._add_edit(faded)
         return faded
 
+    def automate_volume(self, af: AudioFile, points, shape="linear"):
+        if not af:
+            raise Exception("The selected file does not exist")
+        outpath = self._output_path(af.get_title() + "_volume", os.path.splitext(af.get_path())[1])
+        changed = Tools.automate_volume(af, points, outpath, shape)
+        if changed is None:
+            raise Exception("Volume Automation Failed (retval is None)")
+        self._add_edit(changed)
+        return changed
+
     def change_position(self, af: AudioFile, mins, secs):
         transform_secs = mins * 60 + secs
         if not af:
             raise Exception("The selected file does not exist")
-        outpath = self._working_dir.name + "/" + af.get_title() + "_pos_transform.mp3"
-        moved = Tools.transform_audio_position(af, transform_secs, outpath)
+        moved = Tools.transform_audio_position(af, transform_secs)
         if moved is None:
             raise Exception("Position Transform Failed (retval is None)")
-        self._current_mix.append(moved)
+        self._add_edit(moved)
         return moved
 
     def duplicate(self, af):
         if not af:
             raise Exception("The selected file does not exist")
-        dup = Tools.duplicate(af)
+        dup = Tools.duplicate(af, output_path=self._output_path(af.get_title() + " duplicate", af.get_extension()))
         if dup is None:
             raise Exception("Duplication Failed (retval is None)")
-        self._current_mix.append(dup)
+        self._add_edit(dup)
         return dup
 
+    def _output_path(self, name, ext=""):
+        """returns a new path of the working directory for the output of an operation. The file is created so that
+        operations running at the same time, e.g. two trims of the same audio file, never write the same path"""
+        fd, path = tempfile.mkstemp(dir=self._working_dir.name, prefix=name + "_", suffix=ext)
+        os.close(fd)
+        return path
+
+    def _add_edit(self, *audios):
+        """adds the results of an edit to the current mix, then deletes the working directory files no audio file
+        uses anymore"""
+        self._current_mix += audios
+        self.collect_garbage()
+
+    def add_audio(self, af: AudioFile):
+        """adds an audio file made outside the project operations (e.g. a memoised recipe result) to the project"""
+        if af.get_type() == AudioFileType.Original:
+            self._originals[af.get_path()] = af
+            return
+        self._current_mix.append(af)
+        if af.get_type() == AudioFileType.Stem and isinstance(af.get_original(), AudioFile):
+            af.get_original().add_stem(af)
+
     def remove_audio_from_project(self, af: AudioFile):
         if af.get_type() == AudioFileType.Original:
             self._originals.pop(af.get_path(), "")
         else:
             if af in self._current_mix:
                 self._current_mix.remove(af)
+        # the file is deleted from the working directory unless another audio file shares it
+        referenced = self.get_referenced_paths()
+        self._workspace.release(af.get_path(), referenced)
+        if af.get_thumb_path():
+            self._workspace.release(af.get_thumb_path(), referenced)
+        self.collect_garbage()
+
+    def get_referenced_paths(self):
+        """returns the set of the absolute paths of the files the project audio files use"""
+        audios = self._get_all_audio_files()
+        paths = [af.get_path() for af in audios] + [af.get_thumb_path() for af in audios if af.get_thumb_path()]
+        return set(os.path.abspath(path) for path in paths)
+
+    def get_memory_usage(self):
+        """returns the number of bytes of decoded audio the project holds in memory"""
+        tracks = dict()  # {id of a track, its size}, as audio files may share a track
+        for af in self._get_all_audio_files():
+            if af.is_loaded():
+                tracks[id(af.get_track())] = af.get_memory_usage()
+        return sum(tracks.values())
+
+    def unload_audio(self):
+        """drops the decoded audio of the project that can be decoded again from its files, and returns the number
+        of bytes freed"""
+        before = self.get_memory_usage()
+        for af in self._get_all_audio_files():
+            af.unload()
+        return before - self.get_memory_usage()
+
+    def _get_all_audio_files(self):
+        """returns the list of every audio file of the project, in the mix, the arrangement or the final mix"""
+        audios = self.get_audio_files() + self._current_mix
+        audios += [clip.get_audiofile() for clip in self._arrangement.get_clips()]
+        audios += [af for _, af, _ in self._pending]
+        audios += [self._final_mix] if self._final_mix is not None else []
+        return audios + self._previews
+
+    def collect_garbage(self):
+        """deletes the working directory files no audio file uses anymore, then evicts decoded audio and previews,
+        least recently used first, until the working directory fits its disk quota. Returns the bytes freed"""
+        referenced = self.get_referenced_paths()
+        return self._workspace.collect(referenced) + self._workspace.enforce_quota(referenced)
+
+    def set_disk_quota(self, quota_bytes):
+        """sets the size the working directory should be kept under"""
+        self._workspace.set_quota(quota_bytes)
+        self._workspace.enforce_quota(self.get_referenced_paths())
+
+    def get_disk_quota(self):
+        return self._workspace.get_quota()
 
     def change_speed(self, af: AudioFile, speed):
         if not af:
             raise Exception("The selected file does not exist")
-        outpath = self._working_dir.name + "/" + af.get_title() + "_speed" + str(speed) + "x.mp3"
-        speeded = Tools.speed_change(af.get_track(), outpath, speed)
+        outpath = self._output_path(af.get_title() + "_speed" + str(speed) + "x", ".mp3")
+        # the file is decoded block by block, unless the track was edited in memory
+        mins, secs = af.get_duration()
+        source = af.get_track() if af.is_modified() else af.get_path()
+        speeded = Tools.stream_speed_change(source, outpath, speed, duration=mins * 60 + secs)
         if speeded is None:
             raise Exception("Speed Change Failed (retval is None)")
         af2 = Remix(outpath, af, title=af.get_title() + "_" + str(speed) + "x")
-        self._current_mix.append(af2)
+        af2.set_offset(af.get_offset())  # an edit keeps the audio where it is on the timeline
+        self._add_edit(af2)
         return af2
 
 
@@ -0,0 +1,445 @@
+"""
+Remix recipes: a workflow described as named nodes, each applying an operation to the results of other nodes.
+
+    name: my remix
+    nodes:
+      song:   {op: add_original, args: [song.mp3]}
+      stems:  {op: split, input: song, args: [4]}
+      vocals: {op: select, input: stems, args: [vocals]}
+      drums:  {op: select, input: stems, args: [drums]}
+      intro:  {op: trim, input: vocals, args: [0, 30, 1, 0]}
+      faded:  {op: fadein, input: [intro, drums], map: true, args: [2]}
+      mix:    {op: merge, input: faded, kwargs: {change_bpm: true}}
+      out:    {op: export, input: mix, args: [out, [mp3, wav]]}
+
+An operation is a Project method called with the input as its first argument: the result of the input node, or
+the list of the results when the input is a list of nodes. With map, the operation is applied to every audio file
+of the input in parallel. The recipe adds two operations: select, picking a stem by its description, title or
+index, and export, writing the input audio files to a directory in a list of formats.
+
+The nodes run as jobs of the scheduler, each one once its inputs are done, so independent branches run in
+parallel. The result of every node is memoised on disk under a key made of its step and the keys of its inputs,
+so running an edited recipe only runs the edited nodes and the nodes downstream of them.
+"""
+import hashlib
+import json
+import os
+import sys
+
+try:
+    import yaml
+except ImportError:  # JSON recipes only
+    yaml = None
+
+from remix.audio import *
+from remix.files import clone_file, file_hash
+from remix.project import Project
+from remix.scheduler import Scheduler
+from remix.tools import Tools
+from remix.workers import parallel_map
+
+CACHE_DIR = ".remix_cache"
+RESULT_FILE = "result.json"
+
+
+class Recipe:
+    """
+    A remix workflow as a DAG of operations over named audio nodes
+    """
+    def __init__(self, nodes, name="Untitled", base_dir=".", cache_dir=None):
+        """
+        The init method of the class
+        :param nodes: a {node name: step} dict, a step being a dict with an "op" and optional "input", "args",
+        "kwargs" and "map" entries
+        :param name: the name of the project the recipe builds
+        :param base_dir: the directory the relative paths of the recipe start from
+        :param cache_dir: the directory of the memoised results, <base_dir>/.remix_cache if None
+        """
+        self._nodes = dict()
+        for node, step in nodes.items():
+            if not isinstance(step, dict) or "op" not in step:
+                raise Exception("The step " + str(node) + " of the recipe has no operation")
+            inputs = step.get("input", [])
+            self._nodes[node] = {"op": step["op"], "input": inputs, "args": list(step.get("args", [])),
+                                 "kwargs": dict(step.get("kwargs", {})), "map": bool(step.get("map", False))}
+        self._name = name
+        self._base_dir = os.path.abspath(base_dir)
+        self._cache = RecipeCache(cache_dir or os.path.join(self._base_dir, CACHE_DIR))
+        self._order = self._sort()
+
+    @staticmethod
+    def load(path, cache_dir=None):
+        """
+        A method to read a recipe file
+        :param path: the path of a JSON or YAML recipe
+        :param cache_dir: the directory of the memoised results, next to the recipe if None
+        :return: a Recipe object
+        """
+        try:
+            with open(path) as f:
+                if os.path.splitext(path)[1].lower() in (".yaml", ".yml"):
+                    if yaml is None:
+                        raise Exception("Install PyYAML to read YAML recipes")
+                    recipe = yaml.safe_load(f)
+                else:
+                    recipe = json.load(f)
+        except (OSError, ValueError) as e:
+            raise Exception("The recipe " + path + " cannot be read: " + str(e))
+        if not isinstance(recipe, dict) or not isinstance(recipe.get("nodes"), dict):
+            raise Exception("The recipe " + path + " has no nodes")
+        return Recipe(recipe["nodes"], recipe.get("name", "Untitled"), os.path.dirname(os.path.abspath(path)),
+                      cache_dir or recipe.get("cache"))
+
+    def get_name(self):
+        """
+        A getter for the name of the recipe
+        :return: the name of the recipe
+        """
+        return self._name
+
+    def get_nodes(self):
+        """
+        A getter for the names of the nodes, every node coming after its inputs
+        :return: the list of node names
+        """
+        return list(self._order)
+
+    def get_step(self, node):
+        """
+        A getter for the step of a node
+        :param node: a node name
+        :return: a dict with the "op", "input", "args", "kwargs" and "map" of the node
+        """
+        return self._nodes[node]
+
+    def get_inputs(self, node):
+        """
+        A method to get the nodes a node reads
+        :param node: a node name
+        :return: the list of the input node names
+        """
+        inputs = self._nodes[node]["input"]
+        return [inputs] if isinstance(inputs, str) else list(inputs)
+
+    def get_keys(self):
+        """
+        A method to get the memoisation keys of the nodes, a key changing when the step of its node or of a node
+        upstream of it changes, or when an imported file changes
+        :return: a {node name: key} dict
+        """
+        keys = dict()
+        for node in self._order:
+            step = self._nodes[node]
+            args = self._resolve_args(step)
+            salt = [file_hash(arg) for arg in args if step["op"] == "add_original" and isinstance(arg, str)
+                    and os.path.isfile(arg)]
+            desc = [step["op"], args, step["kwargs"], step["map"], isinstance(step["input"], str),
+                    [keys[i] for i in self.get_inputs(node)], salt]
+            keys[node] = hashlib.sha1(json.dumps(desc, sort_keys=True, default=str).encode()).hexdigest()
+        return keys
+
+    def get_stale(self):
+        """
+        A method to get the nodes the next run will execute, the others being taken from the memoised results
+        :return: the list of node names, in execution order
+        """
+        keys = self.get_keys()
+        return [node for node in self._order if not self._cache.contains(keys[node])]
+
+    def run(self, project=None, jobs=None, on_progress=None):
+        """
+        A method to run the recipe, the independent nodes in parallel
+        :param project: the project the audio files are added to, a new project named after the recipe if None
+        :param jobs: the number of audio files processed in parallel by a mapped node, the number of CPUs if None
+        :param on_progress: a function called from the workers with (node, fraction, message) on progress reports
+        :return: a (project, {node name: result}) tuple
+        """
+        project = project or Project(self._name)
+        keys = self.get_keys()
+        scheduler = Scheduler.get_instance()
+        futures = dict()
+        for node in self._order:
+            progress = None if on_progress is None else (lambda f, m, node=node: on_progress(node, f, m))
+            depends = [futures[i] for i in self.get_inputs(node)]
+            futures[node] = scheduler.submit(self._run_node, project, node, keys[node], depends, jobs,
+                                             depends=depends, name=self._name + ": " + node, on_progress=progress)
+        results = dict()
+        for node in self._order:
+            try:
+                results[node] = futures[node].result()
+            except Exception as e:
+                for future in futures.values():
+                    scheduler.cancel(future)
+                raise Exception("The step " + node + " of the recipe failed: " + str(e))
+        return project, results
+
+    def _run_node(self, project, node, key, depends, jobs):
+        """
+        A method to produce the result of a node, from the memoised results when its key is known
+        :return: the result of the node
+        """
+        step = self._nodes[node]
+        inputs = [future.result() for future in depends]
+        value = inputs[0] if isinstance(step["input"], str) else _flatten(inputs)
+        cached = self._cache.get(key, project, _flatten(inputs))
+        if cached is not None and (step["op"] != "export" or all(os.path.exists(path) for path in cached)):
+            return cached
+        args = self._resolve_args(step)
+        if step["op"] == "select":
+            result = _select(value, *args)
+        elif step["op"] == "export":
+            result = self._export(value, *args, **step["kwargs"])
+        else:
+            method = getattr(project, step["op"], None)
+            if method is None or step["op"].startswith("_"):
+                raise Exception("The project has no operation " + step["op"])
+            if step["map"]:
+                result = parallel_map(lambda af: method(af, *args, **step["kwargs"]), _flatten([value]), jobs)
+            elif self.get_inputs(node):
+                result = method(value, *args, **step["kwargs"])
+            else:
+                result = method(*args, **step["kwargs"])
+        self._cache.put(key, result, project, _flatten(inputs))
+        return result
+
+    def _resolve_args(self, step):
+        """
+        A method to make the paths of a step relative to the recipe directory
+        :return: the list of the arguments of the step
+        """
+        args = list(step["args"])
+        if step["op"] == "add_original" and args and os.path.exists(os.path.join(self._base_dir, str(args[0]))):
+            args[0] = os.path.join(self._base_dir, args[0])
+        elif step["op"] == "export" and args:
+            args[0] = os.path.join(self._base_dir, args[0])
+        return args
+
+    @staticmethod
+    def _export(value, output_path, formats=("mp3",)):
+        """
+        A method to write audio files to a directory
+        :param value: an audio file or a list of audio files
+        :param output_path: the output directory, created if missing
+        :param formats: a format or a list of formats
+        :return: the list of exported paths
+        """
+        os.makedirs(output_path, exist_ok=True)
+        formats = [formats] if isinstance(formats, str) else list(formats)
+        return Tools.export_batch(_flatten([value]), output_path, formats)
+
+    def _sort(self):
+        """
+        A method to order the nodes so that every node comes after its inputs
+        :return: the list of node names
+        """
+        order = []
+        state = dict()  # {node, "visiting" or "done"}
+
+        def visit(node, path):
+            if state.get(node) == "done":
+                return
+            if state.get(node) == "visiting":
+                raise Exception("The recipe has a cycle: " + " -> ".join(path + [node]))
+            state[node] = "visiting"
+            for i in self.get_inputs(node):
+                if i not in self._nodes:
+                    raise Exception("The step " + node + " reads the unknown node " + str(i))
+                visit(i, path + [node])
+            state[node] = "done"
+            order.append(node)
+
+        for node in self._nodes:
+            visit(node, [])
+        return order
+
+
+class RecipeCache:
+    """
+    The memoised results of recipe nodes, one directory per key holding the audio files of the result and its
+    description. The description is written last, so an interrupted run leaves no half result behind
+    """
+    def __init__(self, path):
+        """
+        The init method of the class
+        :param path: the directory of the memoised results
+        """
+        self._path = path
+
+    def get_path(self):
+        """
+        A getter for the directory of the memoised results
+        :return: the directory path
+        """
+        return self._path
+
+    def contains(self, key):
+        """
+        A method to check whether a result is memoised
+        :param key: the key of a node
+        :return: True if the result of the key is memoised
+        """
+        return os.path.exists(os.path.join(self._path, key, RESULT_FILE))
+
+    def get(self, key, project, inputs):
+        """
+        A method to restore a memoised result into a project
+        :param key: the key of a node
+        :param project: the project to add the audio files of the result to
+        :param inputs: the flat list of the input values of the node, the audio files of the result are made from
+        :return: the result, or None if it is not memoised or its files are gone
+        """
+        try:
+            with open(os.path.join(self._path, key, RESULT_FILE)) as f:
+                result = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not all(os.path.exists(path) for path in _paths(result, os.path.join(self._path, key))):
+            return None
+        return self._restore(result, os.path.join(self._path, key), project, inputs)
+
+    def put(self, key, value, project, inputs):
+        """
+        A method to memoise a result, copying its audio files into the cache. An original outside the working
+        directory of the project is the file of the user, keyed by its content: it is recorded by its path instead
+        :param key: the key of a node
+        :param value: the result of the node
+        :param project: the project the result was made in
+        :param inputs: the flat list of the input values of the node
+        :return: None
+        """
+        directory = os.path.join(self._path, key)
+        os.makedirs(directory, exist_ok=True)
+        result = self._dump(value, directory, project, inputs, [0])
+        with open(os.path.join(directory, RESULT_FILE + ".tmp"), "w") as f:
+            json.dump(result, f)
+        os.replace(os.path.join(directory, RESULT_FILE + ".tmp"), os.path.join(directory, RESULT_FILE))
+
+    def _dump(self, value, directory, project, inputs, count):
+        """
+        A method to describe a result as JSON
+        :return: the description
+        """
+        same = [i for i, af in enumerate(inputs) if af is value]
+        if isinstance(value, AudioFile) and same:  # e.g. a selected stem, restored as the input itself
+            return {"input": same[0]}
+        working_dir = os.path.abspath(project.get_working_dir().name) + os.sep
+        if isinstance(value, Original) and not os.path.abspath(value.get_path()).startswith(working_dir):
+            return {"source": {"path": os.path.abspath(value.get_path()), "title": value.get_title(),
+                               "duration": list(value.get_duration()), "bpm": value.get_bpm(),
+                               "offset": value.get_offset()}}
+        if isinstance(value, AudioFile):
+            file = str(count[0]) + "_" + os.path.basename(value.get_path())
+            count[0] += 1
+            clone_file(value.get_path(), os.path.join(directory, file))
+            original = value.get_original() if value.get_type() in (AudioFileType.Stem, AudioFileType.Remix) \
+                else None
+            parents = [i for i, af in enumerate(inputs) if af is original]
+            return {"audio": {"type": value.get_type().name, "file": file, "title": value.get_title(),
+                              "duration": list(value.get_duration()), "bpm": value.get_bpm(),
+                              "offset": value.get_offset(), "original": parents[0] if parents else None,
+                              "description": value.get_description()
+                              if value.get_type() == AudioFileType.Stem else None}}
+        if isinstance(value, (list, tuple)):
+            return {"list": [self._dump(v, directory, project, inputs, count) for v in value],
+                    "tuple": isinstance(value, tuple)}
+        return {"value": value}
+
+    def _restore(self, result, directory, project, inputs):
+        """
+        A method to make a result from its description
+        :return: the result
+        """
+        if "list" in result:
+            values = [self._restore(r, directory, project, inputs) for r in result["list"]]
+            return tuple(values) if result["tuple"] else values
+        if "value" in result:
+            return result["value"]
+        if "input" in result:
+            return inputs[result["input"]]
+        if "source" in result:  # the original is restored at the file of the user
+            entry = result["source"]
+            af = Original(entry["path"], entry["title"], pcm_cache=project.get_pcm_cache(),
+                          duration=entry["duration"])
+            af.set_bpm(entry["bpm"])
+            af.set_offset(entry["offset"])
+            project.add_audio(af)
+            return af
+        entry = result["audio"]
+        # the project works on its own copy, so that its edits and sweeps never touch the cache
+        path = clone_file(os.path.join(directory, entry["file"]),
+                          os.path.join(project.get_working_dir().name,
+                                       os.path.basename(directory) + "_" + entry["file"]))
+        original = inputs[entry["original"]] if entry["original"] is not None else None
+        pcm_cache = project.get_pcm_cache()
+        if entry["type"] == AudioFileType.Original.name:
+            af = Original(path, entry["title"], pcm_cache=pcm_cache, duration=entry["duration"])
+        elif entry["type"] == AudioFileType.Stem.name:
+            af = Stem(path, entry["title"], original, description=entry["description"], pcm_cache=pcm_cache,
+                      duration=entry["duration"])
+        elif entry["type"] == AudioFileType.Remix.name:
+            af = Remix(path, original, entry["title"], pcm_cache=pcm_cache, duration=entry["duration"])
+        else:
+            af = AudioFile(path, entry["title"], pcm_cache=pcm_cache, duration=entry["duration"])
+        af.set_bpm(entry["bpm"])
+        af.set_offset(entry["offset"])
+        project.add_audio(af)
+        return af
+
+
+def _flatten(values):
+    """
+    A function to flatten nested lists of values
+    :param values: a list
+    :return: the flat list
+    """
+    flat = []
+    for value in values:
+        flat += _flatten(value) if isinstance(value, (list, tuple)) else [value]
+    return flat
+
+
+def _paths(result, directory):
+    """
+    A function to list the files a memoised result needs: its audio files, and the files an export wrote
+    :return: the list of paths
+    """
+    if "list" in result:
+        return [path for r in result["list"] for path in _paths(r, directory)]
+    if "audio" in result:
+        return [os.path.join(directory, result["audio"]["file"])]
+    if "source" in result:
+        return [result["source"]["path"]]
+    return []
+
+
+def _select(value, stem):
+    """
+    A function to pick an audio file of a list
+    :param value: a list of audio files, e.g. the stems of a split
+    :param stem: the index, the description (e.g. "vocals") or the title of the audio file
+    :return: the audio file
+    """
+    lst = _flatten([value])
+    if isinstance(stem, int):
+        if not -len(lst) <= stem < len(lst):
+            raise Exception("There is no audio file number " + str(stem))
+        return lst[stem]
+    for af in lst:
+        if af.get_type() == AudioFileType.Stem and af.get_description() == stem:
+            return af
+    for af in lst:
+        if af.get_title() == stem or af.get_title().endswith(" " + stem):
+            return af
+    raise Exception("There is no audio file " + str(stem))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("usage: python -m remix.recipe RECIPE", file=sys.stderr)
+        sys.exit(2)
+    recipe = Recipe.load(sys.argv[1])
+    print("running " + ", ".join(recipe.get_stale()) if recipe.get_stale() else "nothing to run", file=sys.stderr)
+    pr, results = recipe.run()
+    for path in _flatten([results[node] for node in recipe.get_nodes() if recipe.get_step(node)["op"] == "export"]):
+        print(path)
+    Scheduler.get_instance().shutdown()
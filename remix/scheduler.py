@@ -0,0 +1,269 @@
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, CancelledError
+
+from remix.workers import default_jobs
+
+CPU = "cpu"  # decoding, DSP and encoding
+IO = "io"  # downloads and file copies
+
+_local = threading.local()
+
+
+def current_job():
+    """
+    A function to get the job running on the current thread
+    :return: the Job object, or None outside of a scheduled job
+    """
+    return getattr(_local, "job", None)
+
+
+def report(fraction, message=None):
+    """
+    A function for long operations to report their progress, and a checkpoint to stop them when their job is
+    cancelled. It does nothing outside of a scheduled job
+    :param fraction: the fraction of the work done, between 0 and 1
+    :param message: an optional description of the current step
+    :return: None
+    """
+    job = current_job()
+    if job is not None:
+        job.set_progress(fraction, message)
+
+
+class Job:
+    """
+    A scheduled operation, holding its progress and its cancellation request
+    """
+    def __init__(self, name, on_progress=None):
+        """
+        The init method of the class
+        :param name: the name of the job
+        :param on_progress: a function called from the worker with (fraction, message) on every progress report
+        """
+        self._name = name
+        self._on_progress = on_progress
+        self._progress = 0.0
+        self._message = None
+        self._cancelled = threading.Event()
+        self._times = [None, None]  # the perf_counter times the job started and ended running
+
+    def get_name(self):
+        """
+        A getter for the job name
+        :return: the job name
+        """
+        return self._name
+
+    def get_progress(self):
+        """
+        A getter for the job progress
+        :return: a (fraction, message) tuple
+        """
+        return self._progress, self._message
+
+    def get_run_time(self):
+        """
+        A getter for the time the job ran, without the time it waited for a worker or for its dependencies
+        :return: the time in seconds, or None if the job has not run to its end
+        """
+        start, end = self._times
+        return None if start is None or end is None else end - start
+
+    def set_progress(self, fraction, message=None):
+        """
+        A method to update the job progress, raising CancelledError if the job was cancelled
+        :param fraction: the fraction of the work done, between 0 and 1
+        :param message: an optional description of the current step
+        :return: None
+        """
+        self.check_cancelled()
+        self._progress = min(max(fraction, 0.0), 1.0)
+        self._message = message
+        if self._on_progress is not None:
+            self._on_progress(self._progress, message)
+
+    def cancel(self):
+        """
+        A method to ask the job to stop at its next checkpoint
+        :return: None
+        """
+        self._cancelled.set()
+
+    def is_cancelled(self):
+        """
+        A method to check whether the job was asked to stop
+        :return: True if the job was cancelled
+        """
+        return self._cancelled.is_set()
+
+    def check_cancelled(self):
+        """
+        A cancellation checkpoint
+        :return: None
+        """
+        if self._cancelled.is_set():
+            raise CancelledError(self._name + " was cancelled")
+
+
+class Scheduler:
+    """
+    A scheduler running operations as jobs on a CPU-bound pool and an I/O-bound pool.
+    A job starts once the jobs it depends on are done, reports its progress through report(), and can be
+    cancelled: before it starts it is dropped, and while it runs it stops at its next report() call.
+    A job must not wait on the result of a job queued after it on the same pool.
+    """
+    _instance = None
+
+    @staticmethod
+    def get_instance():
+        """ Static access method to the shared scheduler. """
+        if Scheduler._instance is None:
+            Scheduler._instance = Scheduler()
+        return Scheduler._instance
+
+    @staticmethod
+    def configure(cpu_workers=None, io_workers=4):
+        """
+        A method to replace the shared scheduler, e.g. to set the number of workers of a headless run
+        :param cpu_workers: the number of CPU-bound jobs running in parallel, the number of CPUs if None
+        :param io_workers: the number of I/O-bound jobs running in parallel
+        :return: the new shared scheduler
+        """
+        if Scheduler._instance is not None:
+            Scheduler._instance.shutdown()
+        Scheduler._instance = Scheduler(cpu_workers, io_workers)
+        return Scheduler._instance
+
+    def __init__(self, cpu_workers=None, io_workers=4):
+        """
+        The init method of the class
+        :param cpu_workers: the number of CPU-bound jobs running in parallel, the number of CPUs if None
+        :param io_workers: the number of I/O-bound jobs running in parallel
+        """
+        self._pools = {CPU: ThreadPoolExecutor(max_workers=cpu_workers or default_jobs(), thread_name_prefix=CPU),
+                       IO: ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix=IO)}
+        self._jobs = dict()  # {future, job} of the jobs not done yet
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args, kind=CPU, depends=(), name=None, on_progress=None, **kwargs) -> Future:
+        """
+        A method to queue an operation
+        :param func: the function to run
+        :param args: the positional arguments of func
+        :param kind: the pool to run the job on, CPU or IO
+        :param depends: the futures of the jobs that must be done before this one starts
+        :param name: the name of the job, the name of func if None
+        :param on_progress: a function called from the worker with (fraction, message) on every progress report
+        :param kwargs: the keyword arguments of func
+        :return: a future of the result of func
+        """
+        if kind not in self._pools:
+            raise ValueError("The kind of a job must be " + CPU + " or " + IO)
+        job = Job(name or getattr(func, "__name__", "job"), on_progress)
+        future = Future()
+        with self._lock:
+            self._jobs[future] = job
+        future.add_done_callback(self._forget)
+        waiting = [dep for dep in depends if not dep.done()]
+        if not waiting:
+            self._start(kind, job, future, func, args, kwargs, depends)
+            return future
+        remaining = [len(waiting)]
+
+        def on_dependency_done(_):
+            with self._lock:
+                remaining[0] -= 1
+                ready = remaining[0] == 0
+            if ready:
+                self._start(kind, job, future, func, args, kwargs, depends)
+
+        for dep in waiting:
+            dep.add_done_callback(on_dependency_done)
+        return future
+
+    def cancel(self, future):
+        """
+        A method to cancel a job, dropping it if it has not started and stopping it at its next checkpoint otherwise
+        :param future: the future of the job
+        :return: None
+        """
+        with self._lock:
+            job = self._jobs.get(future)
+        if job is not None:
+            job.cancel()
+        future.cancel()
+
+    def get_job(self, future):
+        """
+        A method to get the job of a future
+        :param future: the future of the job
+        :return: the Job object, or None if the job is done
+        """
+        with self._lock:
+            return self._jobs.get(future)
+
+    def get_progress(self, future):
+        """
+        A method to get the progress of a job
+        :param future: the future of the job
+        :return: a (fraction, message) tuple, or None if the job is done
+        """
+        job = self.get_job(future)
+        return None if job is None else job.get_progress()
+
+    def shutdown(self, wait=True):
+        """
+        A method to stop the pools once the running jobs are done
+        :param wait: whether to wait for the running jobs
+        :return: None
+        """
+        for pool in self._pools.values():
+            pool.shutdown(wait=wait)
+        if Scheduler._instance is self:
+            Scheduler._instance = None
+
+    def _start(self, kind, job, future, func, args, kwargs, depends):
+        """
+        A method to send a job whose dependencies are done to its pool
+        :return: None
+        """
+        for dep in depends:
+            if dep.cancelled():
+                future.cancel()
+                return
+            if dep.exception() is not None:
+                if future.set_running_or_notify_cancel():
+                    future.set_exception(dep.exception())
+                return
+        self._pools[kind].submit(self._run, job, future, func, args, kwargs)
+
+    @staticmethod
+    def _run(job, future, func, args, kwargs):
+        """
+        The worker side of a job
+        :return: None
+        """
+        if not future.set_running_or_notify_cancel():
+            return
+        _local.job = job
+        job._times[0] = time.perf_counter()
+        try:
+            job.check_cancelled()
+            result = func(*args, **kwargs)
+        except Exception as e:
+            job._times[1] = time.perf_counter()
+            future.set_exception(e)
+        else:
+            job._times[1] = time.perf_counter()
+            future.set_result(result)
+        finally:
+            _local.job = None
+
+    def _forget(self, future):
+        """
+        A method to drop the job of a done future
+        :return: None
+        """
+        with self._lock:
+            self._jobs.pop(future, None)
@@ -0,0 +1,246 @@
+import os
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future
+from importlib import metadata
+
+import numpy as np
+
+from remix.scheduler import report
+from remix.stream import StreamEncoder
+
+SAMPLE_RATE = 44100  # the sampling frequency the separation models expect
+STEM_CONFIGURATIONS = (2, 4, 5)
+CHUNKED_SECS = 600  # audio longer than this is separated chunk by chunk
+
+
+def spleeter_model(stems):
+    """
+    A function to load a pretrained spleeter model
+    :param stems: the number of stems the model separates (2, 4 or 5)
+    :return: a model with a separate(waveform) method returning {stem name: waveform}
+    """
+    from spleeter.separator import Separator  # imports TensorFlow, so only when a model is first needed
+    return Separator("spleeter:" + str(stems) + "stems")
+
+
+def spleeter_version():
+    """
+    A function to get the version of the installed spleeter models, without importing TensorFlow
+    :return: a version string
+    """
+    try:
+        return "spleeter-" + metadata.version("spleeter")
+    except metadata.PackageNotFoundError:
+        return "spleeter"
+
+
+class SeparatorService:
+    """
+    A long-lived stem separation service.
+    Jobs are queued in memory and run by worker threads. A stem configuration's model is loaded the first time a
+    job needs it and kept warm for the following jobs, a single model shared by all the workers.
+    """
+    _instance = None
+
+    @staticmethod
+    def get_instance():
+        """ Static access method to the shared service, using the spleeter models. """
+        if SeparatorService._instance is None:
+            SeparatorService._instance = SeparatorService()
+        return SeparatorService._instance
+
+    @staticmethod
+    def configure(workers=1, model_factory=spleeter_model):
+        """
+        A method to replace the shared service, e.g. to run several jobs at once with models that can separate
+        concurrently
+        :param workers: the number of jobs that can run in parallel
+        :param model_factory: a function that receives a number of stems and returns a model
+        :return: the new shared service
+        """
+        if SeparatorService._instance is not None:
+            SeparatorService._instance.stop()
+        SeparatorService._instance = SeparatorService(model_factory, workers=workers)
+        return SeparatorService._instance
+
+    def __init__(self, model_factory=spleeter_model, model_version=None, workers=1):
+        """
+        The init method of the class
+        :param model_factory: a function that receives a number of stems and returns a model with a
+        separate(waveform) method, e.g. a stand-in model in tests
+        :param model_version: the version of the models, used to key cached separations
+        :param workers: the number of jobs that can run in parallel, sharing the models, so more than one only for
+        models that can separate concurrently
+        """
+        self._model_factory = model_factory
+        if model_version is None:
+            model_version = spleeter_version() if model_factory is spleeter_model else model_factory.__name__
+        self._model_version = model_version
+        self._models = dict()  # {stems: model}, loaded on first use
+        self._models_lock = threading.Lock()
+        self._jobs = queue.Queue()
+        self._threads = [threading.Thread(target=self._run, name="separator-" + str(i), daemon=True)
+                         for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, waveform, stems=2) -> Future:
+        """
+        A method to queue a separation job
+        :param waveform: a float array of shape (frames, 2) sampled at SAMPLE_RATE
+        :param stems: the number of stems to separate into (2, 4 or 5)
+        :return: a future of the {stem name: float array of shape (frames, 2)} dictionary
+        """
+        if stems not in STEM_CONFIGURATIONS:
+            raise ValueError("The audio can only be split into 2, 4 or 5 channels")
+        future = Future()
+        self._jobs.put((future, np.asarray(waveform, dtype=np.float32), stems))
+        return future
+
+    def separate(self, waveform, stems=2):
+        """
+        A method to separate a waveform and wait for the result
+        :param waveform: a float array of shape (frames, 2) sampled at SAMPLE_RATE
+        :param stems: the number of stems to separate into (2, 4 or 5)
+        :return: a {stem name: float array of shape (frames, 2)} dictionary
+        """
+        return self.submit(waveform, stems).result()
+
+    def get_model_version(self):
+        """
+        A getter for the version of the models
+        :return: the version of the models
+        """
+        return self._model_version
+
+    def get_workers(self):
+        """
+        A getter for the number of workers
+        :return: the number of jobs that can run in parallel
+        """
+        return len(self._threads)
+
+    def stop(self):
+        """
+        A method to stop the workers once the queued jobs are done
+        :return: None
+        """
+        for _ in self._threads:
+            self._jobs.put(None)
+        for thread in self._threads:
+            thread.join()
+        if SeparatorService._instance is self:
+            SeparatorService._instance = None
+
+    def _run(self):
+        """
+        The worker loop, running one job at a time
+        :return: None
+        """
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            future, waveform, stems = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = self._model(stems).separate(waveform)
+                future.set_result({name: np.asarray(stem, dtype=np.float32) for name, stem in result.items()})
+            except Exception as e:
+                future.set_exception(e)
+
+    def _model(self, stems):
+        """
+        A method to get the model of a stem configuration, loading it once for all the workers
+        :param stems: the number of stems
+        :return: the model
+        """
+        with self._models_lock:
+            if stems not in self._models:
+                self._models[stems] = self._model_factory(stems)
+            return self._models[stems]
+
+
+def iter_chunks(blocks, chunk_frames, hop_frames):
+    """
+    A generator that regroups PCM blocks into overlapping chunks
+    :param blocks: an iterable of float arrays of shape (frames, channels)
+    :param chunk_frames: the number of frames in each chunk
+    :param hop_frames: the number of frames between the starts of two chunks
+    :return: a generator of float arrays of shape (chunk_frames, channels), the last one possibly shorter
+    """
+    buffer = None
+    emitted = False
+    for block in blocks:
+        buffer = block if buffer is None else np.concatenate([buffer, block])
+        while len(buffer) >= chunk_frames:
+            yield buffer[:chunk_frames]
+            emitted = True
+            buffer = buffer[hop_frames:]
+    if buffer is not None and (not emitted or len(buffer) > chunk_frames - hop_frames):
+        yield buffer
+
+
+def separate_chunked(blocks, stems, output_dir, service, chunk_secs=30, overlap_secs=2, in_flight=None,
+                     total_frames=None):
+    """
+    A function to separate a long audio chunk by chunk, in parallel, with crossfaded seams.
+    The input is read and the stems are written as the chunks complete, so memory is bounded by the chunk size
+    :param blocks: an iterable of float arrays of shape (frames, 2) sampled at SAMPLE_RATE
+    :param stems: the number of stems to separate into (2, 4 or 5)
+    :param output_dir: the directory to write a wav file per stem into
+    :param service: the SeparatorService that separates the chunks
+    :param chunk_secs: the length of each chunk in seconds
+    :param overlap_secs: the length of the crossfade between two chunks in seconds
+    :param in_flight: the maximal number of chunks queued at a time, twice the service workers if None
+    :param total_frames: the length of the audio, to report the progress of a scheduled job
+    :return: a {stem name: wav path} dictionary
+    """
+    chunk = int(chunk_secs * SAMPLE_RATE)
+    overlap = int(overlap_secs * SAMPLE_RATE)
+    if not 0 < overlap < chunk // 2:
+        raise ValueError("The overlap must be shorter than half a chunk")
+    in_flight = in_flight or 2 * service.get_workers()
+    fade_in = (0.5 - 0.5 * np.cos(np.linspace(0, np.pi, overlap, dtype=np.float32)))[:, np.newaxis]
+    encoders = dict()
+    tails = dict()  # {stem name: the end of the previous chunk, to crossfade with the next one}
+    paths = dict()
+    stitched = [0]
+
+    def stitch(result, last):
+        for name, samples in result.items():
+            if name not in encoders:
+                paths[name] = os.path.join(output_dir, name + ".wav")
+                encoders[name] = StreamEncoder(paths[name], SAMPLE_RATE, samples.shape[1], format="wav")
+            tail = tails.get(name)
+            if tail is not None:
+                n = min(len(tail), len(samples))
+                samples = samples.copy()
+                samples[:n] = tail[:n] * (1 - fade_in[:n]) + samples[:n] * fade_in[:n]
+            if last:
+                encoders[name].write(samples)
+            else:
+                encoders[name].write(samples[:-overlap])
+                tails[name] = samples[-overlap:]
+        stitched[0] += chunk - overlap
+        if total_frames:
+            report(stitched[0] / total_frames, "Separating")
+
+    pending = deque()
+    try:
+        for part in iter_chunks(blocks, chunk, chunk - overlap):
+            pending.append(service.submit(part, stems))
+            if len(pending) > in_flight:
+                stitch(pending.popleft().result(), last=False)
+        while pending:
+            future = pending.popleft()
+            stitch(future.result(), last=not pending)
+    finally:
+        for future in pending:
+            future.cancel()
+        for encoder in encoders.values():
+            encoder.close()
+    return paths
@@ -0,0 +1,646 @@
+"""
+A local service running remix operations for other tools on the machine, without the GUI:
+
+    python -m remix.service [--port 8765 | --socket /tmp/remix.sock] [--jobs N] [--warm-stems 4]
+
+The service speaks JSON over HTTP, on a local TCP port or a Unix socket:
+
+    GET    /projects                      the names of the projects
+    POST   /projects                      {"name": ...} creates a project, {"path": ...} opens a saved one
+    GET    /projects/<name>               the audio files of a project, each with a handle
+    POST   /projects/<name>/save          {"path": ...} optional, saves the project
+    POST   /projects/<name>/operations    {"op": "fadein", "audio": handle or [handles], "args": [...],
+                                          "kwargs": {...}} queues an operation, returns its job id
+    GET    /jobs/<id>                     the state of a job, and its result once done
+    GET    /jobs/<id>/events              the progress of a job, one JSON object per line until it is done
+    DELETE /jobs/<id>                     cancels a job
+
+The operations run on the shared scheduler, so models and decoded audio stay warm between requests. The Manager
+is only used under a lock; operations on a project run concurrently with each other, each writing its own output
+files, and a save waits for them to finish and blocks new ones until it is done. The project setters (set_name,
+set_bpm, ...) are not operations of the service. The last finished jobs are kept for their clients, and the handles
+of the audio files removed from their project are dropped.
+
+POST requests must be sent as application/json. On a TCP port, which every local program and web page can reach,
+requests must also name a local Host and carry the token of the run, written to a file only the user can read:
+
+    Authorization: Bearer <token>    or    X-Remix-Token: <token>
+"""
+import argparse
+import hmac
+import itertools
+import json
+import os
+import re
+import secrets
+import socketserver
+import sys
+import threading
+from collections import deque
+from concurrent.futures import CancelledError
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+import numpy as np
+
+from remix.audio import AudioFile
+from remix.manager import Manager
+from remix.scheduler import Scheduler
+from remix.separation import SeparatorService, SAMPLE_RATE
+
+DEFAULT_PORT = 8765
+TOKEN_PATH = os.path.join(str(Path.home()), ".remix", "service_token")  # the token of the TCP service
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "[::1]")  # the Host headers of the requests the TCP service accepts
+FINISHED_JOBS = 100  # the number of finished jobs kept for their clients
+LOCKED_OPERATIONS = ("save", "save_as", "load")  # the operations only the save request runs, under the write lock
+
+
+class ReadWriteLock:
+    """
+    A lock shared by any number of readers or held by a single writer, writers taking precedence
+    """
+    def __init__(self):
+        """
+        The init method of the class
+        """
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    def acquire_read(self):
+        """
+        A method to take the lock as a reader
+        :return: None
+        """
+        with self._cond:
+            while self._writing or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+
+    def release_read(self):
+        """
+        A method to release the lock taken as a reader
+        :return: None
+        """
+        with self._cond:
+            self._readers -= 1
+            if self._readers == 0:
+                self._cond.notify_all()
+
+    def acquire_write(self):
+        """
+        A method to take the lock as the writer
+        :return: None
+        """
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writing or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writing = True
+
+    def release_write(self):
+        """
+        A method to release the lock taken as the writer
+        :return: None
+        """
+        with self._cond:
+            self._writing = False
+            self._cond.notify_all()
+
+
+class RemixService:
+    """
+    The requests of the service, independent of the transport
+    """
+    def __init__(self, manager=None):
+        """
+        The init method of the class
+        :param manager: the Manager of the projects, the shared one if None
+        """
+        self._manager = manager or Manager.get_instance()
+        self._manager_lock = threading.RLock()
+        self._project_locks = dict()  # {project name, ReadWriteLock}
+        self._handles = dict()  # {handle, audio file} of the audio files sent to clients
+        self._handle_of = dict()  # {id of an audio file, its handle}
+        self._handle_ids = itertools.count(1)
+        self._jobs = dict()  # {job id, {"future", "events", "cond", "project", "op"}}
+        self._finished = deque()  # the ids of the finished jobs, the oldest first
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def list_projects(self):
+        """
+        A method to list the projects
+        :return: the list of project names
+        """
+        with self._manager_lock:
+            return self._manager.get_project_names()
+
+    def create_project(self, name):
+        """
+        A method to create a project
+        :param name: the name of the project
+        :return: the description of the project
+        """
+        with self._manager_lock:
+            self._manager.create_project(name)
+        return self.get_project(name)
+
+    def open_project(self, path):
+        """
+        A method to open a project saved on disk
+        :param path: the folder of the project
+        :return: the description of the project
+        """
+        with self._manager_lock:
+            pr = self._manager.load_project(path)
+        return self.get_project(pr.get_name())
+
+    def get_project(self, name):
+        """
+        A method to describe a project
+        :param name: the name of the project
+        :return: a dict of the project settings and audio files
+        """
+        pr = self._project(name)
+        self._prune_handles()
+        lock = self._project_lock(name)
+        lock.acquire_read()
+        try:
+            audios = list({id(af): af for af in pr.get_audio_files() + pr.get_current_mix()}.values())
+            return {"name": pr.get_name(), "path": pr.get_path() if pr.is_saved() else None, "bpm": pr.get_bpm(),
+                    "audio": [self._describe(af) for af in audios]}
+        finally:
+            lock.release_read()
+
+    def save_project(self, name, path=None):
+        """
+        A method to save a project, once the operations running on it are done
+        :param name: the name of the project
+        :param path: the folder to save to, the folder of the project if None
+        :return: the path of the saved project
+        """
+        pr = self._project(name)
+        lock = self._project_lock(name)
+        lock.acquire_write()
+        try:
+            if path:
+                pr.save_as(path)
+            else:
+                pr.save()
+        finally:
+            lock.release_write()
+        with self._manager_lock:
+            self._manager.register(name, pr.get_path())
+        return pr.get_path()
+
+    def submit(self, name, op, audio=None, args=(), kwargs=None):
+        """
+        A method to queue an operation of a project
+        :param name: the name of the project
+        :param op: the name of the Project method
+        :param audio: the handle of the audio file, or a list of handles, passed as the first argument
+        :param args: the other positional arguments
+        :param kwargs: the keyword arguments
+        :return: the job id
+        """
+        pr = self._project(name)
+        # the setters change the project state behind the service, e.g. set_name would rename the project the
+        # Manager lists under its old name
+        if op.startswith(("_", "set_")) or op in LOCKED_OPERATIONS or not callable(getattr(pr, op, None)):
+            raise ValueError("The project has no operation " + op)
+        if isinstance(audio, list):
+            args = [[self._audio(handle) for handle in audio]] + list(args)
+        elif audio is not None:
+            args = [self._audio(audio)] + list(args)
+        job_id = str(next(self._ids))
+        job = {"events": [], "cond": threading.Condition(), "project": name, "op": op}
+
+        def on_progress(fraction, message):
+            self._add_event(job, {"progress": fraction, "message": message})
+
+        with self._lock:
+            self._jobs[job_id] = job
+        job["future"] = Scheduler.get_instance().submit(self._run, pr, name, op, args, kwargs or {},
+                                                        name=name + ": " + op, on_progress=on_progress)
+        job["future"].add_done_callback(lambda future: self._finish(job_id, job))
+        return job_id
+
+    def get_job(self, job_id):
+        """
+        A method to describe a job
+        :param job_id: the job id
+        :return: a dict of the job state, with its result or error once done
+        """
+        job = self._job(job_id)
+        state = {"id": job_id, "project": job["project"], "op": job["op"]}
+        if job["future"].done():
+            state.update(self._result(job["future"]))
+        else:
+            progress = Scheduler.get_instance().get_progress(job["future"]) or (0.0, None)
+            state.update({"done": False, "progress": progress[0], "message": progress[1]})
+        return state
+
+    def iter_events(self, job_id):
+        """
+        A generator of the progress events of a job, the last one being its result
+        :param job_id: the job id
+        :return: a generator of dicts
+        """
+        job = self._job(job_id)
+        sent = 0
+        while True:
+            with job["cond"]:
+                while sent == len(job["events"]):
+                    job["cond"].wait()
+                events = job["events"][sent:]
+            for event in events:
+                yield event
+                if event.get("done"):
+                    return
+            sent += len(events)
+
+    def cancel(self, job_id):
+        """
+        A method to cancel a job
+        :param job_id: the job id
+        :return: the state of the job
+        """
+        Scheduler.get_instance().cancel(self._job(job_id)["future"])
+        return self.get_job(job_id)
+
+    def warm_up(self, stems):
+        """
+        A method to load the separation model the separator workers share before the first request
+        :param stems: the number of stems of the model to load
+        :return: None
+        """
+        SeparatorService.get_instance().separate(np.zeros((SAMPLE_RATE, 2), dtype=np.float32), stems)
+
+    def _run(self, pr, name, op, args, kwargs):
+        """
+        The worker side of an operation, sharing the project with the other operations, whose outputs never share
+        a path with its own
+        :return: the result of the operation
+        """
+        lock = self._project_lock(name)
+        lock.acquire_read()
+        try:
+            return getattr(pr, op)(*args, **kwargs)
+        finally:
+            lock.release_read()
+
+    def _finish(self, job_id, job):
+        """
+        A method to record the outcome of a done job, then drop the oldest finished jobs and the handles of the
+        audio files the job removed from the project
+        :return: None
+        """
+        self._prune_handles()
+        self._add_event(job, self._result(job["future"]))
+        with self._lock:
+            self._finished.append(job_id)
+            while len(self._finished) > FINISHED_JOBS:
+                self._jobs.pop(self._finished.popleft(), None)
+
+    def _prune_handles(self):
+        """
+        A method to drop the handles of the audio files that are no longer in a project
+        :return: None
+        """
+        with self._manager_lock:
+            projects = [pr for pr in self._manager.get_projects().values() if pr is not None]
+            live = {id(af) for pr in projects for af in pr.get_audio_files() + pr.get_current_mix()}
+        with self._lock:
+            for handle, af in list(self._handles.items()):
+                if id(af) not in live:
+                    del self._handles[handle]
+                    del self._handle_of[id(af)]
+
+    def _result(self, future):
+        """
+        A method to describe the outcome of a done job
+        :return: a dict
+        """
+        if future.cancelled():
+            return {"done": True, "cancelled": True}
+        try:
+            return {"done": True, "result": self._to_json(future.result())}
+        except CancelledError:
+            return {"done": True, "cancelled": True}
+        except Exception as e:
+            return {"done": True, "error": str(e)}
+
+    @staticmethod
+    def _add_event(job, event):
+        """
+        A method to record an event of a job and wake the clients following it
+        :return: None
+        """
+        with job["cond"]:
+            if job["events"] and job["events"][-1].get("done"):
+                return
+            job["events"].append(event)
+            job["cond"].notify_all()
+
+    def _to_json(self, value):
+        """
+        A method to turn the result of an operation into JSON values, audio files becoming their descriptions
+        :return: a JSON value
+        """
+        if isinstance(value, AudioFile):
+            return self._describe(value)
+        if isinstance(value, (list, tuple)):
+            return [self._to_json(v) for v in value]
+        if isinstance(value, dict):
+            return {str(k): self._to_json(v) for k, v in value.items()}
+        if isinstance(value, (str, int, float, bool)) or value is None:
+            return value
+        return str(value)
+
+    def _describe(self, af):
+        """
+        A method to describe an audio file, giving it a handle the clients refer to it with
+        :return: a dict
+        """
+        with self._lock:
+            if id(af) not in self._handle_of:
+                handle = "a" + str(next(self._handle_ids))
+                self._handles[handle] = af
+                self._handle_of[id(af)] = handle
+            handle = self._handle_of[id(af)]
+        mins, secs = af.get_duration()
+        return {"handle": handle, "title": af.get_title(), "type": af.get_type().name, "path": af.get_path(),
+                "duration": mins * 60 + secs, "offset": af.get_offset(), "bpm": af.get_bpm()}
+
+    def _audio(self, handle):
+        """
+        A method to get the audio file of a handle
+        :return: the AudioFile object
+        """
+        with self._lock:
+            if handle not in self._handles:
+                raise KeyError("There is no audio file " + str(handle))
+            return self._handles[handle]
+
+    def _project(self, name):
+        """
+        A method to get a project, loading it if needed, as the most recently used one so the decoded audio of the
+        least recently used projects is dropped
+        :return: the Project object
+        """
+        with self._manager_lock:
+            if name not in self._manager.get_project_names():
+                raise KeyError("There is no project " + name)
+            pr = self._manager.get_project(name)
+            self._manager.touch(name)
+            return pr
+
+    def _project_lock(self, name):
+        """
+        A method to get the lock of a project
+        :return: the ReadWriteLock object
+        """
+        with self._lock:
+            return self._project_locks.setdefault(name, ReadWriteLock())
+
+    def _job(self, job_id):
+        """
+        A method to get a job
+        :return: the job dict
+        """
+        with self._lock:
+            if job_id not in self._jobs:
+                raise KeyError("There is no job " + job_id)
+            return self._jobs[job_id]
+
+
+class RequestHandler(BaseHTTPRequestHandler):
+    """
+    The HTTP transport of the service
+    """
+    service = None  # the RemixService, set by serve()
+    token = None  # the token the requests must carry, set by serve() on a TCP port
+    routes = [("GET", r"/projects", "list_projects"),
+              ("POST", r"/projects", "post_projects"),
+              ("GET", r"/projects/([^/]+)", "get_project"),
+              ("POST", r"/projects/([^/]+)/save", "save_project"),
+              ("POST", r"/projects/([^/]+)/operations", "submit"),
+              ("GET", r"/jobs/(\d+)", "get_job"),
+              ("GET", r"/jobs/(\d+)/events", "events"),
+              ("DELETE", r"/jobs/(\d+)", "cancel")]
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    def _dispatch(self, method):
+        """
+        A method to route a request to the service
+        :param method: the HTTP method
+        :return: None
+        """
+        refusal = self._check(method)
+        if refusal is not None:
+            return self._send(*refusal)
+        for route_method, pattern, action in self.routes:
+            match = re.fullmatch(pattern, self.path.rstrip("/"))
+            if match and route_method == method:
+                try:
+                    body = self._read_body() if method == "POST" else {}
+                    args = [unquote(group) for group in match.groups()]
+                    if action == "events":
+                        self.service.get_job(*args)  # an unknown job is reported before the stream starts
+                        return self._stream(self.service.iter_events(*args))
+                    self._send(200, self._call(action, args, body))
+                except KeyError as e:
+                    self._send(404, {"error": e.args[0] if e.args else str(e)})
+                except (ValueError, TypeError) as e:
+                    self._send(400, {"error": str(e)})
+                except Exception as e:
+                    self._send(500, {"error": str(e)})
+                return
+        self._send(404, {"error": "Unknown request " + method + " " + self.path})
+
+    def _check(self, method):
+        """
+        A method to refuse the requests a web page could send: a POST that is not JSON needs no CORS preflight, and
+        a Host that is not local comes from a DNS rebinding. On a TCP port, the request must carry the token
+        :param method: the HTTP method
+        :return: the (status, JSON response) of the refusal, None to serve the request
+        """
+        if method == "POST":
+            content_type = (self.headers.get("Content-Type") or "").split(";")[0].strip().lower()
+            if content_type != "application/json":
+                return 415, {"error": "The request body must be sent as application/json"}
+        if self.token is None:  # a Unix socket
+            return None
+        host = re.sub(r":\d+$", "", self.headers.get("Host") or "").lower()
+        if host not in LOCAL_HOSTS:
+            return 403, {"error": "The service only accepts requests to localhost"}
+        auth = self.headers.get("Authorization") or ""
+        token = auth[len("Bearer "):] if auth.startswith("Bearer ") else self.headers.get("X-Remix-Token") or ""
+        if not hmac.compare_digest(token.encode(), self.token.encode()):
+            return 401, {"error": "The request does not carry the token of the service"}
+        return None
+
+    def _call(self, action, args, body):
+        """
+        A method to run a routed request
+        :return: the JSON response
+        """
+        service = self.service
+        if action == "post_projects":
+            return service.open_project(body["path"]) if "path" in body else service.create_project(body["name"])
+        if action == "save_project":
+            return {"path": service.save_project(*args, body.get("path"))}
+        if action == "submit":
+            return {"job": service.submit(*args, body["op"], body.get("audio"), body.get("args", []),
+                                          body.get("kwargs"))}
+        return getattr(service, action)(*args)
+
+    def _read_body(self):
+        """
+        A method to read the JSON body of a request
+        :return: the decoded body
+        """
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        try:
+            body = json.loads(self.rfile.read(length))
+        except ValueError:
+            raise ValueError("The request body is not JSON")
+        if not isinstance(body, dict):
+            raise ValueError("The request body must be a JSON object")
+        return body
+
+    def _send(self, status, value):
+        """
+        A method to send a JSON response
+        :return: None
+        """
+        data = json.dumps(value).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, events):
+        """
+        A method to send events as they come, one JSON object per line, closing the connection at the end
+        :return: None
+        """
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        for event in events:
+            self.wfile.write(json.dumps(event).encode() + b"\n")
+            self.wfile.flush()
+
+    def address_string(self):
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        sys.stderr.write("remix: " + format % args + "\n")
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    The HTTP server on a Unix socket, which only the local users allowed to open the socket can reach
+    """
+    daemon_threads = True
+
+    def server_bind(self):
+        socketserver.UnixStreamServer.server_bind(self)
+        self.server_name, self.server_port = "localhost", 0
+
+
+def serve(service, host="127.0.0.1", port=DEFAULT_PORT, socket_path=None, token=None):
+    """
+    A function to serve requests until interrupted
+    :param service: the RemixService
+    :param host: the address to listen on, local only by default
+    :param port: the TCP port to listen on
+    :param socket_path: the Unix socket to listen on instead of the TCP port
+    :param token: the token the requests on the TCP port must carry, required unless socket_path is given
+    :return: None
+    """
+    if not socket_path and not token:
+        raise ValueError("The TCP service needs a token")
+    handler = type("Handler", (RequestHandler,), {"service": service, "token": None if socket_path else token})
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = UnixHTTPServer(socket_path, handler)
+    else:
+        server = ThreadingHTTPServer((host, port), handler)
+        server.daemon_threads = True
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+def write_token(path=TOKEN_PATH):
+    """
+    A function to make the token of a run, written to a file only the user can read
+    :param path: the path of the token file
+    :return: the token
+    """
+    token = secrets.token_urlsafe(32)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(path):
+        os.remove(path)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(token)
+    return token
+
+
+def main(argv=None):
+    """
+    The entry point of the service
+    :param argv: the arguments, sys.argv[1:] if None
+    :return: the exit status
+    """
+    parser = argparse.ArgumentParser(prog="remix-service", description="Run remix operations for local tools")
+    parser.add_argument("--host", default="127.0.0.1", help="the address to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="the TCP port to listen on")
+    parser.add_argument("--socket", help="a Unix socket to listen on instead of the TCP port")
+    parser.add_argument("--token-file", default=TOKEN_PATH, help="the file to write the token of the TCP service to")
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="the number of parallel jobs (default: CPUs)")
+    parser.add_argument("--warm-stems", type=int, choices=[2, 4, 5], help="load a separation model at start")
+    args = parser.parse_args(argv)
+    Scheduler.configure(cpu_workers=args.jobs)
+    token = None
+    if not args.socket:
+        token = write_token(args.token_file)
+        sys.stderr.write("remix: the token of the service is in " + args.token_file + "\n")
+    service = RemixService()
+    if args.warm_stems:
+        service.warm_up(args.warm_stems)
+    try:
+        serve(service, args.host, args.port, args.socket, token)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        Scheduler.get_instance().shutdown(wait=False)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
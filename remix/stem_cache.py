@@ -0,0 +1,154 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from remix.files import clone_file
+from remix.pcm import array_to_segment
+
+DEFAULT_CACHE_DIR = os.path.join(str(Path.home()), ".cache", "remix", "stems")
+DEFAULT_MAX_BYTES = 5 * 1024 ** 3
+
+
+class StemCache:
+    """
+    A persistent on-disk cache of separated stems.
+    Entries are keyed by the source PCM, the stem configuration and the model version, and the least recently
+    used entries are evicted once the cache grows past its size cap.
+    """
+    _instance = None
+
+    @staticmethod
+    def get_instance():
+        """ Static access method to the shared cache in the user's cache directory. """
+        if StemCache._instance is None:
+            StemCache._instance = StemCache()
+        return StemCache._instance
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        The init method of the class
+        :param cache_dir: the directory holding the cache entries
+        :param max_bytes: the size cap of the cache in bytes
+        """
+        self._cache_dir = cache_dir
+        self._max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(waveform, stems, model_version):
+        """
+        A method to compute the key of a separation
+        :param waveform: the float array given to the separation model, or an iterable of its blocks
+        :param stems: the number of stems
+        :param model_version: the version of the separation model
+        :return: a hex digest
+        """
+        digest = hashlib.sha256()
+        for block in [waveform] if hasattr(waveform, "tobytes") else waveform:
+            digest.update(np.ascontiguousarray(block, dtype=np.float32).tobytes())
+        digest.update(("/" + str(stems) + "/" + str(model_version)).encode())
+        return digest.hexdigest()
+
+    def get(self, key):
+        """
+        A method to look up the stems of a separation and mark them as recently used
+        :param key: the separation key
+        :return: a {stem name: wav path} dictionary, or None if the separation is not cached
+        """
+        entry = os.path.join(self._cache_dir, key)
+        try:
+            names = os.listdir(entry)
+            os.utime(entry)
+        except FileNotFoundError:
+            return None
+        return {os.path.splitext(name)[0]: os.path.join(entry, name) for name in sorted(names)}
+
+    def put(self, key, stems, frame_rate):
+        """
+        A method to store the stems of a separation
+        :param key: the separation key
+        :param stems: a {stem name: float array of shape (frames, channels)} dictionary
+        :param frame_rate: the sampling frequency of the stems
+        :return: a {stem name: wav path} dictionary
+        """
+        tmp = self.reserve()
+        for name, samples in stems.items():
+            array_to_segment(samples, frame_rate).export(os.path.join(tmp, name + ".wav"), format="wav")
+        return self.commit(key, tmp)
+
+    def reserve(self):
+        """
+        A method to create a private directory to write the stems of a new entry into
+        :return: the path of the directory
+        """
+        return tempfile.mkdtemp(dir=self._cache_dir, prefix=".tmp")
+
+    def commit(self, key, tmp):
+        """
+        A method to turn a reserved directory of wav stems into the entry of a separation
+        :param key: the separation key
+        :param tmp: the reserved directory
+        :return: a {stem name: wav path} dictionary
+        """
+        entry = os.path.join(self._cache_dir, key)
+        try:
+            os.rename(tmp, entry)  # atomic, so readers never see a partial entry
+        except OSError:  # stored concurrently by another split
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.evict(keep=entry)
+        return self.get(key)
+
+    def copy_to(self, key, output_path):
+        """
+        A method to place the cached stems of a separation in a directory
+        :param key: the separation key
+        :param output_path: the directory to place the stems in
+        :return: a {stem name: wav path} dictionary of the placed stems, or None if the separation is not cached
+        """
+        cached = self.get(key)
+        if cached is None:
+            return None
+        os.makedirs(output_path, exist_ok=True)
+        return {name: clone_file(path, os.path.join(output_path, os.path.basename(path)))
+                for name, path in cached.items()}
+
+    def size(self):
+        """
+        A method to get the size of the cache
+        :return: the size in bytes
+        """
+        return sum(size for _, _, size in self._entries())
+
+    def evict(self, keep=None):
+        """
+        A method to remove the least recently used entries until the cache fits its size cap
+        :param keep: the path of an entry that must not be removed
+        :return: None
+        """
+        entries = sorted(self._entries())
+        total = sum(size for _, _, size in entries)
+        for _, entry, size in entries:
+            if total <= self._max_bytes:
+                break
+            if entry == keep:
+                continue
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def _entries(self):
+        """
+        A method to list the cache entries
+        :return: a list of (last use time, path, size) tuples
+        """
+        entries = []
+        for name in os.listdir(self._cache_dir):
+            entry = os.path.join(self._cache_dir, name)
+            if name.startswith(".") or not os.path.isdir(entry):
+                continue
+            size = sum(f.stat().st_size for f in os.scandir(entry))
+            entries.append((os.stat(entry).st_mtime, entry, size))
+        return entries
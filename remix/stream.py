@@ -0,0 +1,223 @@
+import os
+import subprocess
+import wave
+
+import numpy as np
+from pydub import AudioSegment
+from pydub.utils import mediainfo
+
+from remix.pcm import segment_to_array
+
+MUXERS = {"m4a": "ipod", "aac": "adts"}  # {file extension, ffmpeg muxer} where they differ
+
+
+def muxer(format):
+    """
+    A function to get the ffmpeg muxer writing a file format
+    :param format: the format, e.g. a file extension without the dot
+    :return: the ffmpeg muxer name
+    """
+    return MUXERS.get(format, format)
+
+
+def iter_segment_blocks(sound: AudioSegment, block_frames):
+    """
+    A generator over the float PCM of an audio segment, one block at a time
+    :param sound: an AudioSegment object
+    :param block_frames: the number of frames in each block
+    :return: a generator of float32 arrays of shape (frames, channels)
+    """
+    frame_width = sound.frame_width
+    data = sound.raw_data
+    for start in range(0, len(data), block_frames * frame_width):
+        yield segment_to_array(sound._spawn(data[start: start + block_frames * frame_width]))
+
+
+def iter_silence_blocks(frames, channels, block_frames):
+    """
+    A generator of silent PCM blocks, allocating a single block
+    :param frames: the total number of frames
+    :param channels: the number of channels
+    :param block_frames: the number of frames in each block
+    :return: a generator of float32 arrays of shape (block_frames, channels), the last one possibly shorter
+    """
+    block = np.zeros((min(frames, block_frames), channels), dtype=np.float32)
+    for start in range(0, frames, block_frames):
+        yield block[:min(block_frames, frames - start)]
+
+
+def iter_file_blocks(path, block_frames, frame_rate=None, channels=None):
+    """
+    A generator over the float PCM of an audio file, decoded by ffmpeg one block at a time
+    :param path: the path to the audio file
+    :param block_frames: the number of frames in each block
+    :param frame_rate: the sampling frequency to decode to, the native one if None
+    :param channels: the number of channels to decode to, the native number if None
+    :return: a generator of float32 arrays of shape (frames, channels)
+    """
+    wav = _open_wav(path, frame_rate, channels)
+    if wav is not None:  # already in the requested format, read without starting a decoder
+        with wav:
+            while True:
+                data = wav.readframes(block_frames)
+                if not data:
+                    break
+                yield np.frombuffer(data, dtype="<i2").reshape(-1, wav.getnchannels()).astype(np.float32) / 32768
+        return
+    frame_rate, channels = probe_format(path, frame_rate, channels)
+    cmd = [AudioSegment.converter, "-v", "error", "-i", path, "-f", "f32le", "-ac", str(channels),
+           "-ar", str(frame_rate), "-"]
+    block_bytes = block_frames * channels * 4
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stdin=subprocess.DEVNULL) as proc:
+        while True:
+            data = proc.stdout.read(block_bytes)
+            if not data:
+                break
+            data = data[:len(data) - len(data) % (channels * 4)]
+            yield np.frombuffer(data, dtype=np.float32).reshape(-1, channels)
+    if proc.returncode != 0:
+        raise Exception("Decoding " + path + " failed")
+
+
+def _open_wav(path, frame_rate=None, channels=None):
+    """
+    A function to open a 16-bit wav file that needs no conversion
+    :param path: the path to the audio file
+    :param frame_rate: the sampling frequency to decode to, any if None
+    :param channels: the number of channels to decode to, any if None
+    :return: the opened wave reader, or None if the file is not such a wav file
+    """
+    if not path.lower().endswith(".wav"):
+        return None
+    try:
+        wav = wave.open(path, "rb")
+    except (wave.Error, EOFError):  # e.g. a float or extensible wav, left to ffmpeg
+        return None
+    if wav.getsampwidth() != 2 or frame_rate not in (None, wav.getframerate()) \
+            or channels not in (None, wav.getnchannels()):
+        wav.close()
+        return None
+    return wav
+
+
+def probe_format(path, frame_rate=None, channels=None):
+    """
+    A function to get the sampling frequency and number of channels of an audio file
+    :param path: the path to the audio file
+    :param frame_rate: the sampling frequency, probed if None
+    :param channels: the number of channels, probed if None
+    :return: frame_rate, channels
+    """
+    if frame_rate is None or channels is None:
+        info = mediainfo(path)
+        frame_rate = frame_rate or int(info["sample_rate"])
+        channels = channels or int(info["channels"])
+    return frame_rate, channels
+
+
+class BlockReader:
+    """
+    A class that reads PCM blocks as runs of any number of frames, holding at most one block at a time
+    """
+    def __init__(self, blocks, channels):
+        """
+        The init method of the class
+        :param blocks: an iterable of float arrays of shape (frames, channels), e.g. from iter_file_blocks
+        :param channels: the number of channels of the blocks
+        """
+        self._blocks = iter(blocks)
+        self._channels = channels
+        self._buffer = np.zeros((0, channels), dtype=np.float32)
+
+    def read(self, frames):
+        """
+        A method to read the next frames
+        :param frames: the number of frames to read
+        :return: a float32 array of shape (frames, channels), shorter at the end of the blocks
+        """
+        parts = []
+        while frames > 0:
+            if not len(self._buffer):
+                block = next(self._blocks, None)
+                if block is None:
+                    break
+                self._buffer = block
+            parts.append(self._buffer[:frames])
+            frames -= len(parts[-1])
+            self._buffer = self._buffer[len(parts[-1]):]
+        if not parts:
+            return np.zeros((0, self._channels), dtype=np.float32)
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def close(self):
+        """
+        A method to stop reading, e.g. to stop the decoder of a file
+        :return: None
+        """
+        if hasattr(self._blocks, "close"):
+            self._blocks.close()
+
+
+class StreamEncoder:
+    """
+    A class that writes float PCM blocks to an audio file as they are produced
+    """
+    def __init__(self, output_path, frame_rate, channels, format=None, bitrate=None):
+        """
+        The init method of the class
+        :param output_path: the path of the file to write
+        :param frame_rate: the sampling frequency of the blocks
+        :param channels: the number of channels of the blocks
+        :param format: the format of the output, taken from the output_path extension if None
+        :param bitrate: the bitrate of lossy formats, e.g. "320k"
+        """
+        if format is None:
+            format = os.path.splitext(output_path)[1][1:].lower() or "wav"
+        self._format = format
+        self._channels = channels
+        self._wav = None
+        self._proc = None
+        if format == "wav":
+            self._wav = wave.open(output_path, "wb")
+            self._wav.setnchannels(channels)
+            self._wav.setsampwidth(2)
+            self._wav.setframerate(frame_rate)
+        else:
+            cmd = [AudioSegment.converter, "-y", "-v", "error", "-f", "f32le", "-ar", str(frame_rate),
+                   "-ac", str(channels), "-i", "-"]
+            cmd += ["-f", muxer(format)]
+            if bitrate:
+                cmd += ["-b:a", bitrate]
+            cmd.append(output_path)
+            self._proc = subprocess.Popen(cmd, stdin=subprocess.PIPE)
+
+    def write(self, block):
+        """
+        A method to append a block to the output file
+        :param block: a float array of shape (frames, channels)
+        :return: None
+        """
+        block = np.asarray(block, dtype=np.float32).reshape(-1, self._channels)
+        if self._wav is not None:
+            ints = np.clip(np.rint(block * 32768), -32768, 32767).astype(np.int16)
+            self._wav.writeframes(ints.tobytes())
+        else:
+            self._proc.stdin.write(np.clip(block, -1, 1).tobytes())
+
+    def close(self):
+        """
+        A method to finish the output file
+        :return: None
+        """
+        if self._wav is not None:
+            self._wav.close()
+        else:
+            self._proc.stdin.close()
+            if self._proc.wait() != 0:
+                raise Exception("Encoding to " + self._format + " failed")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
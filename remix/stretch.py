@@ -0,0 +1,241 @@
+import math
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def default_frame_size(frame_rate):
+    """
+    A function to choose the STFT size for a sampling frequency (about 93 ms of audio per frame)
+    :param frame_rate: the sampling frequency of the audio
+    :return: a power of two frame size
+    """
+    return 2 ** int(round(math.log2(frame_rate * 0.093)))
+
+
+def _hann(n_fft):
+    """
+    A function to build a periodic Hann window
+    :param n_fft: the window length
+    :return: the window
+    """
+    return np.hanning(n_fft + 1)[:-1].astype(np.float32)
+
+
+def _stft(x, window, hop):
+    """
+    A function to compute the STFT of every channel
+    :param x: an array of shape (channels, samples)
+    :param window: the analysis window
+    :param hop: the number of samples between frames
+    :return: a complex array of shape (channels, frames, bins)
+    """
+    frames = sliding_window_view(x, len(window), axis=-1)[:, ::hop]
+    return np.fft.rfft(frames * window, axis=-1)
+
+
+def _overlap_add(frames, hop, out, norm, window):
+    """
+    A function to overlap-add windowed frames into an output buffer, keeping the squared window sum
+    :param frames: an array of shape (channels, frames, n_fft)
+    :param hop: the number of samples between frames
+    :param out: an array of shape (channels, (frames - 1) * hop + n_fft) to add into
+    :param norm: an array of shape ((frames - 1) * hop + n_fft,) to add the squared window into
+    :param window: the synthesis window
+    :return: None
+    """
+    n_fft = len(window)
+    channels, n_frames = frames.shape[:2]
+    square = np.broadcast_to(window ** 2, (n_frames, n_fft))
+    for i in range(n_fft // hop):  # overlap-add one hop-sized slice of every frame at a time
+        part = slice(i * hop, (i + 1) * hop)
+        out[:, i * hop: i * hop + n_frames * hop] += frames[:, :, part].reshape(channels, -1)
+        norm[i * hop: i * hop + n_frames * hop] += square[:, part].reshape(-1)
+
+
+def _phase_vocoder(spec, steps, hop, phase=None):
+    """
+    A function to resample a spectrogram in time while keeping the phase advance of every bin
+    :param spec: a complex array of shape (channels, frames, bins)
+    :param steps: the fractional frame positions to synthesise, relative to the first frame of spec
+    :param hop: the number of samples between frames
+    :param phase: the phase of the first synthesised frame, taken from spec if None
+    :return: the synthesised spectrogram and the phase of the frame that follows it
+    """
+    bins = spec.shape[-1]
+    n_fft = 2 * (bins - 1)
+    idx = steps.astype(int)
+    alpha = (steps - idx)[np.newaxis, :, np.newaxis]
+    left = spec[:, idx]
+    right = spec[:, idx + 1]
+    mag = (1 - alpha) * np.abs(left) + alpha * np.abs(right)
+
+    phi_advance = 2 * np.pi * hop * np.arange(bins) / n_fft
+    dphi = np.angle(right) - np.angle(left) - phi_advance
+    dphi -= 2 * np.pi * np.round(dphi / (2 * np.pi))
+    dphi += phi_advance
+    if phase is None:
+        phase = np.angle(left[:, 0])
+    acc = phase[:, np.newaxis] + np.cumsum(dphi, axis=1)
+    phases = np.concatenate([phase[:, np.newaxis], acc[:, :-1]], axis=1)
+    return mag * np.exp(1j * phases), np.mod(acc[:, -1], 2 * np.pi)
+
+
+class Stretcher:
+    """
+    A streaming phase vocoder that changes the tempo of PCM block by block.
+    Phase and overlap-add state are carried across blocks, so the output does not depend on the block size
+    and memory is bounded by the block size rather than the length of the audio.
+    """
+    def __init__(self, rate, channels, frame_rate=44100, n_fft=None, mid_side=True):
+        """
+        The init method of the class
+        :param rate: the speed ratio (2.0 is twice as fast, 0.5 is twice as slow)
+        :param channels: the number of channels of the input
+        :param frame_rate: the sampling frequency of the input
+        :param n_fft: the STFT size, chosen from frame_rate if None
+        :param mid_side: whether a stereo signal is stretched as mid/side instead of left/right
+        """
+        if rate <= 0:
+            raise ValueError("The speed ratio must be positive")
+        self._rate = rate
+        self._channels = channels
+        self._n_fft = n_fft or default_frame_size(frame_rate)
+        self._hop = self._n_fft // 4
+        self._window = _hann(self._n_fft)
+        self._mid_side = mid_side and channels == 2
+        self._pad = self._n_fft // 2
+
+        self._buffer = np.zeros((channels, self._pad))  # input, starting at frame self._buffer_frame
+        self._buffer_frame = 0
+        self._step = 0  # index of the next output frame
+        self._phase = None
+        self._tail = np.zeros((channels, self._n_fft - self._hop))  # overlap-add of unfinished output
+        self._tail_norm = np.zeros(self._n_fft - self._hop)
+        self._skip = self._pad  # output samples that only cover the leading padding
+        self._samples_in = 0
+        self._samples_out = 0
+
+    def process(self, block):
+        """
+        A method to feed a block of input
+        :param block: a float array of shape (frames, channels)
+        :return: the output that is complete so far, a float32 array of shape (frames, channels)
+        """
+        block = np.asarray(block, dtype=np.float64).reshape(-1, self._channels).T
+        if self._mid_side:
+            block = np.stack([block[0] + block[1], block[0] - block[1]]) * 0.5
+        self._samples_in += block.shape[1]
+        self._buffer = np.concatenate([self._buffer, block], axis=1)
+        out = self._finish(self._synthesise())
+        self._samples_out += len(out)
+        return out
+
+    def flush(self):
+        """
+        A method to end the stream
+        :return: the remaining output, a float32 array of shape (frames, channels)
+        """
+        self._buffer = np.concatenate([self._buffer, np.zeros((self._channels, self._pad + self._n_fft))], axis=1)
+        out = self._synthesise()
+        out = np.concatenate([out, self._tail / np.where(self._tail_norm > 1e-8, self._tail_norm, 1.0)], axis=1)
+        self._tail[:] = 0
+        self._tail_norm[:] = 0
+        out = self._finish(out)
+
+        length = int(round(self._samples_in / self._rate)) - self._samples_out
+        out = out[:max(length, 0)]
+        if len(out) < length:
+            out = np.concatenate([out, np.zeros((length - len(out), self._channels), dtype=np.float32)])
+        self._samples_out += len(out)
+        return out
+
+    def _synthesise(self):
+        """
+        A method to synthesise every output frame whose input frames are buffered
+        :return: the completed output samples, an array of shape (channels, samples)
+        """
+        n_fft, hop = self._n_fft, self._hop
+        buffered = (self._buffer.shape[1] - n_fft) // hop + 1
+        last_frame = self._buffer_frame + buffered - 1
+        if buffered < 2:
+            return np.zeros((self._channels, 0))
+        steps = np.arange(self._step, int(math.ceil(last_frame / self._rate)) + 1) * self._rate
+        steps = steps[steps.astype(int) + 1 <= last_frame]
+        if len(steps) == 0:
+            return np.zeros((self._channels, 0))
+
+        first = int(steps[0])
+        end = int(steps[-1]) + 1
+        start = (first - self._buffer_frame) * hop
+        spec = _stft(self._buffer[:, start: (end - self._buffer_frame) * hop + n_fft], self._window, hop)
+        out_spec, self._phase = _phase_vocoder(spec, steps - first, hop, self._phase)
+        self._step += len(steps)
+
+        keep = int(self._step * self._rate)  # first input frame still needed
+        self._buffer = self._buffer[:, (keep - self._buffer_frame) * hop:]
+        self._buffer_frame = keep
+
+        frames = np.fft.irfft(out_spec, n=n_fft, axis=-1) * self._window
+        done = len(steps) * hop
+        out = np.zeros((self._channels, done + n_fft - hop))
+        norm = np.zeros(done + n_fft - hop)
+        out[:, :n_fft - hop] += self._tail
+        norm[:n_fft - hop] += self._tail_norm
+        _overlap_add(frames, hop, out, norm, self._window)
+        self._tail = out[:, done:]
+        self._tail_norm = norm[done:]
+        return out[:, :done] / np.where(norm[:done] > 1e-8, norm[:done], 1.0)
+
+    def _finish(self, out):
+        """
+        A method to drop the output of the leading padding and undo the mid/side transform
+        :param out: an array of shape (channels, samples)
+        :return: a float32 array of shape (samples, channels)
+        """
+        skip = min(self._skip, out.shape[1])
+        self._skip -= skip
+        out = out[:, skip:]
+        if self._mid_side:
+            out = np.stack([out[0] + out[1], out[0] - out[1]])
+        return out.T.astype(np.float32)
+
+
+def time_stretch(samples, rate, frame_rate=44100, n_fft=None, mid_side=True):
+    """
+    A function to change the tempo of PCM without changing its pitch, at its native sampling frequency
+    :param samples: a float array of shape (frames, channels) or (frames,)
+    :param rate: the speed ratio (2.0 is twice as fast, 0.5 is twice as slow)
+    :param frame_rate: the sampling frequency of the samples
+    :param n_fft: the STFT size, chosen from frame_rate if None
+    :param mid_side: whether a stereo signal is stretched as mid/side instead of left/right
+    :return: a float32 array of shape (round(frames / rate), channels)
+    """
+    if rate <= 0:
+        raise ValueError("The speed ratio must be positive")
+    samples = np.asarray(samples, dtype=np.float32)
+    if samples.ndim == 1:
+        samples = samples[:, np.newaxis]
+    if rate == 1:
+        return samples.copy()
+    stretcher = Stretcher(rate, samples.shape[1], frame_rate, n_fft, mid_side)
+    return np.concatenate([stretcher.process(samples), stretcher.flush()])
+
+
+def stream_stretch(blocks, rate, channels, frame_rate=44100, n_fft=None, mid_side=True):
+    """
+    A generator to change the tempo of a stream of PCM blocks
+    :param blocks: an iterable of float arrays of shape (frames, channels)
+    :param rate: the speed ratio (2.0 is twice as fast, 0.5 is twice as slow)
+    :param channels: the number of channels of the blocks
+    :param frame_rate: the sampling frequency of the blocks
+    :param n_fft: the STFT size, chosen from frame_rate if None
+    :param mid_side: whether a stereo signal is stretched as mid/side instead of left/right
+    :return: a generator of stretched float32 blocks of shape (frames, channels)
+    """
+    stretcher = Stretcher(rate, channels, frame_rate, n_fft, mid_side)
+    for block in blocks:
+        out = stretcher.process(block)
+        if len(out):
+            yield out
+    yield stretcher.flush()
@@ -0,0 +1,98 @@
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from PIL import Image
+
+THUMBNAIL_CACHE_DIR = os.path.join(str(Path.home()), ".cache", "remix", "thumbnails")
+THUMBNAIL_SIZE = (180, 180)  # the size of the thumbnails in the side menu
+
+
+def fetch_url(url):
+    """
+    A function to download the content of a url
+    :param url: a url
+    :return: the content
+    """
+    with urllib.request.urlopen(url, timeout=30) as response:
+        return response.read()
+
+
+class ThumbnailCache:
+    """
+    A content-addressed cache of thumbnails resized to their display size.
+    Images are fetched and resized on a background pool, so imports never wait on image I/O.
+    """
+    _instance = None
+
+    @staticmethod
+    def get_instance():
+        """ Static access method to the shared cache in the user's cache directory. """
+        if ThumbnailCache._instance is None:
+            ThumbnailCache._instance = ThumbnailCache()
+        return ThumbnailCache._instance
+
+    def __init__(self, cache_dir=THUMBNAIL_CACHE_DIR, size=THUMBNAIL_SIZE, workers=4, fetch=fetch_url):
+        """
+        The init method of the class
+        :param cache_dir: the directory holding the thumbnails
+        :param size: the (width, height) of the thumbnails
+        :param workers: the number of images fetched in parallel
+        :param fetch: a function that receives a url and returns its content
+        """
+        self._cache_dir = cache_dir
+        self._size = size
+        self._fetch = fetch
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thumbnails")
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._index_path = os.path.join(cache_dir, "index.json")
+        try:
+            with open(self._index_path) as f:
+                self._index = json.load(f)  # {url: thumbnail file name}
+        except (OSError, ValueError):
+            self._index = dict()
+
+    def submit(self, url, then=None):
+        """
+        A method to get the thumbnail of an image url in the background
+        :param url: the url of the image
+        :param then: a function to call in the background with the path of the thumbnail
+        :return: a future of the path of the resized thumbnail, or of the result of then
+        """
+        if then is None:
+            return self._pool.submit(self.get, url)
+        return self._pool.submit(lambda: then(self.get(url)))
+
+    def get(self, url):
+        """
+        A method to get the thumbnail of an image url, fetching and resizing it if it is not cached
+        :param url: the url of the image
+        :return: the path of the resized thumbnail
+        """
+        name = self._index.get(url)
+        if name is not None and os.path.exists(os.path.join(self._cache_dir, name)):
+            return os.path.join(self._cache_dir, name)
+        content = self._fetch(url)
+        name = hashlib.sha1(content).hexdigest() + "_" + str(self._size[0]) + "x" + str(self._size[1]) + ".png"
+        path = os.path.join(self._cache_dir, name)
+        if not os.path.exists(path):  # the same image may be behind several urls
+            img = Image.open(io.BytesIO(content))
+            img = img.convert("RGB").resize(self._size, Image.LANCZOS)
+            fd, tmp = tempfile.mkstemp(dir=self._cache_dir, suffix=".png")
+            os.close(fd)
+            img.save(tmp, format="PNG")
+            os.replace(tmp, path)
+        with self._lock:
+            self._index[url] = name
+            fd, tmp = tempfile.mkstemp(dir=self._cache_dir, suffix=".json")
+            with os.fdopen(fd, "w") as f:
+                json.dump(self._index, f)
+            os.replace(tmp, self._index_path)
+        return path
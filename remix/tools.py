@@ -1,7 +1,10 @@
+import functools
+import itertools
+import json
 import shutil
 import tempfile
-from scipy.io import wavfile
-import librosa
+import threading
+from pathlib import Path
 
 import pydub
 import validators
@@ -9,82 +12,212 @@ import os
 
 import wget as wget
 import youtube_dl
+from youtube_dl.extractor import gen_extractor_classes
 from PIL import Image
 
 import remix.bpm
 import remix.onset
+import remix.pcm
+import remix.stream
+import remix.stretch
 from remix.audio import *
+from remix.envelope import Envelope, db_to_gain
+from remix.separation import SeparatorService, separate_chunked, SAMPLE_RATE, STEM_CONFIGURATIONS, CHUNKED_SECS
+from remix.scheduler import current_job, report
+from remix.stem_cache import StemCache
+from remix.files import clone_file
+from remix.workers import parallel_map
+
+IMPORT_CACHE_DIR = os.path.join(str(Path.home()), ".cache", "remix", "imports")
+EXPORT_FORMATS = ["mp3", "mp4", "wav", "m4a"]
 
 
 class Tools:
     """A static library holding different tools to process audios."""
 
     @staticmethod
-    def split_audio(audiofile: AudioFile, output_path=None, output_stem_num=2):
+    def split_audio(audiofile: AudioFile, output_path=None, output_stem_num=2, service=None, cache=None,
+                    chunk_secs=None):
         """
         This function splits an original audio into stems
         :param audiofile: the original audiofile
         :param output_path: the path where the stems are located after separation
         :param output_stem_num: the number of channels to split the audio into
+        :param service: the SeparatorService to run the separation, the shared one if None
+        :param cache: the StemCache of previous separations, the shared one if None
+        :param chunk_secs: if given, the audio is separated in parallel chunks of this length, which bounds memory:
+        the file is decoded and resampled one block at a time. Audio longer than CHUNKED_SECS is always separated in
+        chunks
         :return: a list of stems
         """
-        if output_stem_num != 2 and output_stem_num != 4 and output_stem_num != 5:
+        if output_stem_num not in STEM_CONFIGURATIONS:
             print("The audio can only be split into 2, 4 or 5 channels")
             return None
         title, ext = os.path.splitext(os.path.basename(audiofile.get_path()))
         if output_path is None:
             output_path = os.path.dirname(audiofile.get_path())
-        cmd = "spleeter separate -o " + output_path + " -p spleeter:" + str(
-            output_stem_num) + "stems " + '"' + audiofile.get_path() + '"'
-        curr_dir = os.getcwd()
-        os.chdir(output_path)  # change current directory to given path
-        os.system(cmd)
-        orig = Original(audiofile.get_path())
-        audio_lst = []
+        if service is None:
+            service = SeparatorService.get_instance()
+        if cache is None:
+            cache = StemCache.get_instance()
+        mins, secs = audiofile.get_duration()
+        if chunk_secs is None and mins * 60 + secs > CHUNKED_SECS:
+            chunk_secs = 30
+        if chunk_secs:
+            if audiofile.is_modified():  # the edited track is in memory anyway
+                track = audiofile.get_track().set_frame_rate(SAMPLE_RATE).set_channels(2)
+                blocks = functools.partial(remix.stream.iter_segment_blocks, track, SAMPLE_RATE)
+                total_frames = int(track.frame_count())
+            else:  # read twice, to key the separation then to separate it
+                blocks = functools.partial(remix.stream.iter_file_blocks, audiofile.get_path(), SAMPLE_RATE,
+                                           SAMPLE_RATE, 2)
+                total_frames = int((mins * 60 + secs) * SAMPLE_RATE)
+            key = StemCache.key(blocks(), output_stem_num, service.get_model_version())
+        else:
+            waveform = remix.pcm.segment_to_array(audiofile.get_track().set_frame_rate(SAMPLE_RATE).set_channels(2))
+            key = StemCache.key(waveform, output_stem_num, service.get_model_version())
+
         path = os.path.join(output_path, title)
-        if not os.path.exists(path):
-            raise Exception("Split Failed. Check your connection and retry")
-        for audiofile in os.listdir(path):  # audiofile = "vocals.wav", accompaniment.wav
-            split = audiofile.split('.')
-            audio_title = title + " " + split[0]
-            audio1 = Stem(os.path.join(path, audiofile), title=audio_title, original=orig)
-            audio_lst.append(audio1)
-        os.chdir(curr_dir)
+        stem_paths = cache.copy_to(key, path)
+        if stem_paths is None:
+            if chunk_secs:
+                tmp = cache.reserve()
+                try:
+                    separate_chunked(blocks(), output_stem_num, tmp, service, chunk_secs, total_frames=total_frames)
+                except Exception:
+                    shutil.rmtree(tmp, ignore_errors=True)
+                    raise
+                cache.commit(key, tmp)
+            else:
+                cache.put(key, service.separate(waveform, output_stem_num), SAMPLE_RATE)
+            stem_paths = cache.copy_to(key, path)
+        audio_lst = []
+        for name, stem_path in stem_paths.items():  # name = "vocals", "accompaniment"
+            audio_lst.append(Stem(stem_path, title=title + " " + name, original=audiofile, description=name))
         return audio_lst
 
     @staticmethod
-    def download_from_youtube(url, working_dir):
+    def split_audio_excerpt(audiofile: AudioFile, output_path, output_stem_num=2, start_secs=0, length_secs=30,
+                            service=None):
         """
-        This function downloads a video from YouTube
-        :param url: link to a video from YouTube
-        :return: if url is valid (title, path to downloaded file, path to thumbnail), otherwise None
+        This function splits only an excerpt of an audio into stems, to quickly hear how it separates
+        :param audiofile: the original audiofile
+        :param output_path: the path where the preview stems are located after separation
+        :param output_stem_num: the number of channels to split the audio into
+        :param start_secs: the second at which the excerpt starts
+        :param length_secs: the length of the excerpt in seconds
+        :param service: the SeparatorService to run the separation, the shared one if None
+        :return: a list of preview stems
         """
-        if not Tools.check_url(url):
+        if output_stem_num not in STEM_CONFIGURATIONS:
+            print("The audio can only be split into 2, 4 or 5 channels")
             return None
-        ydl_opts = {
-            'format': 'bestaudio/best',
-            'outtmpl': working_dir + '/%(title)s.%(ext)s',  # output name template
+        if service is None:
+            service = SeparatorService.get_instance()
+        title, ext = os.path.splitext(os.path.basename(audiofile.get_path()))
+        excerpt = audiofile.get_track()[start_secs * 1000:(start_secs + length_secs) * 1000]
+        excerpt = excerpt.set_frame_rate(SAMPLE_RATE).set_channels(2)
+        stems = service.separate(remix.pcm.segment_to_array(excerpt), output_stem_num)
 
-            'postprocessors': [{
-                'key': 'FFmpegExtractAudio',
-                'preferredcodec': 'mp3',
-                'preferredquality': '192',
-            }],
-        }
+        path = os.path.join(output_path, title + " preview " + str(output_stem_num) + " " + str(start_secs))
+        os.makedirs(path, exist_ok=True)
+        audio_lst = []
+        for name, samples in stems.items():
+            stem_path = os.path.join(path, name + ".wav")
+            remix.pcm.array_to_segment(samples, SAMPLE_RATE).export(stem_path, format="wav")
+            audio_lst.append(Stem(stem_path, title=title + " " + name + " preview", original=audiofile,
+                                  description=name))
+        return audio_lst
 
+    @staticmethod
+    def download_from_youtube(url, working_dir, ydl_factory=None, cache_dir=IMPORT_CACHE_DIR):
+        """
+        This function downloads a video from YouTube, or takes it from the import cache if it was downloaded before
+        :param url: link to a video from YouTube
+        :param working_dir: the directory to place the downloaded audio in
+        :param ydl_factory: a function that receives youtube_dl options and returns a YoutubeDL-like object,
+        youtube_dl.YoutubeDL if None
+        :param cache_dir: the directory of the import cache
+        :return: if url is valid (path to downloaded file, title, thumbnail url), otherwise None
+        """
+        if not Tools.check_url(url):
+            return None
+        if ydl_factory is None:
+            ydl_factory = youtube_dl.YoutubeDL
+        os.makedirs(cache_dir, exist_ok=True)
         try:
-            with youtube_dl.YoutubeDL(ydl_opts) as ydl:
-                ydl.cache.remove()
-                ydl.download([url])
-                info = ydl.extract_info(url, download=False)
-                # https://stackoverflow.com/questions/23727943/how-to-get-information-from-youtube-dl-in-python
-                url_title = info.get("title", None)
-                url_path = working_dir + "/" + url_title + ".mp3"  # according to template
-                url_thumbnail = info.get("thumbnail", None)
-            return url_path, url_title, url_thumbnail
+            key = Tools.import_key(url)
+            info = Tools._cached_import(cache_dir, key) if key else None
+            if info is None:
+                ydl_opts = {
+                    'format': 'bestaudio/best',  # stored as-is (opus, m4a, ...), without re-encoding
+                    'outtmpl': cache_dir + '/%(extractor_key)s-%(id)s.%(ext)s',  # output name template
+                }
+                with ydl_factory(ydl_opts) as ydl:
+                    info = ydl.extract_info(url, download=True)  # a single request for the audio and metadata
+                    key = info["extractor_key"] + "-" + info["id"]
+                    filename = os.path.basename(ydl.prepare_filename(info))
+                info = {"title": info.get("title", None), "thumbnail": info.get("thumbnail", None),
+                        "file": filename}
+                with open(os.path.join(cache_dir, key + ".json"), "w") as f:
+                    json.dump(info, f)
+            url_title = info["title"]
+            ext = os.path.splitext(info["file"])[1]
+            url_path = clone_file(os.path.join(cache_dir, info["file"]), working_dir + "/" + url_title + ext)
+            return url_path, url_title, info["thumbnail"]
         except Exception:
             return -1
 
+    @staticmethod
+    def download_many(urls, working_dir, jobs=4, ydl_factory=None, cache_dir=IMPORT_CACHE_DIR):
+        """
+        This function downloads several videos concurrently
+        :param urls: a list of links to videos
+        :param working_dir: the directory to place the downloaded audio in
+        :param jobs: the maximal number of parallel downloads
+        :param ydl_factory: a function that receives youtube_dl options and returns a YoutubeDL-like object
+        :param cache_dir: the directory of the import cache
+        :return: the list of download_from_youtube results, in the order of urls
+        """
+        unique = list(dict.fromkeys(urls))  # a url given twice is downloaded once
+        results = parallel_map(lambda url: Tools.download_from_youtube(url, working_dir, ydl_factory, cache_dir),
+                               unique, jobs)
+        downloads = dict(zip(unique, results))
+        return [downloads[url] for url in urls]
+
+    @staticmethod
+    def import_key(url):
+        """
+        A method to get the import cache key of a url without any network request
+        :param url: a link to a video
+        :return: "<extractor>-<video id>", or None if the url is not recognised
+        """
+        for ie in gen_extractor_classes():
+            if ie.ie_key() == "Generic" or not ie.suitable(url):
+                continue
+            try:
+                return ie.ie_key() + "-" + ie._match_id(url)
+            except Exception:  # the extractor's url pattern has no video id
+                return None
+        return None
+
+    @staticmethod
+    def _cached_import(cache_dir, key):
+        """
+        A method to read the import cache
+        :param cache_dir: the directory of the import cache
+        :param key: the import cache key
+        :return: the {"title", "thumbnail", "file"} dictionary of the cached import, or None
+        """
+        try:
+            with open(os.path.join(cache_dir, key + ".json")) as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not os.path.exists(os.path.join(cache_dir, info["file"])):
+            return None
+        return info
+
     @staticmethod
     def check_url(url):
         """
@@ -107,22 +240,24 @@ class Tools:
         :param output_path: the output path
         :return: the overlaid audio
         """
-        sound = audio_list[0].get_track()
-        for audio in range(1, len(audio_list)):
-            sound1 = audio_list[audio].get_track()
-            sound2 = sound.overlay(sound1)
-            sound = sound2
+        start = min(audio.get_offset() for audio in audio_list)
+        end = max(audio.get_offset() + len(audio.get_track()) / 1000 for audio in audio_list)
+        sound = AudioSegment.silent((end - start) * 1000, frame_rate=audio_list[0].get_track().frame_rate)
+        for audio in audio_list:  # each audio at its place on the timeline, relative to the earliest one
+            sound = sound.overlay(audio.get_track(), position=(audio.get_offset() - start) * 1000)
         if output_path == '':
             output_path = audio_list[0].get_path() + " overlay.mp3"
-        sound.export(output_path, format="mp3")
-        combined = Remix(output_path, audio_list[0], title=audio_list[0].get_title() + "_overlay")
+        sound.export(output_path, format=Tools.path_format(output_path))
+        combined = Remix(output_path, audio_list[0], title=audio_list[0].get_title() + "_overlay", track=sound)
+        combined.set_offset(start)
         return combined
 
     @staticmethod
     def audio_trim(audiofile: AudioFile, output_path, start_min, start_sec, end_min=None, end_sec=None) -> (
             AudioFile, str):
         """
-        A method to keep the audio slice between start and end
+        A method to keep the audio slice between start and end. The slice stays where it was on the timeline, its
+        offset being the offset of the audio file plus start
         :param audiofile: an AudioFile object
         :param output_path: the output path
         :param start_min: the minute at which the slicing starts
@@ -134,6 +269,7 @@ class Tools:
         if start_min == end_min and start_sec == end_sec:
             return audiofile, output_path
         audio_mins, audio_secs = audiofile.get_duration()
+        start_secs = start_min * 60 + start_sec
         if start_min == 0 and start_sec == 0:
             start_sec += 0.001
         if end_min == audio_mins and end_sec >= audio_secs:
@@ -154,6 +290,7 @@ class Tools:
         extract = sound[start_time:end_time]  # <pydub.audio_segment.AudioSegment object
         extract.export(output_path, format="mp3")
         extract = Remix(output_path, audiofile, title=audiofile.get_title() + "_trim")
+        extract.set_offset(audiofile.get_offset() + start_secs)
         return extract, output_path
 
     @staticmethod
@@ -188,12 +325,13 @@ class Tools:
                 output_path = audio_list[0].get_path() + name + " concat.mp3"
             final_clip.export(output_path, format='mp3')
             final_clip = Remix(output_path, audio_list[0], title=name + "_concat")
+            final_clip.set_offset(next(clip for clip in audio_list if clip is not None).get_offset())
             return final_clip
 
     @staticmethod
     def audio_cut(audiofile: AudioFile, cut_min, cut_sec, outpath) -> (AudioFile, AudioFile):
         """
-        A method to time split an audio file
+        A method to time split an audio file, the two parts staying where they were on the timeline
         :param audiofile: an AudioFile object
         :param cut_min: the minute at which the split occurs
         :param cut_sec: the second at which the split occurs
@@ -218,6 +356,8 @@ class Tools:
     def audio_delete(audiofile: AudioFile, start_min, start_sec, end_min=None, end_sec=None, output_path=''):
         """
         This method cuts off the audio slice between start and end.
+        The audio after the slice moves back to close the gap; when the slice starts the audio, the rest stays where
+        it was on the timeline
         :param audiofile: an AudioFile object
         :param start_min: the minute at which the cut starts
         :param start_sec: the second at which the cut starts
@@ -234,14 +374,16 @@ class Tools:
         elif end_min:
             if start_min > end_min or (start_min == end_min and start_sec > end_sec):
                 raise Exception("Usage: the start must indicate a time previous to the end")
-        new_path1 = audiofile.get_path() + " delete1.mp3"
+        if output_path == '':
+            output_path = audiofile.get_path() + " delete.mp3"
+        new_path1 = os.path.splitext(output_path)[0] + "1.mp3"  # the intermediates are written next to the output
         if start_min == 0 and start_sec == 0:
             audio1 = None
         else:
             audio1, first_path = Tools.audio_trim(audiofile, new_path1, 0, 0, start_min, start_sec)
             audio1.set_title(audiofile.get_title() + "_delete1")
 
-        new_path2 = audiofile.get_path() + " delete2.mp3"
+        new_path2 = os.path.splitext(output_path)[0] + "2.mp3"
         if end_min == audiofile.get_duration()[0] and end_sec >= audiofile.get_duration()[1]:
             audio2 = None
         else:
@@ -250,86 +392,114 @@ class Tools:
                                                    audiofile.get_duration()[1])
             audio2.set_title(audiofile.get_title() + "_delete2")
 
-        if output_path == '':
-            output_path = audiofile.get_path() + " delete.mp3"
-        return Tools.concatenate_audio([audio1, audio2], output_path)
+        try:
+            return Tools.concatenate_audio([audio1, audio2], output_path)
+        finally:  # the two parts are only intermediates of the concatenation
+            for path in [new_path1, new_path2]:
+                if os.path.exists(path):
+                    os.remove(path)
 
     @staticmethod
-    def fade(audiofile: AudioFile, start_fading_secs=3, end_fading_secs=3, output_path=None) -> AudioFile:
+    def fade(audiofile: AudioFile, start_fading_secs=3, end_fading_secs=3, output_path=None,
+             shape="linear") -> AudioFile:
         """
-        A method to fade in an audio file
+        A method to fade in and fade out an audio file
         :param audiofile: an AudioFile object
         :param start_fading_secs: the fading in last
         :param end_fading_secs: the fading out last
-        :param output_path: the output path
+        :param output_path: the output path, whose extension sets the output format
+        :param shape: the curve of the fades, one of remix.envelope.CURVES
         :return: a Remix object that results from the input audiofile fading
         """
-        sound = audiofile.get_track()
-        start_fading = start_fading_secs * 1000
-        end_fading = end_fading_secs * 1000
-        mp3 = sound.fade_in(start_fading).fade_out(end_fading)
-        if output_path == '':
-            output_path = audiofile.get_path() + " fade.mp3"
-        mp3.export(output_path, format='mp3')
-        mp3 = Remix(output_path, audiofile, title=audiofile.get_title() + "_fade")
-        return mp3
+        duration = audiofile.get_duration()[0] * 60 + audiofile.get_duration()[1]
+        envelope = Envelope.fade(duration, start_fading_secs, end_fading_secs, shape)
+        return Tools.apply_envelope(audiofile, envelope, output_path, "fade")
 
     @staticmethod
-    def fadein(audiofile: AudioFile, fading_secs=3, output_path='') -> AudioFile:
+    def fadein(audiofile: AudioFile, fading_secs=3, output_path='', shape="linear") -> AudioFile:
         """
         A method to fade in an audio file
         :param audiofile: an AudioFile object
         :param fading_secs: the fading last
-        :param output_path: the output path
+        :param output_path: the output path, whose extension sets the output format
+        :param shape: the curve of the fade, one of remix.envelope.CURVES
         :return: a Remix object that results from the input audiofile fading
         """
-        sound = audiofile.get_track()
-        start_fading = fading_secs * 1000
-        mp3 = sound.fade_in(start_fading)
-        if output_path == '':
-            output_path = audiofile.get_path() + " fadein.mp3"
-
-        mp3.export(output_path, format='mp3')
-        mp3 = Remix(output_path, audiofile, title=audiofile.get_title() + "_fadein")
-        return mp3
+        duration = audiofile.get_duration()[0] * 60 + audiofile.get_duration()[1]
+        envelope = Envelope.fade(duration, fade_in_secs=fading_secs, shape=shape)
+        return Tools.apply_envelope(audiofile, envelope, output_path, "fadein")
 
     @staticmethod
-    def fadeout(audiofile: AudioFile, fading_secs=3, output_path='') -> AudioFile:
+    def fadeout(audiofile: AudioFile, fading_secs=3, output_path='', shape="linear") -> AudioFile:
         """
         A method to fade out an audio file
         :param audiofile: an AudioFile object
         :param fading_secs: the fading last
-        :param output_path: the output path
+        :param output_path: the output path, whose extension sets the output format
+        :param shape: the curve of the fade, one of remix.envelope.CURVES
         :return: a Remix object that results from the input audiofile fading
         """
+        duration = audiofile.get_duration()[0] * 60 + audiofile.get_duration()[1]
+        envelope = Envelope.fade(duration, fade_out_secs=fading_secs, shape=shape)
+        return Tools.apply_envelope(audiofile, envelope, output_path, "fadeout")
+
+    @staticmethod
+    def automate_volume(audiofile: AudioFile, points, output_path='', shape="linear") -> AudioFile:
+        """
+        A method to change the volume of an audio file over time
+        :param audiofile: an AudioFile object
+        :param points: a list of (seconds, gain in dB) tuples, the volume moving from one point to the next
+        :param output_path: the output path, whose extension sets the output format
+        :param shape: the curve between the points, one of remix.envelope.CURVES
+        :return: a Remix object that results from the input audiofile volume changes
+        """
+        envelope = Envelope([(secs, db_to_gain(db)) for secs, db in points], shape)
+        return Tools.apply_envelope(audiofile, envelope, output_path, "volume")
+
+    @staticmethod
+    def apply_envelope(audiofile: AudioFile, envelope: Envelope, output_path='', suffix="envelope") -> AudioFile:
+        """
+        A method to apply a gain envelope to a whole audio file with one multiplication
+        :param audiofile: an AudioFile object
+        :param envelope: an Envelope object
+        :param output_path: the output path, whose extension sets the output format,
+        next to the input file with the same format if empty
+        :param suffix: the suffix of the default output path and of the title
+        :return: a Remix object that results from the input audiofile gain changes
+        """
         sound = audiofile.get_track()
-        end_fading = fading_secs * 1000
-        mp3 = sound.fade_out(end_fading)
-        if output_path == '':
-            output_path = audiofile.get_path() + " fadeout.mp3"
+        samples = envelope.apply(remix.pcm.segment_to_array(sound), sound.frame_rate)
+        output = remix.pcm.array_to_segment(samples, sound.frame_rate, sound.sample_width)
+        if not output_path:
+            output_path = audiofile.get_path() + " " + suffix + os.path.splitext(audiofile.get_path())[1]
+        output.export(output_path, format=Tools.path_format(output_path))
+        res = Remix(output_path, audiofile, title=audiofile.get_title() + "_" + suffix)
+        res.set_offset(audiofile.get_offset())  # an edit keeps the audio where it is on the timeline
+        return res
 
-        mp3.export(output_path, format='mp3')
-        mp3 = Remix(output_path, audiofile, title=audiofile.get_title() + "_fadeout")
-        return mp3
+    @staticmethod
+    def path_format(path, default="mp3"):
+        """
+        A method to get the ffmpeg format to write a path with, from its extension
+        :param path: a file path
+        :param default: the format of a path without extension
+        :return: the format name (e.g. "ipod" for an m4a file)
+        """
+        return remix.stream.muxer(os.path.splitext(path)[1][1:].lower() or default)
 
     @staticmethod
-    def transform_audio_position(audiofile: AudioFile, transform_secs, output_path='') -> AudioFile:
+    def transform_audio_position(audiofile: AudioFile, transform_secs) -> AudioFile:
         """
-        A method to transform an audio position
+        A method to transform an audio position.
+        The position is kept as the offset of the audio on the project timeline, sharing the decoded audio of the
+        input, so no silence is generated until the audio is exported on its own
         :param audiofile: an AudioFile object
         :param transform_secs: the seconds to add to the audio start
-        :param output_path: the output path
         :return: a Remix object that starts transform_secs after the input AudioFile
         """
-        sound = audiofile.get_track()
-        silence = AudioSegment.silent(transform_secs * 1000)
-        end = (audiofile.get_duration()[0] * 60 + audiofile.get_duration()[1]) * 1000
-        res = silence + sound[:end]
-        if output_path == '':
-            output_path = audiofile.get_path() + " pos_transform.mp3"
-
-        res.export(output_path, format='mp3')
-        res = Remix(output_path, audiofile, title=audiofile.get_title() + "_pos_transform")
+        res = Remix(audiofile.get_path(), audiofile, title=audiofile.get_title() + "_pos_transform",
+                    track=audiofile.get_track())
+        res.set_offset(audiofile.get_offset() + transform_secs)
         return res
 
     @staticmethod
@@ -341,24 +511,75 @@ class Tools:
         :param format: the format of the output audio file
         :return: None
         """
-        if format not in ["mp3", "mp4", "wav", "m4a"]:
+        if format not in EXPORT_FORMATS:
             raise Exception("Wrong format")
         if not os.path.exists(output_path) or not os.path.isdir(output_path):
             raise Exception("Path does not exist")
         outpath = output_path + "/" + audiofile.get_title() + "." + format
         sound = audiofile.get_track()
-        sound.export(outpath, format=format)
+        if audiofile.get_offset() > 0:  # a standalone file starts at the beginning of the project timeline
+            sound = AudioSegment.silent(audiofile.get_offset() * 1000, frame_rate=sound.frame_rate) + sound
+        sound.export(outpath, format=remix.stream.muxer(format))
 
     @staticmethod
-    def duplicate(audiofile):
+    def export_batch(audio_list, output_path, formats, jobs=None, block_secs=10):
+        """
+        A method to export several audio files to several formats at once.
+        The PCM of each audio file is read once and fed to one encoder per format, the encoders running in parallel,
+        and the audio files are spread across a pool of workers
+        :param audio_list: a list of AudioFile objects
+        :param output_path: the output directory
+        :param formats: a list of formats of the output audio files
+        :param jobs: the number of audio files exported in parallel, the number of CPUs if None
+        :param block_secs: the length in seconds of the blocks fed to the encoders
+        :return: the list of exported paths
+        """
+        for format in formats:
+            if format not in EXPORT_FORMATS:
+                raise Exception("Wrong format")
+        if not os.path.exists(output_path) or not os.path.isdir(output_path):
+            raise Exception("Path does not exist")
+
+        job = current_job()  # the workers run outside of the job thread, so they report to it directly
+        done = [0]
+        lock = threading.Lock()
+
+        def export_audio(audiofile):
+            sound = audiofile.get_track()
+            paths = [output_path + "/" + audiofile.get_title() + "." + format for format in formats]
+            encoders = [remix.stream.StreamEncoder(path, sound.frame_rate, sound.channels, format=format)
+                        for path, format in zip(paths, formats)]
+            block_frames = int(block_secs * sound.frame_rate)
+            silence = int(round(audiofile.get_offset() * sound.frame_rate))
+            blocks = itertools.chain(remix.stream.iter_silence_blocks(silence, sound.channels, block_frames),
+                                     remix.stream.iter_segment_blocks(sound, block_frames))
+            try:
+                for block in blocks:
+                    for encoder in encoders:
+                        encoder.write(block)
+            finally:
+                for encoder in encoders:
+                    encoder.close()
+            with lock:
+                done[0] += 1
+                if job is not None:
+                    job.set_progress(done[0] / len(audio_list), "Exported " + audiofile.get_title())
+            return paths
+
+        return [path for paths in parallel_map(export_audio, audio_list, jobs) for path in paths]
+
+    @staticmethod
+    def duplicate(audiofile, output_dir=None, output_path=None):
         """
         A method to duplicate an AudioFile object
         :param audiofile: the AudioFile to duplicate
+        :param output_dir: the directory to write the copy in, the directory of the audio file if None
+        :param output_path: the path of the copy, named after the title in output_dir if None
         :return: the duplicate object
         """
         title = audiofile.get_title() + " duplicate"
-        dir_path = os.path.dirname(audiofile.get_path())
-        path = dir_path + '/' + title + audiofile.get_extension()
+        dir_path = output_dir or os.path.dirname(audiofile.get_path())
+        path = output_path or dir_path + '/' + title + audiofile.get_extension()
         thumb_path = audiofile.get_thumb_path()
 
         shutil.copyfile(audiofile.get_path(), path)
@@ -383,6 +604,7 @@ class Tools:
         dup.set_track(audiofile.get_track())
         dup.set_duration(audiofile.get_duration())
         dup.set_bpm(audiofile.get_bpm())
+        dup.set_offset(audiofile.get_offset())
         return dup
 
     @staticmethod
@@ -435,15 +657,43 @@ class Tools:
         :param speed: the ratio of the speed to apply
         :return: an AudioSegment with the speed changed by the given ratio
         """
-        tmp = tempfile.TemporaryDirectory()
-        audiosegment.export(tmp.name + "/wav_temp_file.wav", format='wav')
-        sound, fs = librosa.load(tmp.name + "/wav_temp_file.wav")
-        new_wav = librosa.effects.time_stretch(sound, rate=speed)
-        wavfile.write(tmp.name + "/speed_wav_temp_file.wav", fs, new_wav)
-        new_new = AudioSegment.from_wav(tmp.name + "/speed_wav_temp_file.wav")
-        new_new.export(output_path, format="mp3")
-        tmp.cleanup()
-        return new_new
+        samples = remix.pcm.segment_to_array(audiosegment)
+        stretched = remix.stretch.time_stretch(samples, speed, audiosegment.frame_rate)
+        new_sound = remix.pcm.array_to_segment(stretched, audiosegment.frame_rate, audiosegment.sample_width)
+        new_sound.export(output_path, format="mp3")
+        return new_sound
+
+    @staticmethod
+    def stream_speed_change(audio, output_path, speed=1.0, block_secs=10, format="mp3", duration=None):
+        """
+        A method to change the speed of a long audio block by block, writing the output as it is produced.
+        Given a path, the file is decoded one block at a time, so the memory does not grow with its length
+        :param audio: an AudioSegment object or the path to an audio file
+        :param output_path: the output path
+        :param speed: the ratio of the speed to apply
+        :param block_secs: the length of each processed block in seconds
+        :param format: the format of the output audio file
+        :param duration: the length of the audio file in seconds, to report the progress when audio is a path
+        :return: output_path
+        """
+        if isinstance(audio, AudioSegment):
+            frame_rate, channels = audio.frame_rate, audio.channels
+            blocks = remix.stream.iter_segment_blocks(audio, int(block_secs * frame_rate))
+        else:
+            frame_rate, channels = remix.stream.probe_format(audio)
+            blocks = remix.stream.iter_file_blocks(audio, int(block_secs * frame_rate), frame_rate, channels)
+        if isinstance(audio, AudioSegment):
+            total = audio.frame_count() / speed
+        else:
+            total = duration * frame_rate / speed if duration else None
+        written = 0
+        with remix.stream.StreamEncoder(output_path, frame_rate, channels, format=format) as encoder:
+            for block in remix.stretch.stream_stretch(blocks, speed, channels, frame_rate):
+                encoder.write(block)
+                written += len(block)
+                if total:
+                    report(written / total, "Changing speed")
+        return output_path
 
     @staticmethod
     def download_image(url: str, output_path: str) -> str:
@@ -468,5 +718,5 @@ class Tools:
         :return: None
         """
         img = Image.open(image_path)
-        img = img.resize((width, height), Image.ANTIALIAS)
+        img = img.resize((width, height), Image.LANCZOS)
         img.save(output_path)
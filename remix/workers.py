@@ -0,0 +1,28 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+
+def default_jobs():
+    """
+    A function to get the default number of parallel workers
+    :return: the number of CPUs of the machine
+    """
+    return os.cpu_count() or 1
+
+
+def parallel_map(func, items, jobs=None, processes=False):
+    """
+    A function to apply a function to every item on a pool of workers
+    :param func: the function to apply (must be picklable if processes is True)
+    :param items: an iterable of arguments
+    :param jobs: the maximal number of parallel workers, the number of CPUs if None
+    :param processes: whether to use worker processes (for pure Python work) instead of threads
+    :return: the list of results, in the order of items
+    """
+    items = list(items)
+    jobs = min(jobs or default_jobs(), len(items))
+    if jobs <= 1:
+        return [func(item) for item in items]
+    executor = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    with executor(max_workers=jobs) as pool:
+        return list(pool.map(func, items))
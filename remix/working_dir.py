@@ -0,0 +1,149 @@
+import os
+import time
+
+DEFAULT_QUOTA_BYTES = 4 * 1024 ** 3
+REGENERABLE_DIRS = ("pcm_cache", "previews")  # artefacts that can be produced again from the project audio
+KEPT_DIRS = ("pretrained_models",)
+
+
+class WorkingDir:
+    """
+    The files of a project's working directory.
+    Files that no audio file of the project references anymore are deleted, and the directory is kept under a disk
+    quota by evicting regenerable artefacts, least recently used first.
+    """
+    def __init__(self, path, quota_bytes=DEFAULT_QUOTA_BYTES, grace_secs=60):
+        """
+        The init method of the class
+        :param path: the path of the working directory
+        :param quota_bytes: the size the directory should be kept under, in bytes
+        :param grace_secs: the age under which unreferenced files are kept, as operations running in the
+        background may not have handed their output to the project yet
+        """
+        self._path = os.path.abspath(path)
+        self._quota_bytes = quota_bytes
+        self._grace_secs = grace_secs
+
+    def get_path(self):
+        """
+        A getter for the path of the working directory
+        :return: the path of the working directory
+        """
+        return self._path
+
+    def get_quota(self):
+        """
+        A getter for the disk quota
+        :return: the quota in bytes
+        """
+        return self._quota_bytes
+
+    def set_quota(self, quota_bytes):
+        """
+        A setter for the disk quota
+        :param quota_bytes: the quota in bytes
+        :return: None
+        """
+        self._quota_bytes = quota_bytes
+
+    def contains(self, path):
+        """
+        A method to check whether a file is inside the working directory
+        :param path: a file path
+        :return: True if the file is inside the working directory
+        """
+        return os.path.abspath(path).startswith(self._path + os.sep)
+
+    def size(self):
+        """
+        A method to get the size of the working directory
+        :return: the size in bytes
+        """
+        return sum(size for _, _, size in self._files())
+
+    def release(self, path, referenced):
+        """
+        A method to delete a file of the working directory that is not referenced anymore
+        :param path: the path of the file
+        :param referenced: the set of the absolute paths the project still references
+        :return: the number of bytes freed
+        """
+        path = os.path.abspath(path)
+        if not self.contains(path) or path in referenced or not os.path.isfile(path):
+            return 0
+        size = os.path.getsize(path)
+        os.remove(path)
+        return size
+
+    def collect(self, referenced):
+        """
+        A method to delete the files of the working directory that are not referenced anymore,
+        except the regenerable artefacts that enforce_quota manages
+        :param referenced: the set of the absolute paths the project still references
+        :return: the number of bytes freed
+        """
+        freed = 0
+        now = time.time()
+        for path, used, size in self._files():
+            if self._top_dir(path) in REGENERABLE_DIRS + KEPT_DIRS or path in referenced:
+                continue
+            try:
+                stat = os.stat(path)  # a copy keeps the time of its source, but its inode changes when it is made
+                if now - max(stat.st_mtime, stat.st_ctime) > self._grace_secs:
+                    os.remove(path)
+                    freed += size
+            except FileNotFoundError:  # removed meanwhile
+                continue
+        for root, dirs, files in os.walk(self._path, topdown=False):
+            top = os.path.relpath(root, self._path).split(os.sep)[0]
+            if root != self._path and top not in REGENERABLE_DIRS + KEPT_DIRS and not os.listdir(root) \
+                    and now - os.stat(root).st_mtime > self._grace_secs:  # an operation may be about to fill it
+                os.rmdir(root)
+        return freed
+
+    def enforce_quota(self, referenced=()):
+        """
+        A method to evict regenerable artefacts, least recently used first, until the directory fits its quota
+        :param referenced: the set of the absolute paths the project still references, e.g. the live preview stems,
+        which are never evicted
+        :return: the number of bytes freed
+        """
+        files = self._files()
+        total = sum(size for _, _, size in files)
+        freed = 0
+        regenerable = sorted((used, path, size) for path, used, size in files
+                             if self._top_dir(path) in REGENERABLE_DIRS and path not in referenced)
+        for _, path, size in regenerable:
+            if total - freed <= self._quota_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            freed += size
+        return freed
+
+    def _top_dir(self, path):
+        """
+        A method to get the directory of the working directory that holds a path
+        :param path: an absolute path inside the working directory
+        :return: the name of the directory, or '' for the files at the top level
+        """
+        parts = os.path.relpath(path, self._path).split(os.sep)
+        return parts[0] if len(parts) > 1 else ""
+
+    def _files(self):
+        """
+        A method to list the files of the working directory
+        :return: a list of (absolute path, last use time, size) tuples
+        """
+        files = []
+        for root, _, names in os.walk(self._path):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:  # removed meanwhile
+                    continue
+                files.append((path, max(stat.st_atime, stat.st_mtime), stat.st_size))
+        return files